@@ -0,0 +1,290 @@
+"""
+Measure latency and throughput of the API endpoints under concurrent load against seeded Postgres history and an
+in-process NBP stub, and save the results as JSON so runs of different versions can be compared.
+
+The configured database is dropped and recreated, so point it at a scratch database (e.g. the test one) and confirm
+with --reset-db. The app is served by uvicorn in a background thread, the NBP API by tests.nbp_stub.
+
+    python -m benchmarks.bench_api --reset-db --years 5 --concurrency 16 --requests 500 --output bench.json
+    python -m benchmarks.bench_api --reset-db --output new.json --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+import httpx
+import numpy as np
+import uvicorn
+
+from tests.nbp_stub import CURRENCIES, NBPStubServer, business_days, synthetic_mid
+from tests.servers import free_port
+
+# NBP table A lists ~33 currencies, the stub's real ones are topped up with synthetic codes
+BENCH_CURRENCIES = {**CURRENCIES, **{f"C{index:02d}": f"waluta C{index:02d}" for index in range(33 - len(CURRENCIES))}}
+FETCH_WINDOW_DAYS = 7
+
+Request = tuple[str, str, dict] | tuple[str, str, dict, list]  # (method, path, query params[, JSON body])
+CONVERT_BATCH_ITEMS = 1000
+
+
+class Scenario:
+    def __init__(self, name: str, requests: Callable[[int], list[Request]], concurrency: int | None = None):
+        self.name = name
+        self.requests = requests  # Builds the given number of requests
+        self.concurrency = concurrency  # Overrides --concurrency, e.g. for fetches bound by upstream rate limits
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed_history(history_start: date, history_end: date) -> tuple[int, float]:
+    """Load synthetic table A history with the bulk COPY path, returns rows and rows/s."""
+    from helpers.ingest import copy_rates
+    from services.db_service import SessionLocal
+
+    records = [
+        (day, currency, code, synthetic_mid(day, code))
+        for day in business_days(history_start, history_end)
+        for code, currency in BENCH_CURRENCIES.items()
+    ]
+    with SessionLocal() as db:
+        started = time.perf_counter()
+        copy_rates(db, records)
+        db.commit()
+        elapsed = time.perf_counter() - started
+    return len(records), len(records) / elapsed
+
+
+def build_scenarios(history_start: date, history_end: date, fetch_concurrency: int, seed: int) -> list[Scenario]:
+    rng = random.Random(seed)
+    days = business_days(history_start, history_end)
+    years = list(range(history_start.year, history_end.year + 1))
+    codes = list(BENCH_CURRENCIES)
+
+    def fetch_windows(count: int) -> list[tuple[date, date]]:
+        """Consecutive windows after the seeded history, so every fetch inserts new rates."""
+        first_day = history_end + timedelta(days=1)
+        return [(first_day + timedelta(days=FETCH_WINDOW_DAYS * index),
+                 first_day + timedelta(days=FETCH_WINDOW_DAYS * index + FETCH_WINDOW_DAYS - 1))
+                for index in range(count)]
+
+    def calendar_day() -> date:
+        """Any day of the seeded history, weekends included, as resolved by as-of lookups."""
+        return history_start + timedelta(days=rng.randrange((history_end - history_start).days + 1))
+
+    return [
+        Scenario("get_currencies", lambda count: [("GET", "/currencies/", {})] * count),
+        Scenario("get_rates_day", lambda count: [
+            ("GET", f"/currencies/{rng.choice(days)}", {}) for _ in range(count)
+        ]),
+        Scenario("get_rates_month", lambda count: [
+            ("GET", f"/currencies/{rng.choice(days).strftime('%Y-%m')}", {}) for _ in range(count)
+        ]),
+        Scenario("get_rates_year_code", lambda count: [
+            ("GET", f"/currencies/{rng.choice(years)}", {"code": rng.choice(codes)}) for _ in range(count)
+        ]),
+        Scenario("get_rates_as_of", lambda count: [
+            ("GET", f"/currencies/asof/{calendar_day()}", {}) for _ in range(count)
+        ]),
+        Scenario("convert_batch", lambda count: [
+            ("POST", "/currencies/convert", {}, {
+                "amounts": [rng.uniform(1, 10_000) for _ in range(CONVERT_BATCH_ITEMS)],
+                "from": [rng.choice(codes) for _ in range(CONVERT_BATCH_ITEMS)],
+                "to": [rng.choice(codes + ["PLN"]) for _ in range(CONVERT_BATCH_ITEMS)],
+                "dates": [str(calendar_day()) for _ in range(CONVERT_BATCH_ITEMS)],
+            }) for _ in range(count)
+        ]),
+        # Rates of one code first, the tables of the same windows then add the other codes
+        Scenario("fetch_rates", lambda count: [
+            ("POST", "/currencies/fetch/rates", {"code": "USD", "date_from": start, "date_to": end})
+            for start, end in fetch_windows(count)
+        ], fetch_concurrency),
+        Scenario("fetch_tables", lambda count: [
+            ("POST", "/currencies/fetch/tables", {"date_from": start, "date_to": end})
+            for start, end in fetch_windows(count)
+        ], fetch_concurrency),
+    ]
+
+
+async def run_scenario(client: httpx.AsyncClient, requests: list[Request], concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    inserted = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(method: str, path: str, params: dict, body: list | None = None) -> None:
+        nonlocal errors, inserted
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, path, params=params, json=body)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors += 1
+        elif path.startswith("/currencies/fetch/"):
+            inserted += response.json().get("inserted", 0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(*request) for request in requests))
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99]).tolist()
+    result = {
+        "requests": len(requests),
+        "errors": errors,
+        "concurrency": concurrency,
+        "requests_per_second": len(requests) / elapsed,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "mean_ms": float(np.mean(latencies) * 1000),
+    }
+    if inserted:
+        result["rows_inserted"] = inserted
+        result["rows_per_second"] = inserted / elapsed
+    return result
+
+
+async def run_load(base_url: str, scenarios: list[Scenario], args: argparse.Namespace) -> dict[str, dict]:
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for scenario in scenarios:
+            if not scenario.name.startswith("fetch_") and args.warmup:
+                await run_scenario(client, scenario.requests(args.warmup), args.concurrency)
+            count = args.fetch_requests if scenario.name.startswith("fetch_") else args.requests
+            results[scenario.name] = await run_scenario(
+                client, scenario.requests(count), scenario.concurrency or args.concurrency
+            )
+            print_result(scenario.name, results[scenario.name])
+    return results
+
+
+def print_result(name: str, result: dict) -> None:
+    rows = f"{result['rows_per_second']:>10.0f}" if "rows_per_second" in result else f"{'':>10}"
+    print(f"{name:>20} {result['requests']:>6} {result['errors']:>6} {result['requests_per_second']:>8.1f} "
+          f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {rows}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print changes against a baseline run, returns whether any endpoint regressed beyond the threshold."""
+    regressed = False
+    print(f"\ncompared with {baseline['meta'].get('git_commit')} ({baseline['meta'].get('timestamp')})")
+    print(f"{'endpoint':>20} {'p95 change':>11} {'req/s change':>13}")
+    for name, result in results["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        p95_change = result["p95_ms"] / before["p95_ms"] - 1
+        rps_change = result["requests_per_second"] / before["requests_per_second"] - 1
+        flag = p95_change > threshold or rps_change < -threshold
+        regressed |= flag
+        print(f"{name:>20} {p95_change:>+10.1%} {rps_change:>+12.1%}{'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reset-db", action="store_true", help="Confirm dropping and recreating the database tables")
+    parser.add_argument("--years", type=int, default=5, help="Years of seeded history")
+    parser.add_argument("--history-end", type=date.fromisoformat, default=date(2024, 12, 31))
+    parser.add_argument("--requests", type=int, default=500, help="Requests per read endpoint")
+    parser.add_argument("--fetch-requests", type=int, default=40, help="Requests per fetch endpoint, each of a new window")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fetch-concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each read endpoint")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Seconds added to every NBP stub response")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the in-process rate range cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change reported as a regression")
+    args = parser.parse_args()
+
+    if not args.reset_db:
+        parser.error("the benchmark drops all tables of the configured database, confirm with --reset-db")
+    last_fetch_day = args.history_end + timedelta(days=FETCH_WINDOW_DAYS * args.fetch_requests)
+    if last_fetch_day > date.today():
+        parser.error(f"fetch windows would end in the future ({last_fetch_day}), lower --history-end")
+
+    from helpers.cache import rates_cache
+    from helpers.snapshot import rate_snapshot
+    from main import app
+    from services import scheduler_service
+    from services.db_service import Base, engine
+    from services.nbp_service import NBPClient, get_nbp_client
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    scheduler_service.SCHEDULER_ENABLED = False
+    rate_snapshot.directory = ""
+    if args.no_cache:
+        rates_cache.max_entries = 0
+
+    history_start = date(args.history_end.year - args.years + 1, 1, 1)
+    stub = NBPStubServer(last_date=last_fetch_day, latency=args.stub_latency, currencies=BENCH_CURRENCIES).start()
+    app.dependency_overrides[get_nbp_client] = lambda: nbp
+    nbp = NBPClient(base_url=stub.url, cache_dir="")
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    try:
+        seeded_rows, seed_rows_per_second = seed_history(history_start, args.history_end)
+        print(f"seeded {seeded_rows} rows ({history_start}..{args.history_end}) at {seed_rows_per_second:.0f} rows/s")
+
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        print(f"{'endpoint':>20} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'rows/s':>10}")
+        scenarios = build_scenarios(history_start, args.history_end, args.fetch_concurrency, args.seed)
+        endpoints = asyncio.run(run_load(f"http://127.0.0.1:{port}", scenarios, args))
+    finally:
+        server.should_exit = True
+        if thread.is_alive():
+            thread.join()
+        stub.stop()
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "years": args.years,
+            "history": [history_start.isoformat(), args.history_end.isoformat()],
+            "codes": len(BENCH_CURRENCIES),
+            "concurrency": args.concurrency,
+            "fetch_concurrency": args.fetch_concurrency,
+            "stub_latency": args.stub_latency,
+            "rates_cache": not args.no_cache,
+        },
+        "ingest": {"seed_rows": seeded_rows, "seed_rows_per_second": seed_rows_per_second},
+        "endpoints": endpoints,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            if compare(results, json.load(file), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measure bootstrapping the rates history from NBP table A archive CSVs with the offline importer: synthetic yearly
+archives of ~33 codes are written to a temporary directory and loaded into the configured database, then loaded again
+to measure the skipping of stored rates.
+
+The configured database is dropped and recreated, so point it at a scratch database (e.g. the test one) and confirm
+with --reset-db.
+
+    python -m benchmarks.bench_archive --reset-db --years 20 --jobs 4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date
+
+from tests.nbp_stub import CURRENCIES, archive_csv
+
+# NBP table A lists ~33 currencies, archive headers only hold alphabetic ISO codes
+ARCHIVE_CURRENCIES = {**CURRENCIES, **{f"Q{chr(65 + index)}{chr(65 + index)}": f"waluta Q{chr(65 + index)}"
+                                       for index in range(33 - len(CURRENCIES))}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reset-db", action="store_true", help="Confirm dropping and recreating the database tables")
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4], help="Files loaded concurrently, per run")
+    args = parser.parse_args()
+    if not args.reset_db:
+        parser.error("the benchmark drops all tables of the configured database, confirm with --reset-db")
+
+    from helpers.snapshot import rate_snapshot
+    from import_archive import import_files
+    from migrate import migrate
+    from services.db_service import Base, engine
+
+    rate_snapshot.directory = ""
+    last_year = date.today().year - 1
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for year in range(last_year - args.years + 1, last_year + 1):
+            paths.append(os.path.join(directory, f"archiwum_tab_a_{year}.csv"))
+            with open(paths[-1], "wb") as file:
+                file.write(archive_csv(year, ARCHIVE_CURRENCIES))
+        size = sum(os.path.getsize(path) for path in paths)
+        print(f"{len(paths)} archives, {size / 2 ** 20:.1f} MiB, {len(ARCHIVE_CURRENCIES)} codes")
+        print(f"{'jobs':>5} {'load s':>8} {'rates':>8} {'rates/s':>9} {'reload s':>9} {'skipped':>8}")
+        try:
+            for jobs in args.jobs:
+                Base.metadata.drop_all(bind=engine)
+                migrate()
+                started = time.perf_counter()
+                results = asyncio.run(import_files(paths, jobs=jobs, verbose=False))
+                load_seconds = time.perf_counter() - started
+                started = time.perf_counter()
+                reloaded = asyncio.run(import_files(paths, jobs=jobs, verbose=False))
+                reload_seconds = time.perf_counter() - started
+
+                inserted = sum(result.inserted for result in results)
+                print(f"{jobs:>5} {load_seconds:>8.2f} {inserted:>8} {inserted / load_seconds:>9.0f} "
+                      f"{reload_seconds:>9.2f} {sum(result.skipped for result in reloaded):>8}")
+        finally:
+            Base.metadata.drop_all(bind=engine)
+            migrate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Measure how fast server-sent events reach open dashboards: clients stream GET /currencies/events from the production
+server (python -m serve) while daily tables are imported, the latency of every delta is the time from sending the
+import to its arrival at every client, whichever worker serves it.
+
+The configured database is dropped and recreated, so point it at a scratch database (e.g. the test one) and confirm
+with --reset-db.
+
+    python -m benchmarks.bench_events --reset-db --workers 2 --clients 200 --imports 20
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from datetime import date
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_archive import ARCHIVE_CURRENCIES
+from tests.nbp_stub import archive_csv, business_days
+from tests.servers import free_port
+
+
+def start_server(port: int, workers: int, env: dict) -> subprocess.Popen:
+    """Launch the server and wait until it answers, the database may still be empty."""
+    server = subprocess.Popen([sys.executable, "-m", "serve", "--port", str(port), "--workers", str(workers),
+                               "--log-level", "warning"], env=env)
+    while True:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats/events")
+            return server
+        except httpx.TransportError:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}")
+            time.sleep(0.05)
+
+
+async def follow(client: httpx.AsyncClient, url: str, ready: asyncio.Event, arrivals: list[float],
+                 expected: int) -> None:
+    """Stream events until `expected` deltas arrived, recording the arrival time of each."""
+    async with client.stream("GET", url) as response:
+        lines = response.aiter_lines()
+        await anext(lines)  # The retry advice, the stream is subscribed
+        ready.set()
+        async for line in lines:
+            if line == "event: rates":
+                arrivals.append(time.perf_counter())
+                if len(arrivals) == expected:
+                    return
+
+
+async def run(base_url: str, clients: int, imports: list[bytes]) -> tuple[np.ndarray, float]:
+    """Latencies of every delta at every client, in seconds, and the seconds of all imports."""
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        ready = [asyncio.Event() for _ in range(clients)]
+        arrivals = [[] for _ in range(clients)]
+        followers = [asyncio.create_task(follow(client, "/currencies/events", ready[index], arrivals[index],
+                                                len(imports))) for index in range(clients)]
+        await asyncio.gather(*(event.wait() for event in ready))
+
+        sent, started = [], time.perf_counter()
+        for body in imports:
+            sent.append(time.perf_counter())
+            (await client.post("/currencies/import/archive", content=body)).raise_for_status()
+            await asyncio.sleep(0.05)  # Deltas arrive in order, each is timed from its own import
+        import_seconds = time.perf_counter() - started
+        await asyncio.wait_for(asyncio.gather(*followers), 60)
+    return np.array([[arrival - sent_at for arrival, sent_at in zip(times, sent)] for times in arrivals]), \
+        import_seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reset-db", action="store_true", help="Confirm dropping and recreating the database tables")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--clients", type=int, default=100, help="Open event streams")
+    parser.add_argument("--imports", type=int, default=10, help="Daily tables imported, one delta each")
+    args = parser.parse_args()
+    if not args.reset_db:
+        parser.error("the benchmark drops all tables of the configured database, confirm with --reset-db")
+
+    from helpers.snapshot import rate_snapshot
+    from migrate import migrate
+    from services.db_service import Base, engine
+
+    rate_snapshot.directory = ""
+    env = {**os.environ, "SCHEDULER_ENABLED": "false", "NBP_CACHE_DIR": "", "SNAPSHOT_DIR": ""}
+    last_year = date.today().year - 1
+    days = business_days(date(last_year, 1, 1), date(last_year, 12, 31))[:args.imports]
+    imports = [archive_csv(last_year, ARCHIVE_CURRENCIES, last_date=day) for day in days]  # Only the day is new
+
+    print(f"{'workers':>7} {'clients':>7} {'deltas':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'imports s':>9}")
+    for workers in args.workers:
+        Base.metadata.drop_all(bind=engine)
+        migrate()
+        port = free_port()
+        server = start_server(port, workers, env)
+        try:
+            latencies, import_seconds = asyncio.run(run(f"http://127.0.0.1:{port}", args.clients, imports))
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+        print(f"{workers:>7} {args.clients:>7} {latencies.size:>6} {np.percentile(latencies, 50) * 1000:>8.1f} "
+              f"{np.percentile(latencies, 95) * 1000:>8.1f} {latencies.max() * 1000:>8.1f} {import_seconds:>9.2f}")
+    Base.metadata.drop_all(bind=engine)
+    migrate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare the ORM ingestion path (one Rate instance per row, db.add_all) with the COPY based bulk path.
+
+Every run happens inside a transaction that is rolled back afterwards, so the target database is left untouched.
+
+    python -m benchmarks.bench_ingest --rows 10000 100000 1000000
+"""
+import argparse
+import time
+from datetime import date, timedelta
+from typing import Iterator
+
+from helpers.ingest import copy_rates
+from helpers.services import RateRecord
+from models import Currency, Rate
+from models.rate import MID_SCALE
+from services.db_service import Base, SessionLocal, engine
+
+CODES = [f"C{index:02d}" for index in range(33)]  # ~33 currencies per NBP table A
+
+
+def synthetic_records(rows: int) -> Iterator[RateRecord]:
+    """Yield unique (update_date, currency, code, mid) records, one table of all codes per day."""
+    start_date = date(1900, 1, 1)
+    for index in range(rows):
+        day, code = divmod(index, len(CODES))
+        yield start_date + timedelta(days=day), f"waluta {CODES[code]}", CODES[code], 1 + index % 1000 / 1000
+
+
+def ingest_orm(rows: int) -> float:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        currencies = {code: Currency(code=code, currency=f"waluta {code}") for code in CODES}
+        db.add_all(currencies.values())
+        db.flush()
+        db.add_all([
+            Rate(update_date=update_date, currency_id=currencies[code].id, mid_scaled=round(mid * MID_SCALE))
+            for update_date, currency, code, mid in synthetic_records(rows)
+        ])
+        db.flush()
+        return time.perf_counter() - started
+    finally:
+        db.rollback()
+        db.close()
+
+
+def ingest_copy(rows: int) -> float:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = copy_rates(db, synthetic_records(rows))
+        elapsed = time.perf_counter() - started
+        assert result.inserted == rows, result
+        return elapsed
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--orm-limit", type=int, default=1_000_000, help="Skip the ORM path above this row count")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    print(f"{'rows':>10} {'path':>6} {'seconds':>10} {'rows/s':>12}")
+    for rows in args.rows:
+        for name, ingest in (("orm", ingest_orm), ("copy", ingest_copy)):
+            if name == "orm" and rows > args.orm_limit:
+                continue
+            elapsed = ingest(rows)
+            print(f"{rows:>10} {name:>6} {elapsed:>10.3f} {rows / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
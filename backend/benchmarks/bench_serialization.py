@@ -0,0 +1,95 @@
+"""
+Compare serializing a GET /currencies/{request_date} range response through response_model validation with the lean
+tuple path and the columnar format.
+
+Rates are seeded in a transaction that is rolled back afterwards, so the target database is left untouched.
+
+    python -m benchmarks.bench_serialization --days 250 --repeat 20
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+from helpers import serializers
+from helpers.ingest import copy_rates
+from models import Currency, Rate
+from schemas import RateResponseSchema
+from services.db_service import Base, SessionLocal, engine
+
+CODES = [f"C{index:02d}" for index in range(33)]
+START_DATE = date(1990, 1, 1)
+
+response_adapter = TypeAdapter(list[RateResponseSchema])
+
+
+def validated_response_model(db: Session, end_date: date) -> bytes:
+    """Previous path: response_model validation of every row, jsonable_encoder and json.dumps."""
+    rates = select_rows(db, end_date)
+    validated = response_adapter.validate_python(rates, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False).encode()
+
+
+def select_rows(db: Session, end_date: date) -> list:
+    return db.query(Rate.update_date, Currency.currency, Currency.code, Rate.mid).join(Currency).filter(
+        Rate.update_date.between(START_DATE, end_date)
+    ).order_by(Rate.update_date).all()
+
+
+def lean_rows(db: Session, end_date: date) -> bytes:
+    return serializers.rates_to_json(select_rows(db, end_date))
+
+
+def lean_columnar(db: Session, end_date: date) -> bytes:
+    return serializers.rates_to_columnar_json(select_rows(db, end_date))
+
+
+def measure(path: Callable[[Session, date], bytes], db: Session, end_date: date, repeat: int) -> tuple[float, int, int]:
+    timings = []
+    for _ in range(repeat):
+        db.expunge_all()  # Each request starts with an empty identity map
+        started = time.perf_counter()
+        body = path(db, end_date)
+        timings.append(time.perf_counter() - started)
+
+    db.expunge_all()
+    tracemalloc.start()
+    path(db, end_date)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, len(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=250, help="Business days in the range, 250 days ~ 8k rows")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        days = [START_DATE + timedelta(days=day) for day in range(args.days)]
+        copy_rates(db, ((day, f"waluta {code}", code, 4.1234) for day in days for code in CODES))
+        rows = args.days * len(CODES)
+
+        print(f"{rows} rows")
+        print(f"{'path':>20} {'median ms':>10} {'peak MiB':>10} {'body KiB':>10}")
+        for name, path in (("response_model", validated_response_model), ("lean rows", lean_rows),
+                           ("lean columnar", lean_columnar)):
+            elapsed, peak, size = measure(path, db, days[-1], args.repeat)
+            print(f"{name:>20} {elapsed * 1000:>10.1f} {peak / 2 ** 20:>10.1f} {size / 2 ** 10:>10.0f}")
+    finally:
+        db.rollback()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
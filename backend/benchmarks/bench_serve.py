@@ -0,0 +1,133 @@
+"""
+Measure migration time, cold start and read throughput of the production server (python -m serve) with different
+numbers of workers, against seeded Postgres history.
+
+The configured database is dropped and recreated, so point it at a scratch database (e.g. the test one) and confirm
+with --reset-db. Cold start is the time from launching the server to its first successful response, the import of
+the app is timed separately. Throughput only scales with workers up to the CPUs free next to Postgres and the client.
+
+    python -m benchmarks.bench_serve --reset-db --workers 1 4 --requests 1000 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+import httpx
+
+from benchmarks.bench_api import build_scenarios, git_commit, run_load, seed_history
+from tests.servers import free_port
+
+READ_SCENARIOS = ("get_rates_day", "get_rates_month", "get_rates_as_of", "convert_batch")
+
+
+def time_import() -> float:
+    """Seconds to import the app in a fresh interpreter."""
+    return float(subprocess.run(
+        [sys.executable, "-c", "import time; started = time.perf_counter(); import main; "
+                               "print(time.perf_counter() - started)"],
+        capture_output=True, text=True, check=True,
+    ).stdout)
+
+
+def start_server(port: int, workers: int, env: dict) -> tuple[subprocess.Popen, float]:
+    """Launch the server and wait for its first successful response, returns it and the seconds that took."""
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "serve", "--port", str(port), "--workers", str(workers),
+                               "--log-level", "warning"], env=env)
+    while True:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/currencies/").status_code == 200:
+                return server, time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}")
+        time.sleep(0.01)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reset-db", action="store_true", help="Confirm dropping and recreating the database tables")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--years", type=int, default=5, help="Years of seeded history")
+    parser.add_argument("--history-end", type=date.fromisoformat, default=date(2024, 12, 31))
+    parser.add_argument("--requests", type=int, default=500, help="Requests per read endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each read endpoint")
+    parser.add_argument("--snapshot", action="store_true", help="Serve with the rate snapshot in a temporary dir")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+    args.fetch_requests = 0
+    if not args.reset_db:
+        parser.error("the benchmark drops all tables of the configured database, confirm with --reset-db")
+
+    from helpers.snapshot import rate_snapshot
+    from migrate import migrate
+    from services.db_service import Base, engine
+
+    snapshot_dir = tempfile.mkdtemp(prefix="bench-snapshot-") if args.snapshot else ""
+    env = {**os.environ, "SCHEDULER_ENABLED": "false", "NBP_CACHE_DIR": "", "SNAPSHOT_DIR": snapshot_dir}
+    history_start = date(args.history_end.year - args.years + 1, 1, 1)
+    Base.metadata.drop_all(bind=engine)
+    try:
+        rate_snapshot.directory = ""
+        migrate()
+        seeded_rows, _ = seed_history(history_start, args.history_end)
+        rate_snapshot.directory = snapshot_dir  # Migrating a deployment with history builds the snapshot
+        started = time.perf_counter()
+        migrate()
+        migrate_seconds = time.perf_counter() - started
+        rate_snapshot.directory = ""
+        import_seconds = time_import()
+        print(f"seeded {seeded_rows} rows, migrate {migrate_seconds:.2f}s, app import {import_seconds:.2f}s")
+
+        runs = {}
+        for workers in args.workers:
+            port = free_port()
+            server, cold_start = start_server(port, workers, env)
+            try:
+                print(f"\n{workers} worker(s), first response after {cold_start:.2f}s")
+                print(f"{'endpoint':>20} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                      f"{'p99 ms':>8}")
+                scenarios = [scenario for scenario in build_scenarios(history_start, args.history_end, 1, args.seed)
+                             if scenario.name in READ_SCENARIOS]
+                endpoints = asyncio.run(run_load(f"http://127.0.0.1:{port}", scenarios, args))
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait()
+            runs[workers] = {"cold_start_seconds": cold_start, "endpoints": endpoints}
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        migrate()
+        if snapshot_dir:
+            shutil.rmtree(snapshot_dir)
+
+    baseline = runs[args.workers[0]]["endpoints"]
+    print(f"\n{'req/s':>20}" + "".join(f" {f'{workers} worker(s)':>12}" for workers in runs) + f" {'speedup':>8}")
+    for name in READ_SCENARIOS:
+        rates = [run["endpoints"][name]["requests_per_second"] for run in runs.values()]
+        print(f"{name:>20}" + "".join(f" {rate:>12.1f}" for rate in rates)
+              + f" {rates[-1] / baseline[name]['requests_per_second']:>7.2f}x")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "meta": {"git_commit": git_commit(), "cpus": os.cpu_count(), "years": args.years,
+                         "concurrency": args.concurrency, "snapshot": args.snapshot},
+                "migrate_seconds": migrate_seconds,
+                "import_seconds": import_seconds,
+                "workers": runs,
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
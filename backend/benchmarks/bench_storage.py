@@ -0,0 +1,171 @@
+"""
+Compare table and index size and range scan latency of the previous rates layout (names and codes in every row,
+float mids, single-column indexes) with the compact one, plain and partitioned by year.
+
+The layouts are built in a separate bench_storage schema of the configured database, which is dropped afterwards.
+
+    python -m benchmarks.bench_storage --years 20 --codes 33 --repeat 20
+"""
+import argparse
+import statistics
+import time
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from services.db_service import engine
+from tests.nbp_stub import CURRENCIES
+
+SCHEMA = "bench_storage"
+
+LAYOUTS_SQL = {
+    "previous": """
+        CREATE TABLE rates_previous (
+            id SERIAL PRIMARY KEY,
+            update_date DATE NOT NULL,
+            currency VARCHAR NOT NULL,
+            code VARCHAR NOT NULL,
+            mid DOUBLE PRECISION NOT NULL
+        );
+        CREATE INDEX ON rates_previous (currency);
+        CREATE INDEX ON rates_previous (code);
+        CREATE UNIQUE INDEX ON rates_previous (update_date, code);
+        INSERT INTO rates_previous (update_date, currency, code, mid)
+        SELECT d.day, c.currency, c.code, round((1 + c.id / 10.0 + random() / 10)::NUMERIC, 4)
+        FROM generate_series(CAST(:date_from AS DATE), CAST(:date_to AS DATE), INTERVAL '1 day') AS d(day)
+        CROSS JOIN currencies c
+        WHERE extract(ISODOW FROM d.day) < 6
+        ORDER BY d.day, c.code;
+    """,
+    "compact": """
+        CREATE TABLE rates_compact (
+            update_date DATE NOT NULL,
+            currency_id SMALLINT NOT NULL REFERENCES currencies (id),
+            mid_micros INTEGER NOT NULL,
+            PRIMARY KEY (update_date, currency_id)
+        );
+        INSERT INTO rates_compact
+        SELECT r.update_date, c.id, round(r.mid * 1000000)::INTEGER
+        FROM rates_previous r JOIN currencies c ON c.code = r.code
+        ORDER BY r.update_date, c.id;
+    """,
+    "partitioned": """
+        CREATE TABLE rates_partitioned (
+            update_date DATE NOT NULL,
+            currency_id SMALLINT NOT NULL REFERENCES currencies (id),
+            mid_micros INTEGER NOT NULL,
+            PRIMARY KEY (update_date, currency_id)
+        ) PARTITION BY RANGE (update_date);
+        DO $$
+        BEGIN
+            FOR year IN (SELECT extract(YEAR FROM min(update_date))::INTEGER FROM rates_compact)
+                     ..(SELECT extract(YEAR FROM max(update_date))::INTEGER FROM rates_compact) LOOP
+                EXECUTE format('CREATE TABLE rates_partitioned_%s PARTITION OF rates_partitioned '
+                               'FOR VALUES FROM (%L) TO (%L)', year, make_date(year, 1, 1), make_date(year + 1, 1, 1));
+            END LOOP;
+        END
+        $$;
+        INSERT INTO rates_partitioned SELECT * FROM rates_compact ORDER BY update_date, currency_id;
+    """,
+}
+
+# Queries of the API read paths, {table} is the layout's table
+PREVIOUS_QUERIES = {
+    "month_all_codes": """
+        SELECT update_date, currency, code, mid FROM {table}
+        WHERE update_date BETWEEN :month_from AND :month_to ORDER BY update_date, code
+    """,
+    "year_one_code": """
+        SELECT update_date, currency, code, mid FROM {table}
+        WHERE update_date BETWEEN :year_from AND :year_to AND code = :code ORDER BY update_date
+    """,
+    "history_avg_by_code": "SELECT code, avg(mid) FROM {table} GROUP BY code",
+}
+COMPACT_QUERIES = {
+    "month_all_codes": """
+        SELECT r.update_date, c.currency, c.code, r.mid_micros::FLOAT8 / 1000000 FROM {table} r
+        JOIN currencies c ON c.id = r.currency_id
+        WHERE r.update_date BETWEEN :month_from AND :month_to ORDER BY r.update_date, c.code
+    """,
+    "year_one_code": """
+        SELECT r.update_date, c.currency, c.code, r.mid_micros::FLOAT8 / 1000000 FROM {table} r
+        JOIN currencies c ON c.id = r.currency_id
+        WHERE r.update_date BETWEEN :year_from AND :year_to AND c.code = :code ORDER BY r.update_date
+    """,
+    "history_avg_by_code": """
+        SELECT c.code, sum(r.mid_micros)::FLOAT8 / count(*) / 1000000 FROM {table} r
+        JOIN currencies c ON c.id = r.currency_id GROUP BY c.code
+    """,
+}
+
+
+def relation_bytes(connection: Connection, table: str) -> tuple[int, int]:
+    """Heap and index bytes of a table, summed over its partitions."""
+    return connection.execute(text("""
+        SELECT coalesce(sum(pg_table_size(relid)), 0), coalesce(sum(pg_indexes_size(relid)), 0)
+        FROM (SELECT CAST(:table AS REGCLASS) AS relid UNION SELECT relid FROM pg_partition_tree(:table)) AS tree
+    """), {"table": f"{SCHEMA}.{table}"}).one()
+
+
+def time_query(connection: Connection, query: str, params: dict, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        connection.execute(text(query), params).all()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--codes", type=int, default=33, help="Currencies per day, ~33 in NBP table A")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    last_year = date.today().year - 1
+    date_from, date_to = date(last_year - args.years + 1, 1, 1), date(last_year, 12, 31)
+    currencies = list(CURRENCIES.items()) + [(f"C{index:02d}", f"waluta C{index:02d}")
+                                             for index in range(max(args.codes - len(CURRENCIES), 0))]
+    params = {
+        "month_from": date(last_year, 6, 1), "month_to": date(last_year, 6, 30),
+        "year_from": date(last_year, 1, 1), "year_to": date(last_year, 12, 31), "code": "USD",
+    }
+
+    with engine.connect() as connection:
+        try:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}"))
+            connection.execute(text(f"SET search_path TO {SCHEMA}"))
+            connection.execute(text("SELECT setseed(0)"))
+            connection.execute(text("CREATE TABLE currencies (id SMALLINT PRIMARY KEY, code VARCHAR, currency TEXT)"))
+            connection.execute(text("INSERT INTO currencies VALUES (:id, :code, :currency)"), [
+                {"id": index, "code": code, "currency": currency}
+                for index, (code, currency) in enumerate(currencies[:args.codes], start=1)
+            ])
+            for layout_sql in LAYOUTS_SQL.values():
+                connection.execute(text(layout_sql), {"date_from": date_from, "date_to": date_to})
+            connection.commit()
+            connection.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM ANALYZE"))
+
+            rows = connection.scalar(text("SELECT count(*) FROM rates_previous"))
+            print(f"{rows} rows ({date_from}..{date_to}, {args.codes} codes)")
+            print(f"{'layout':>12} {'table MiB':>10} {'index MiB':>10} {'B/row':>7}", end="")
+            print("".join(f" {name + ' ms':>22}" for name in PREVIOUS_QUERIES))
+            for layout, queries in (("previous", PREVIOUS_QUERIES), ("compact", COMPACT_QUERIES),
+                                    ("partitioned", COMPACT_QUERIES)):
+                table = f"rates_{layout}"
+                heap, indexes = relation_bytes(connection, table)
+                timings = [time_query(connection, query.format(table=table), params, args.repeat)
+                           for query in queries.values()]
+                size = f"{heap / 2 ** 20:>10.1f} {indexes / 2 ** 20:>10.1f} {(heap + indexes) / rows:>7.1f}"
+                print(f"{layout:>12} {size}", end="")
+                print("".join(f" {timing * 1000:>22.2f}" for timing in timings))
+        finally:
+            connection.rollback()
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            connection.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+from datetime import date
+from typing import Iterable
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.rate import MID_SCALE
+
+AGGREGATE_PERIODS = {"month": 1, "quarter": 3, "year": 12}  # Period length in months
+AGGREGATES_LOCK_KEY = 4_621_004  # Advisory lock id, next to the migration's
+
+REFRESH_AGGREGATES_SQL = text(f"""
+    INSERT INTO rate_aggregates (period, period_start, code, avg_mid, min_mid, max_mid, first_mid, last_mid,
+                                 observations)
+    SELECT CAST(:period AS VARCHAR), date_trunc(CAST(:period AS TEXT), r.update_date)::date, c.code,
+           sum(r.mid_scaled)::float8 / count(*) / {MID_SCALE}, min(r.mid_scaled)::float8 / {MID_SCALE},
+           max(r.mid_scaled)::float8 / {MID_SCALE},
+           (array_agg(r.mid_scaled ORDER BY r.update_date))[1]::float8 / {MID_SCALE},
+           (array_agg(r.mid_scaled ORDER BY r.update_date DESC))[1]::float8 / {MID_SCALE}, count(*)
+    FROM rates r
+    JOIN currencies c ON c.id = r.currency_id
+    WHERE r.update_date >= :date_from AND r.update_date < :date_to AND c.code = ANY(:codes)
+    GROUP BY 2, 3
+    ON CONFLICT (period, period_start, code) DO UPDATE SET
+        avg_mid = EXCLUDED.avg_mid, min_mid = EXCLUDED.min_mid, max_mid = EXCLUDED.max_mid,
+        first_mid = EXCLUDED.first_mid, last_mid = EXCLUDED.last_mid, observations = EXCLUDED.observations
+""")
+
+
+def period_start(period: str, day: date) -> date:
+    """First day of the month, quarter or year containing the day."""
+    months = AGGREGATE_PERIODS[period]
+    return date(day.year, (day.month - 1) // months * months + 1, 1)
+
+
+async def refresh_aggregates(db: AsyncSession, date_from: date, date_to: date, codes: Iterable[str]) -> None:
+    """
+    Recompute aggregates of every period touched by date_from..date_to for the given codes, from the rates of these
+    periods only. Runs inside the session transaction, so aggregates are committed together with the rates.
+
+    Concurrent ingests take turns from here until their commit: every refresh statement runs after the lock was
+    granted, so its snapshot holds the rates of ingests committed before and no aggregate is overwritten with values
+    computed without them.
+    """
+    await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": AGGREGATES_LOCK_KEY})
+    for period, months in AGGREGATE_PERIODS.items():
+        await db.execute(REFRESH_AGGREGATES_SQL, {
+            "period": period,
+            "date_from": period_start(period, date_from),
+            "date_to": period_start(period, date_to) + relativedelta(months=months),
+            "codes": list(codes),
+        })
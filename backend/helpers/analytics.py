@@ -0,0 +1,129 @@
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Currency, Rate
+
+BASE_CODE = "PLN"  # NBP mids are PLN prices, so PLN itself is a constant 1.0 series
+
+
+class RateMatrix(NamedTuple):
+    dates: np.ndarray  # datetime64[D], sorted
+    codes: list[str]  # sorted
+    mids: np.ndarray  # float64 of shape (dates, codes), NaN where a code has no rate for the date
+
+    def column(self, code: str) -> np.ndarray:
+        if code == BASE_CODE:
+            return np.ones(len(self.dates))
+        return self.mids[:, self.codes.index(code)]
+
+
+def build_rate_matrix(update_dates: np.ndarray, codes: np.ndarray, mids: np.ndarray) -> RateMatrix:
+    """Pivot parallel (date, code, mid) arrays into a dense date x code matrix."""
+    unique_dates, date_index = np.unique(update_dates, return_inverse=True)
+    unique_codes, code_index = np.unique(codes, return_inverse=True)
+    matrix = np.full((len(unique_dates), len(unique_codes)), np.nan)
+    matrix[date_index, code_index] = mids
+    return RateMatrix(unique_dates, unique_codes.tolist(), matrix)
+
+
+async def load_rate_matrix(db: AsyncSession, start_date: date, end_date: date,
+                           codes: list[str] | None = None) -> RateMatrix:
+    """Load rates of a period into a date x code matrix."""
+    query = select(Rate.update_date, Currency.code, Rate.mid).join(Currency).where(
+        Rate.update_date.between(start_date, end_date)
+    )
+    if codes:
+        query = query.where(Currency.code.in_(codes))
+
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return RateMatrix(np.array([], dtype="datetime64[D]"), [], np.empty((0, 0)))
+
+    update_dates, row_codes, mids = zip(*rows)
+    return build_rate_matrix(
+        np.array(update_dates, dtype="datetime64[D]"), np.array(row_codes), np.array(mids, dtype=np.float64)
+    )
+
+
+def forward_fill(mids: np.ndarray) -> np.ndarray:
+    """Carry the last known value of every column over missing (NaN) rows. Leading NaNs are kept."""
+    rows = np.arange(len(mids))[:, None]
+    last_valid = np.maximum.accumulate(np.where(np.isnan(mids), 0, rows), axis=0)
+    return mids[last_valid, np.arange(mids.shape[1])]
+
+
+def log_returns(mids: np.ndarray) -> np.ndarray:
+    """Daily log returns of every column, the first row is NaN."""
+    returns = np.full(mids.shape, np.nan)
+    returns[1:] = np.diff(np.log(forward_fill(mids)), axis=0)
+    return returns
+
+
+def rolling_mean_std(mids: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling mean and sample standard deviation over the last `window` observations of every column, computed from
+    cumulative sums. Rows without a full window of observations are NaN.
+    """
+    valid = ~np.isnan(mids)
+    values = np.where(valid, mids, 0.0)
+
+    def window_sums(array: np.ndarray) -> np.ndarray:
+        cumulative = np.concatenate([np.zeros((1, array.shape[1])), np.cumsum(array, axis=0)])
+        return cumulative[window:] - cumulative[:-window]
+
+    mean = np.full(mids.shape, np.nan)
+    std = np.full(mids.shape, np.nan)
+    if window < 2 or len(mids) < window:
+        return mean, std
+
+    counts, sums, squares = window_sums(valid.astype(np.float64)), window_sums(values), window_sums(values ** 2)
+    full = counts == window
+    window_mean = sums / window
+    variance = np.maximum(squares - window * window_mean ** 2, 0.0) / (window - 1)
+    mean[window - 1:] = np.where(full, window_mean, np.nan)
+    std[window - 1:] = np.where(full, np.sqrt(variance), np.nan)
+    return mean, std
+
+
+def summary(mids: np.ndarray) -> dict[str, np.ndarray]:
+    """Per column statistics: observations, first, last, min, max, mean and maximum drawdown (as a negative ratio)."""
+    valid = ~np.isnan(mids)
+    observations = valid.sum(axis=0)
+    if not len(mids):
+        empty = np.full(mids.shape[1], np.nan)
+        return {"observations": observations, "first": empty, "last": empty, "min": empty, "max": empty,
+                "mean": empty, "max_drawdown": empty}
+
+    has_data = observations > 0
+    columns = np.arange(mids.shape[1])
+    first_index = np.argmax(valid, axis=0)
+    last_index = len(mids) - 1 - np.argmax(valid[::-1], axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        running_max = np.fmax.accumulate(mids, axis=0)
+        statistics = {
+            "observations": observations,
+            "first": mids[first_index, columns],
+            "last": mids[last_index, columns],
+            "min": np.min(mids, axis=0, initial=np.inf, where=valid),
+            "max": np.max(mids, axis=0, initial=-np.inf, where=valid),
+            "mean": np.sum(mids, axis=0, where=valid) / observations,
+            "max_drawdown": np.min(mids / running_max - 1, axis=0, initial=0.0, where=valid),
+        }
+    return {name: np.where(has_data, values, np.nan) if name != "observations" else values
+            for name, values in statistics.items()}
+
+
+def cross_rates(matrix: RateMatrix, pairs: list[tuple[str, str]]) -> np.ndarray:
+    """
+    Cross rates for (base, quote) pairs as a date x pair matrix, i.e. the price of one unit of base in quote currency,
+    derived from both PLN mids. Missing mids are carried forward.
+    """
+    filled = RateMatrix(matrix.dates, matrix.codes, forward_fill(matrix.mids))
+    base = np.column_stack([filled.column(base) for base, _ in pairs])
+    quote = np.column_stack([filled.column(quote) for _, quote in pairs])
+    return base / quote
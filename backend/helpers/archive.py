@@ -0,0 +1,99 @@
+import codecs
+import re
+from typing import AsyncIterable, AsyncIterator
+
+import numpy as np
+
+from helpers import metrics
+from helpers.services import RateRecord
+
+ARCHIVE_ENCODING = "cp1250"  # NBP publishes the archives in Windows-1250
+ARCHIVE_DELIMITER = ";"
+ARCHIVE_CHUNK_BYTES = 1 << 16
+RATE_COLUMN = re.compile(r"(\d+)([A-Z]{3})")  # Units and code, e.g. 1USD or 100JPY
+NAMES_LABEL = "nazwa waluty"
+
+
+class ArchiveParser:
+    """
+    Push parser of NBP table A yearly archive CSVs (archiwum_tab_a_YYYY.csv): a header of unit and code columns
+    ("data;1THB;1USD;...;100JPY;...;nr tabeli;..."), one row of decimal comma rates of those units per publication date
+    and trailing rows of ISO codes, names and units. The complete lines of every chunk are converted at once with numpy,
+    so memory is bounded by the chunk size, not the file.
+    """
+
+    def __init__(self, encoding: str = ARCHIVE_ENCODING):
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._pending = ""
+        self._columns: list[int] = []  # Positions of the rate columns
+        self._codes = np.array([], dtype=str)
+        self._units = np.array([], dtype=np.float64)
+        self.names: dict[str, str] = {}  # Currency names of the name row, which may follow the rates
+
+    def feed(self, chunk: bytes) -> list[RateRecord]:
+        lines = (self._pending + self._decoder.decode(chunk)).split("\n")
+        self._pending = lines.pop()  # Incomplete until the next chunk
+        return self._parse(lines)
+
+    def close(self) -> list[RateRecord]:
+        records = self._parse([self._pending + self._decoder.decode(b"", final=True)])
+        self._pending = ""
+        if not self._columns:
+            raise ValueError("Not an NBP table A archive, the header of currency columns is missing.")
+        return records
+
+    def _parse(self, lines: list[str]) -> list[RateRecord]:
+        rows = []
+        for line in lines:
+            cells = line.lstrip("\ufeff").rstrip("\r").split(ARCHIVE_DELIMITER)
+            first = cells[0].strip().lower()
+            if not self._columns:
+                if first == "data":
+                    self._read_header(cells)
+            elif first.replace("-", "").isdigit():
+                rows.append(cells)
+            elif first == NAMES_LABEL:
+                self.names.update(
+                    (code, cells[column].strip()) for code, column in zip(self._codes.tolist(), self._columns)
+                    if column < len(cells) and cells[column].strip()
+                )
+        if not rows:
+            return []
+        with metrics.stage("csv_parse"):
+            return self._records(rows)
+
+    def _read_header(self, cells: list[str]) -> None:
+        columns = [(index, RATE_COLUMN.fullmatch(cell.strip())) for index, cell in enumerate(cells)]
+        columns = [(index, match) for index, match in columns if match]
+        self._columns = [index for index, _ in columns]
+        self._codes = np.array([match[2] for _, match in columns])
+        self._units = np.array([float(match[1]) for _, match in columns])
+
+    def _records(self, rows: list[list[str]]) -> list[RateRecord]:
+        width = self._columns[-1] + 1
+        table = np.array([row[:width] + [""] * (width - len(row)) for row in rows])
+
+        days = np.char.replace(np.char.strip(table[:, 0]), "-", "").astype(np.int64)  # YYYYMMDD
+        dates = ((days // 10000 - 1970).astype("datetime64[Y]") + (days // 100 % 100 - 1).astype("timedelta64[M]")
+                 ).astype("datetime64[D]") + (days % 100 - 1).astype("timedelta64[D]")
+
+        cells = np.char.replace(np.char.strip(table[:, self._columns]), ",", ".")
+        cells[cells == ""] = "nan"  # Not quoted that day
+        mids = np.round(cells.astype(np.float64) / self._units, 8)  # 4 decimals of up to 10000 units, without noise
+        date_index, code_index = np.nonzero(mids > 0)  # NaN compares false, some archives quote 0 instead
+        codes = self._codes[code_index].tolist()
+        return list(zip(
+            dates[date_index].astype(object).tolist(),
+            [self.names.get(code, code) for code in codes],  # Until its name is read, a new code is its own name
+            codes,
+            mids[date_index, code_index].tolist(),
+        ))
+
+
+async def archive_records(chunks: AsyncIterable[bytes], parser: ArchiveParser) -> AsyncIterator[RateRecord]:
+    """Rate records of an archive as its chunks arrive."""
+    async for chunk in chunks:
+        for record in parser.feed(chunk):
+            yield record
+    for record in parser.close():
+        yield record
@@ -0,0 +1,183 @@
+import asyncio
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from helpers.analytics import BASE_CODE
+from helpers.snapshot import RateSnapshot, rate_snapshot
+from models import Currency, Rate
+from models.rate import MID_SCALE
+from services.db_service import AsyncSessionLocal
+
+
+KEY_CODE_SHIFT = 32  # Lookup keys are the code id in the high bits and the day number in the low ones
+KEY_DAY_OFFSET = 1 << 31  # Keeps days before 1970 positive
+UNKNOWN_CODE_ID, BASE_CODE_ID = -1, -2
+EPOCH = date(1970, 1, 1)  # Day numbers of datetime64[D]
+
+
+def series_keys(code_ids: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Sortable int64 keys of (code id, day number) pairs, all days of a code form one contiguous key range."""
+    return (code_ids << KEY_CODE_SHIFT) + days + KEY_DAY_OFFSET
+
+
+class RateSeries(NamedTuple):
+    dates: np.ndarray  # datetime64[D], sorted publication dates of one code
+    mids: np.ndarray  # float64
+
+
+class AsOfRates(NamedTuple):
+    dates: np.ndarray  # datetime64[D] publication date of every looked up rate, NaT if there is none
+    mids: np.ndarray  # float64, NaN if there is none
+
+
+class Conversions(NamedTuple):
+    results: np.ndarray  # float64, NaN where either rate is missing
+    rates: np.ndarray  # float64 multipliers from the source to the target currency
+    from_dates: np.ndarray  # datetime64[D] publication dates of the rates used
+    to_dates: np.ndarray
+
+
+class AsOfIndex:
+    """
+    Per code sorted date and mid arrays resolving "the latest rate published on or before a date" by binary search.
+    With the rate snapshot enabled, the series are derived from it whenever another version is published, so every
+    worker follows ingestion of any other. Without it they are loaded from the database and merged with the rates of
+    every range ingested by this process.
+    """
+
+    def __init__(self):
+        self._set_series({})
+        self._currencies: dict[str, str] = {}
+        self._loaded = False
+        self._snapshot_version: str | None = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        """Make the series current, a no-op unless the snapshot moved on or nothing has been loaded yet."""
+        if rate_snapshot.enabled:
+            snapshot = rate_snapshot.load()
+            if snapshot is not None and rate_snapshot.version != self._snapshot_version:
+                series, self._currencies = series_from_snapshot(snapshot)
+                self._set_series(series)
+                self._snapshot_version, self._loaded = rate_snapshot.version, True
+            if snapshot is not None:
+                return
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self._merge_from_db()
+                    self._loaded = True
+
+    async def refresh(self, date_from: date, date_to: date) -> None:
+        """Merge rates of date_from..date_to stored by this process, called after the commit of an ingest."""
+        if self._loaded and self._snapshot_version is None:
+            async with self._lock:
+                await self._merge_from_db(date_from, date_to)
+
+    def clear(self) -> None:
+        self._set_series({})
+        self._currencies = {}
+        self._loaded, self._snapshot_version = False, None
+        self._lock = asyncio.Lock()  # A contended lock is bound to its event loop
+
+    def _set_series(self, series: dict[str, RateSeries]) -> None:
+        """Replace the series and the concatenated arrays searched by lookups, all at once."""
+        series = dict(sorted(series.items()))
+        codes = list(series)
+        code_ids = {code: code_id for code_id, code in enumerate(codes)} | {BASE_CODE: BASE_CODE_ID}
+        dates = np.concatenate([series[code].dates for code in codes] or [np.array([], dtype="datetime64[D]")])
+        mids = np.concatenate([series[code].mids for code in codes] or [np.array([], dtype=np.float64)])
+        lengths = [len(series[code].dates) for code in codes]
+        keys = series_keys(np.repeat(np.arange(len(codes), dtype=np.int64), lengths), dates.astype(np.int64))
+        self._series, self._code_ids, self._keys, self._dates, self._mids = series, code_ids, keys, dates, mids
+
+    @property
+    def codes(self) -> list[str]:
+        return list(self._series)
+
+    def currency(self, code: str) -> str | None:
+        return self._currencies.get(code)
+
+    def lookup(self, codes: list[str], dates: np.ndarray) -> AsOfRates:
+        """
+        Latest rates of every (code, date) pair published on or before the date, found with one binary search over the
+        keys of all series. PLN is always 1.0.
+        """
+        code_ids = np.array([self._code_ids.get(code, UNKNOWN_CODE_ID) for code in codes], dtype=np.int64)
+        keys = series_keys(code_ids, dates.astype("datetime64[D]").astype(np.int64))
+        order = np.argsort(keys)  # Sorted needles keep the search in cache
+        index = np.empty_like(order)
+        index[order] = np.searchsorted(self._keys, keys[order], side="right") - 1
+        found = (index >= 0) & (code_ids >= 0)
+        found[found] = self._keys[index[found]] >> KEY_CODE_SHIFT == code_ids[found]  # Not a rate of another code
+
+        rate_dates = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[D]")
+        mids = np.full(len(codes), np.nan)
+        rate_dates[found], mids[found] = self._dates[index[found]], self._mids[index[found]]
+        base = code_ids == BASE_CODE_ID
+        rate_dates[base], mids[base] = dates[base], 1.0
+        return AsOfRates(rate_dates, mids)
+
+    def convert(self, amounts: np.ndarray, from_codes: list[str], to_codes: list[str],
+                dates: np.ndarray) -> Conversions:
+        """Convert amounts between currencies at the latest mids published on or before their dates."""
+        found = self.lookup(from_codes + to_codes, np.concatenate([dates, dates]))
+        source_mids, target_mids = np.split(found.mids, 2)
+        from_dates, to_dates = np.split(found.dates, 2)
+        rates = source_mids / target_mids
+        return Conversions(amounts * rates, rates, from_dates, to_dates)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._loaded,
+            "source": "snapshot" if self._snapshot_version is not None else "db",
+            "codes": len(self._series),
+            "rates": sum(len(series.dates) for series in self._series.values()),
+        }
+
+    async def _merge_from_db(self, date_from: date | None = None, date_to: date | None = None) -> None:
+        """Merge stored rates of a range (all if None), fetched as one row of day numbers and scaled mids per code."""
+        query = (
+            select(Currency.code, Currency.currency,
+                   func.array_agg(aggregate_order_by(Rate.update_date - EPOCH, Rate.update_date)),
+                   func.array_agg(aggregate_order_by(Rate.mid_scaled, Rate.update_date)))
+            .join(Currency).group_by(Currency.code, Currency.currency)
+        )
+        if date_from is not None:
+            query = query.where(Rate.update_date.between(date_from, date_to))
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).all()
+        if not rows:
+            return
+
+        series = dict(self._series)
+        for code, currency, days, mids_scaled in rows:
+            update = RateSeries(np.array(days, dtype=np.int64).astype("datetime64[D]"),
+                                np.array(mids_scaled, dtype=np.int64) / MID_SCALE)
+            series[code] = update if code not in series else merge_series(series[code], update)
+            self._currencies[code] = currency
+        self._set_series(series)
+
+
+def merge_series(current: RateSeries, update: RateSeries) -> RateSeries:
+    """Overlay an update onto a series, keeping dates sorted and unique."""
+    dates = np.concatenate([update.dates, current.dates])
+    mids = np.concatenate([update.mids, current.mids])
+    dates, first = np.unique(dates, return_index=True)  # The first occurrence, from the update, wins
+    return RateSeries(dates, mids[first])
+
+
+def series_from_snapshot(snapshot: RateSnapshot) -> tuple[dict[str, RateSeries], dict[str, str]]:
+    series = {}
+    for column, code in enumerate(snapshot.codes.tolist()):
+        mids = np.asarray(snapshot.mids[:, column])
+        published = ~np.isnan(mids)
+        series[code] = RateSeries(np.asarray(snapshot.dates)[published], mids[published])
+    return series, dict(zip(snapshot.codes.tolist(), snapshot.currencies.tolist()))
+
+
+as_of_index = AsOfIndex()
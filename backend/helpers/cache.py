@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Awaitable, BinaryIO, Callable, Hashable, Iterator
+
+RATE_CACHE_MAX_ENTRIES = int(os.getenv("RATE_CACHE_MAX_ENTRIES", 512))
+RATE_CACHE_TODAY_TTL = float(os.getenv("RATE_CACHE_TODAY_TTL", 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 128))
+
+
+class RangeCache:
+    """
+    Thread-safe LRU cache for results of (start_date, end_date, code) range queries.
+    Published NBP rates never change, so ranges in the past are kept until evicted or invalidated, while ranges that
+    include today expire after a short TTL, as the table of the day may still be published.
+    Every invalidation moves the generation on, so results queried before it are not cached after it.
+    """
+
+    def __init__(self, max_entries: int = RATE_CACHE_MAX_ENTRIES, today_ttl: float = RATE_CACHE_TODAY_TTL):
+        self.max_entries = max_entries
+        self.today_ttl = today_ttl
+        self.generation = 0  # Taken by readers before querying, see put()
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, start_date: date, end_date: date, code: str | None = None) -> Any | None:
+        key = (start_date, end_date, code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, start_date: date, end_date: date, code: str | None, value: Any,
+            generation: int | None = None) -> None:
+        """Cache a result, dropped if queried at a generation an invalidation has since moved past."""
+        expires_at = time.monotonic() + self.today_ttl if end_date >= date.today() else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[(start_date, end_date, code)] = (value, expires_at)
+            self._entries.move_to_end((start_date, end_date, code))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, date_from: date, date_to: date, codes: set[str] | None = None) -> None:
+        """Drop cached ranges overlapping date_from..date_to, for any of the codes (all codes if None)."""
+        with self._lock:
+            self.generation += 1
+            for key in [
+                key for key in self._entries
+                if key[0] <= date_to and key[1] >= date_from and (codes is None or key[2] is None or key[2] in codes)
+            ]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+            }
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of upstream (status, body) responses keyed by URL. Final responses, which can never change,
+    are also persisted as files in `directory` (if given) and survive restarts; the others expire after `ttl` seconds.
+    """
+
+    def __init__(self, directory: str | None, ttl: float, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[int, bytes, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> tuple[int, bytes] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None or entry[2] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+        stored = self._read(key)
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, (*stored, None))
+        return stored
+
+    def put(self, key: str, status: int, body: bytes, final: bool) -> None:
+        if final:
+            self._write(key, status, body)
+        with self._lock:
+            self._store(key, (status, body, None if final else time.monotonic() + self.ttl))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int | float]:
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+            }
+
+    def peek(self, key: str) -> tuple[int, bytes] | None:
+        """Memory-only lookup for streaming readers, which read persisted responses with open_persisted instead."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[2] is None or entry[2] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+            return None
+
+    def open_persisted(self, key: str) -> tuple[int, BinaryIO] | None:
+        """Open a persisted response for reading in chunks, positioned at the start of the body."""
+        if not self.directory:
+            return None
+        try:
+            file = open(self._path(key), "rb")
+        except OSError:
+            return None
+        try:
+            status = int(file.readline())
+        except ValueError:
+            file.close()
+            return None
+        with self._lock:
+            self.hits += 1
+        return status, file
+
+    @contextmanager
+    def persisting(self, key: str, status: int) -> Iterator[Callable[[bytes], Any] | None]:
+        """
+        Persist a response written chunk by chunk through the yielded function (None without a directory). The file
+        is published only if the block completes, so a failed stream never leaves a truncated response behind.
+        """
+        if not self.directory:
+            yield None
+            return
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(b"%d\n" % status)
+            try:
+                yield file.write
+            except BaseException:
+                file.close()
+                os.unlink(temporary_path)
+                raise
+        os.replace(temporary_path, path)
+
+    def count_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def _store(self, key: str, entry: tuple[int, bytes, float | None]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _read(self, key: str) -> tuple[int, bytes] | None:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "rb") as file:
+                status, body = file.read().split(b"\n", 1)
+            return int(status), body
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key: str, status: int, body: bytes) -> None:
+        if not self.directory:
+            return
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "wb") as file:
+                file.write(b"%d\n" % status + body)
+            os.replace(temporary_path, path)  # Atomic, other workers never read a partial file
+        except OSError:
+            pass  # Persistence is best effort, the response is still cached in memory
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution, whose result (or error) all callers share.
+    The call runs to completion even if the caller that started it is cancelled.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._in_flight.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(function())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def join(self, key: Hashable) -> asyncio.Future | None:
+        """The in-flight call of the key to wait for, counted as coalesced, or None if there is none."""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        return future
+
+    @contextmanager
+    def lead(self, key: Hashable) -> Iterator[None]:
+        """
+        Run the call of the key in the block, e.g. one streaming its result, for others to join(). Joined callers are
+        woken when the block exits, successfully or not, and find the result where the block left it (e.g. a cache).
+        """
+        self.calls += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            yield
+        finally:
+            self._in_flight.pop(key, None)
+            future.set_result(None)
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+
+rates_cache = RangeCache()
@@ -0,0 +1,178 @@
+import asyncio
+import os
+import secrets
+from datetime import date
+from typing import AsyncIterator
+
+import orjson
+from asyncpg import Connection as DriverConnection
+from sqlalchemy import func, select
+from sqlalchemy.exc import DBAPIError
+
+from helpers.asof import as_of_index
+from helpers.cache import rates_cache
+from helpers.ingest import IngestResult
+from services.db_service import AsyncSessionLocal, async_engine
+
+EVENTS_CHANNEL = "rates_committed"
+EVENTS_LISTEN = os.getenv("EVENTS_LISTEN", "true").lower() == "true"  # Follow commits of other workers
+EVENTS_QUEUE_SIZE = 64  # Events buffered per stream, a client lagging behind is disconnected and reconnects
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", 15))  # Seconds, comments keep idle streams open through proxies
+EVENTS_RECONNECT_DELAY = 5.0  # Seconds before listening again after the connection was lost
+EVENTS_RETRY_MS = 3000  # Reconnection delay advised to EventSource clients
+NOTIFY_MAX_BYTES = 7999  # Postgres limit of NOTIFY payloads
+RESYNC_EVENT = b"event: resync\ndata: {}\n\n"
+
+
+def rates_event(payload: bytes) -> bytes:
+    return b"event: rates\ndata: " + payload + b"\n\n"
+
+
+class RateEvents:
+    """
+    Publishes a compact delta of every committed ingest to server-sent event streams. Deltas are fanned out to the
+    streams of this worker at once and to the other workers through Postgres NOTIFY, whose listener also drops their
+    cached ranges the delta overlaps. Every delta is encoded once, whatever the number of streams.
+    """
+
+    def __init__(self, channel: str = EVENTS_CHANNEL):
+        self.channel = channel
+        self.origin = secrets.token_hex(4)  # Tells notifications of this worker from those of others, see start()
+        self._streams: set[asyncio.Queue] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._refreshes: set[asyncio.Task] = set()
+        self._closed = False
+        self._stats = {"listening": False, "published": 0, "received": 0, "dropped_streams": 0, "reconnects": 0}
+
+    def start(self, listen: bool = EVENTS_LISTEN) -> None:
+        self.origin = secrets.token_hex(4)  # Workers forked from a preloaded app would share the one of the import
+        self._loop, self._closed = asyncio.get_running_loop(), False
+        if listen and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        self.close_streams()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._refreshes, return_exceptions=True)
+            self._task = None
+        self._loop = None
+
+    def close_streams(self) -> None:
+        """End all streams, e.g. as the worker shuts down, which waits for open responses to complete."""
+        self._closed = True
+        for stream in list(self._streams):
+            self._end(stream)
+
+    def close_streams_threadsafe(self) -> None:
+        """close_streams for signal handlers."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.close_streams)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Server-sent events of every delta published from now on, until the client disconnects or is dropped."""
+        stream: asyncio.Queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+        self._streams.add(stream)
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n".encode()
+            while not self._closed:
+                try:
+                    event = await asyncio.wait_for(stream.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    event = b": keepalive\n\n"
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._streams.discard(stream)
+
+    async def publish(self, result: IngestResult) -> None:
+        """Send the delta of committed rates, with the rows the ingest inserted unless there are too many."""
+        if not result.inserted:
+            return
+        payload = encode_delta(self.origin, result, result.rows)
+        if len(payload) > NOTIFY_MAX_BYTES:
+            payload = encode_delta(self.origin, result, None)
+        async with AsyncSessionLocal() as db:
+            await db.execute(select(func.pg_notify(self.channel, payload.decode())))
+            await db.commit()
+        self._stats["published"] += 1
+        self._broadcast(rates_event(payload))
+
+    def stats(self) -> dict:
+        return {**self._stats, "streams": len(self._streams)}
+
+    def _broadcast(self, event: bytes) -> None:
+        for stream in list(self._streams):
+            try:
+                stream.put_nowait(event)
+            except asyncio.QueueFull:
+                self._stats["dropped_streams"] += 1
+                self._end(stream)
+
+    def _end(self, stream: asyncio.Queue) -> None:
+        self._streams.discard(stream)
+        if stream.full():
+            stream.get_nowait()  # Room for the end of the stream
+        stream.put_nowait(None)
+
+    def _notified(self, _connection: DriverConnection, _pid: int, _channel: str, payload: str) -> None:
+        delta = orjson.loads(payload)
+        if delta["origin"] == self.origin:
+            return
+        self._stats["received"] += 1
+        date_from, date_to = date.fromisoformat(delta["date_from"]), date.fromisoformat(delta["date_to"])
+        rates_cache.invalidate(date_from, date_to, set(delta["codes"]))
+        refresh = asyncio.create_task(as_of_index.refresh(date_from, date_to))
+        self._refreshes.add(refresh)
+        refresh.add_done_callback(self._refreshes.discard)
+        self._broadcast(rates_event(payload.encode()))
+
+    async def _listen(self) -> None:
+        """LISTEN on a dedicated connection for as long as the worker runs, listening again when it is lost."""
+        listened = False
+        while True:
+            connection = None
+            try:
+                connection = await async_engine.connect()
+                driver = (await connection.get_raw_connection()).driver_connection
+                lost = asyncio.get_running_loop().create_future()
+                driver.add_termination_listener(lambda _: lost.done() or lost.set_result(None))
+                await driver.add_listener(self.channel, self._notified)
+                if listened:  # Commits of other workers may have been missed meanwhile
+                    self._stats["reconnects"] += 1
+                    rates_cache.clear()
+                    self._broadcast(RESYNC_EVENT)
+                listened = self._stats["listening"] = True
+                await lost
+            except Exception:  # E.g. the database is restarting, listened again after the delay
+                pass
+            finally:
+                self._stats["listening"] = False
+                if connection is not None:
+                    try:  # LISTEN is session state, the connection is discarded instead of returned to the pool
+                        await connection.invalidate()
+                        await connection.close()
+                    except DBAPIError:
+                        pass
+            await asyncio.sleep(EVENTS_RECONNECT_DELAY)
+
+
+def encode_delta(origin: str, result: IngestResult, rows: list | None) -> bytes:
+    """Compact JSON of a committed ingest, rows as columns like columnar rate responses, None if not included."""
+    delta = {
+        "origin": origin,
+        "date_from": result.date_from,
+        "date_to": result.date_to,
+        "codes": sorted(result.codes),
+        "inserted": result.inserted,
+        "rates": None,
+    }
+    if rows is not None:
+        dates, currencies, codes, mids = zip(*rows) if rows else ((), (), (), ())
+        delta["rates"] = {"dates": dates, "currencies": currencies, "codes": codes, "mid": mids}
+    return orjson.dumps(delta)
+
+
+rate_events = RateEvents()
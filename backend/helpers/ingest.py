@@ -0,0 +1,170 @@
+import os
+import time
+from datetime import date
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, NamedTuple
+
+from sqlalchemy import Row, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from helpers import metrics
+from helpers.services import RateRecord
+from models.rate import MID_SCALE
+
+COPY_BUFFER_ROWS = 10_000
+RATE_COLUMNS = ("update_date", "currency", "code", "mid")
+INSERTED_ROWS_MAX = int(os.getenv("EVENTS_MAX_ROWS", 100))  # Rows returned for event deltas, larger ingests only
+# return their range and codes
+
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS rates_staging (
+        update_date DATE NOT NULL,
+        currency VARCHAR NOT NULL,
+        code VARCHAR NOT NULL,
+        mid DOUBLE PRECISION NOT NULL
+    ) ON COMMIT DROP
+"""
+
+# New codes enter the currency dimension before the rates referencing them are merged
+ADD_CURRENCIES_SQL = """
+    INSERT INTO currencies (code, currency)
+    SELECT DISTINCT ON (s.code) s.code, s.currency
+    FROM rates_staging s
+    WHERE NOT EXISTS (SELECT 1 FROM currencies c WHERE c.code = s.code)
+    ORDER BY s.code
+    ON CONFLICT (code) DO NOTHING
+"""
+
+# Inserted rates are returned by their count, range and codes, and the first :rows_max + 1 of them as columns
+MERGE_STAGING_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO rates (update_date, currency_id, mid_scaled)
+        SELECT s.update_date, c.id, round(s.mid * {MID_SCALE})::BIGINT
+        FROM rates_staging s
+        JOIN currencies c ON c.code = s.code
+        ON CONFLICT (update_date, currency_id) DO NOTHING
+        RETURNING update_date, currency_id, mid_scaled
+    ), inserted_rates AS (
+        SELECT i.update_date, c.currency, c.code, i.mid_scaled::FLOAT / {MID_SCALE} AS mid
+        FROM inserted i
+        JOIN currencies c ON c.id = i.currency_id
+    ), first_rates AS (
+        SELECT * FROM inserted_rates ORDER BY update_date, code LIMIT :rows_max + 1
+    )
+    SELECT count(*), min(update_date), max(update_date), coalesce(array_agg(DISTINCT code), '{{}}'),
+           (SELECT array_agg(update_date ORDER BY update_date, code) FROM first_rates),
+           (SELECT array_agg(currency ORDER BY update_date, code) FROM first_rates),
+           (SELECT array_agg(code ORDER BY update_date, code) FROM first_rates),
+           (SELECT array_agg(mid ORDER BY update_date, code) FROM first_rates)
+    FROM inserted_rates
+"""
+
+
+class IngestResult(NamedTuple):
+    inserted: int
+    skipped: int
+    date_from: date | None = None  # Range and codes of inserted rows, None if nothing was inserted
+    date_to: date | None = None
+    codes: frozenset[str] = frozenset()
+    rows: list[RateRecord] | None = None  # Inserted rows by date and code, None beyond INSERTED_ROWS_MAX
+
+
+def merge_result(staged: int, merged: Row) -> IngestResult:
+    """Build the result of a load from the staged row count and the row of MERGE_STAGING_SQL."""
+    inserted, date_from, date_to, codes, *columns = merged
+    columns = [column or [] for column in columns]  # Aggregates of no rows are NULL
+    rows = list(zip(*columns)) if inserted <= INSERTED_ROWS_MAX else None
+    return IngestResult(inserted, staged - inserted, date_from, date_to, frozenset(codes), rows)
+
+
+def _escape(value: str) -> str:
+    """Escape a value for the COPY text format."""
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class _CopyStream:
+    """File-like object feeding records to COPY in fixed-size chunks, so the full payload is never built in memory."""
+
+    def __init__(self, records: Iterable[RateRecord]):
+        self._chunks = self._format(records)
+
+    @staticmethod
+    def _format(records: Iterable[RateRecord]) -> Iterator[str]:
+        lines = []
+        for update_date, currency, code, mid in records:
+            lines.append(f"{update_date.isoformat()}\t{_escape(currency)}\t{_escape(code)}\t{mid}\n")
+            if len(lines) == COPY_BUFFER_ROWS:
+                yield "".join(lines)
+                lines = []
+        if lines:
+            yield "".join(lines)
+
+    def read(self, _size: int = -1) -> str:
+        """Return the next chunk of rows, COPY accepts chunks of any length and stops on an empty string."""
+        return next(self._chunks, "")
+
+
+class _ProducerClock:
+    """
+    Async iterable of the records fed to COPY, adding up the seconds spent waiting for them to be produced (e.g.
+    fetched and parsed while they stream), which the insert stage does not count.
+    """
+
+    def __init__(self, records: Iterable[RateRecord] | AsyncIterable[RateRecord]):
+        self.records = records
+        self.seconds = 0.0
+
+    async def __aiter__(self) -> AsyncIterator[RateRecord]:
+        iterator = aiter(self.records) if isinstance(self.records, AsyncIterable) else None
+        records = iter(self.records) if iterator is None else None
+        while True:
+            started = time.perf_counter()
+            try:
+                record = next(records) if iterator is None else await anext(iterator)
+            except (StopIteration, StopAsyncIteration):
+                return
+            finally:
+                self.seconds += time.perf_counter() - started
+            yield record
+
+
+def copy_rates(db: Session, records: Iterable[RateRecord]) -> IngestResult:
+    """
+    Stream (update_date, currency, code, mid) records into a temporary staging table with COPY and merge them into
+    rates, adding new codes to the currency dimension. Pairs of (update_date, code) that already exist are skipped by
+    the primary key, also under concurrent loads. Runs inside the session transaction without committing.
+    """
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(STAGING_TABLE_SQL)
+        cursor.copy_expert("COPY rates_staging (update_date, currency, code, mid) FROM STDIN", _CopyStream(records))
+        staged = cursor.rowcount
+        cursor.execute(ADD_CURRENCIES_SQL)
+        merged = db.execute(text(MERGE_STAGING_SQL), {"rows_max": INSERTED_ROWS_MAX}).one()
+        cursor.execute("DROP TABLE rates_staging")
+    finally:
+        cursor.close()
+
+    return merge_result(staged, merged)
+
+
+async def copy_rates_async(db: AsyncSession, records: Iterable[RateRecord] | AsyncIterable[RateRecord]) -> IngestResult:
+    """
+    Asynchronous variant of copy_rates, streaming records (also as they are parsed) with asyncpg's binary COPY. The
+    insert stage times the staging and COPY without the time spent waiting for the records.
+    """
+    producer = _ProducerClock(records)
+    started = time.perf_counter()
+    await db.execute(text(STAGING_TABLE_SQL))  # Also begins the session transaction the COPY takes part in
+    connection = await (await db.connection()).get_raw_connection()
+    status = await connection.driver_connection.copy_records_to_table(
+        "rates_staging", records=producer, columns=RATE_COLUMNS
+    )
+    metrics.STAGE_LATENCY.labels("insert").observe(time.perf_counter() - started - producer.seconds)
+    staged = int(status.split()[-1])
+    with metrics.stage("diff"):  # Only rates not stored yet are moved from the staging table
+        await db.execute(text(ADD_CURRENCIES_SQL))
+        merged = (await db.execute(text(MERGE_STAGING_SQL), {"rows_max": INSERTED_ROWS_MAX})).one()
+    await db.execute(text("DROP TABLE rates_staging"))
+
+    return merge_result(staged, merged)
@@ -0,0 +1,102 @@
+import os
+import time
+from typing import Callable, Iterator
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.registry import Collector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being processed", multiprocess_mode="livesum")
+# Stages do not overlap: e.g. insert excludes the fetch and parse of records streamed into the COPY
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds", "Time spent in a processing stage: upstream_fetch, json_parse, csv_parse, insert, diff, "
+                              "aggregate_refresh, commit, snapshot_refresh, db_query, convert, serialize", ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_REQUESTS = Counter("nbp_upstream_requests_total", "Requests sent to the NBP API by status", ["status"])
+
+# Gauges read from in-process stats at scrape time, never aggregated over workers
+STATS_REGISTRY = CollectorRegistry()
+
+
+def stage(name: str):
+    """Context manager timing a processing stage, e.g. `with metrics.stage("json_parse"): ...`."""
+    return STAGE_LATENCY.labels(name).time()
+
+
+class MetricsMiddleware:
+    """Records latency of every HTTP request, labelled with the matched route template to bound cardinality."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(time.perf_counter() - started)
+
+
+class StatsCollector(Collector):
+    """Exposes numeric values of stats dictionaries (pool, caches, ...) as gauges, read at scrape time."""
+
+    def __init__(self, sources: dict[str, Callable[[], dict]]):
+        self.sources = sources
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for prefix, source in self.sources.items():
+            for name, value in flatten(source()):
+                if isinstance(value, (int, float)):  # Also booleans, as 0 and 1
+                    yield GaugeMetricFamily(f"{prefix}_{name}", f"{prefix} {name.replace('_', ' ')}",
+                                            value=float(value))
+
+
+def flatten(stats: dict, prefix: str = "") -> Iterator[tuple[str, object]]:
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}_")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def register_stats(sources: dict[str, Callable[[], dict]]) -> None:
+    STATS_REGISTRY.register(StatsCollector(sources))
+
+
+def latest() -> bytes:
+    """
+    Render all metrics in the Prometheus text format. With PROMETHEUS_MULTIPROC_DIR set, request and stage metrics
+    are aggregated over all workers, the stats gauges are those of the worker answering the scrape.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(STATS_REGISTRY)
@@ -1,52 +1,224 @@
+from bisect import bisect_right
+from collections import defaultdict
 from datetime import date
+from typing import AsyncIterable, AsyncIterator, Iterable
+
+from sqlalchemy import Row, bindparam, func, or_, select, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import metrics
+from helpers.aggregates import period_start, refresh_aggregates
+from helpers.archive import ARCHIVE_ENCODING, ArchiveParser, archive_records
+from helpers.asof import as_of_index
+from helpers.cache import rates_cache
+from helpers.events import rate_events
+from helpers.ingest import IngestResult, copy_rates_async
+from helpers.snapshot import rate_snapshot
+from helpers.streaming import NewRecordFilter
+from helpers.services import RateRecord, merge_periods
+from models import Currency, Rate, RateAggregate
+
+NEIGHBOUR_DATES = 5  # Stored dates on either side whose codes a date must hold to count as complete
+RATE_ROW = (Rate.update_date, Currency.currency, Currency.code, Rate.mid)  # Rates are selected joined with currencies
+
+
+async def get_currencies(db: AsyncSession) -> list[dict[str, str]]:
+    """Get all currencies of the currency dimension, extended by every load of rates."""
+    currencies = await db.execute(select(Currency.currency, Currency.code).order_by(Currency.currency))
+    return [{"currency": currency, "code": code} for currency, code in currencies]
 
-from sqlalchemy.orm import Session
 
-from models import Rate
+async def get_rates_for_period(db: AsyncSession, start_date: date, end_date: date, code: str | None = None) -> tuple[
+    list[Row], date, date]:
+    """Get rates for a specific period, optionally filtered by currency code. Served from the cache when possible."""
+    cached = rates_cache.get(start_date, end_date, code)
+    if cached is not None:
+        return cached, start_date, end_date
 
+    generation = rates_cache.generation  # Before the query, an ingest may commit and invalidate meanwhile
+    query = select(*RATE_ROW).join(Currency)
 
-def get_currencies(db: Session) -> list[dict[str, str]]:
-    """Get all currencies from the database."""
-    currencies = db.query(Rate.currency, Rate.code).distinct().order_by(Rate.currency).all()
-    return [{"currency": currency, "code": code} for currency, code in currencies]
+    if start_date == end_date:
+        query = query.where(Rate.update_date == start_date)
+    else:
+        query = query.where(Rate.update_date.between(start_date, end_date))
 
+    if code:
+        query = query.where(Currency.code == code)
 
-def get_rates(db: Session, date_from: date, date_to: date) -> set[tuple[date, str]]:
-    """Get all existing rates, return a set of tuples with date and currency code for easy comparison."""
-    existing_rates = db.query(Rate.update_date, Rate.code).filter(Rate.update_date.between(date_from, date_to)).all()
-    return {(rate.update_date, rate.code) for rate in existing_rates}
+    with metrics.stage("db_query"):
+        results = (await db.execute(query.order_by(Rate.update_date, Currency.code))).all()
+    if results:
+        rates_cache.put(start_date, end_date, code, results, generation)
+
+    return results, start_date, end_date
 
 
-def get_code_rates(db: Session, code: str, date_from: date, date_to: date) -> set[tuple[date, float]]:
+async def get_rates_page(db: AsyncSession, start_date: date, end_date: date, code: str | None,
+                         after: tuple[date, str] | None, limit: int) -> list[Row]:
     """
-    Get all existing rates for a specific currency code, return a set of tuples with date, mid for easy comparison.
-    Mid currently not used, but it's here for possible future use.
+    Up to `limit` rates of a period following the (update_date, code) key `after`, in the order of full responses. The
+    primary key index is scanned from the key's date and only dates of the page are sorted by code, so the cost of a
+    page does not grow with its position. Sliced from the cached period when it is cached.
     """
-    existing_rates = db.query(Rate.update_date, Rate.mid).filter(
-        Rate.update_date.between(date_from, date_to), Rate.code == code
-    ).all()
-    return {(rate.update_date, rate.mid) for rate in existing_rates}
+    cached = rates_cache.get(start_date, end_date, code)
+    if cached is not None:
+        start = bisect_right(cached, after, key=lambda rate: (rate[0], rate[2])) if after else 0
+        return cached[start:start + limit]
 
+    query = select(*RATE_ROW).join(Currency).where(Rate.update_date.between(start_date, end_date))
+    if code:
+        query = query.where(Currency.code == code)
+    if after:
+        query = query.where(Rate.update_date >= after[0], tuple_(Rate.update_date, Currency.code) > after)
 
-def get_rates_for_period(db: Session, start_date: date, end_date: date, code: str | None = None) -> tuple[
-    list[Rate], date, date]:
-    """Get rates for a specific period, optionally filtered by currency code."""
-    query = db.query(Rate)
+    with metrics.stage("db_query"):
+        return (await db.execute(query.order_by(Rate.update_date, Currency.code).limit(limit))).all()
 
-    if start_date == end_date:
-        query = query.filter(Rate.update_date == start_date)
-    else:
-        query = query.filter(Rate.update_date.between(start_date, end_date))
 
+async def get_rates_for_periods(db: AsyncSession, periods: list[tuple[date, date]], codes: list[str]) -> list[Row]:
+    """
+    Get rates of several codes over several periods with a single query, one primary key range scan per disjoint
+    period. Rows are ordered by code and date.
+    """
+    query = select(*RATE_ROW).join(Currency).where(
+        or_(*(Rate.update_date.between(start_date, end_date) for start_date, end_date in merge_periods(periods))),
+        Currency.code.in_(codes),
+    )
+    with metrics.stage("db_query"):
+        return (await db.execute(query.order_by(Currency.code, Rate.update_date))).all()
+
+
+async def get_stored_dates(db: AsyncSession, start_date: date, end_date: date, code: str | None = None) -> set[date]:
+    """Get the dates of a period having at least one stored rate (of the code, if given)."""
+    query = select(Rate.update_date).distinct().where(Rate.update_date.between(start_date, end_date))
     if code:
-        query = query.filter(Rate.code == code)
+        query = query.join(Currency).where(Currency.code == code)
+    return set((await db.scalars(query)).all())
 
-    results = query.order_by(Rate.update_date).all()
 
-    return results, start_date, end_date
+async def get_complete_dates(db: AsyncSession, start_date: date, end_date: date) -> set[date]:
+    """
+    Get the dates of a period holding every code stored on their NEIGHBOUR_DATES nearest stored dates on either side,
+    those outside the period included. A date only some codes were fetched for, e.g. by single code requests, is not.
+    """
+    stored = select(Rate.update_date).distinct()
+    before = stored.where(Rate.update_date < start_date).order_by(Rate.update_date.desc()).limit(NEIGHBOUR_DATES)
+    after = stored.where(Rate.update_date > end_date).order_by(Rate.update_date).limit(NEIGHBOUR_DATES)
+    query = select(Rate.update_date, Currency.code).join(Currency).where(Rate.update_date.between(
+        func.coalesce(select(func.min(before.subquery().c.update_date)).scalar_subquery(), start_date),
+        func.coalesce(select(func.max(after.subquery().c.update_date)).scalar_subquery(), end_date),
+    ))
+    codes = defaultdict(set)
+    for update_date, code in await db.execute(query):
+        codes[update_date].add(code)
+    dates = sorted(codes)
+    return {
+        day for index, day in enumerate(dates) if start_date <= day <= end_date and codes[day].issuperset(set().union(
+            *(codes[neighbour] for neighbour in dates[max(index - NEIGHBOUR_DATES, 0):index + NEIGHBOUR_DATES + 1])))
+    }
+
+
+async def get_stored_keys(db: AsyncSession, start_date: date, end_date: date,
+                          code: str | None = None) -> set[tuple[date, str]]:
+    """Get the (update_date, code) keys of stored rates of a period, optionally for a single code."""
+    query = select(Rate.update_date, Currency.code).join(Currency).where(Rate.update_date.between(start_date, end_date))
+    if code:
+        query = query.where(Currency.code == code)
+    return set((await db.execute(query)).tuples().all())
+
+
+async def get_aggregates_for_period(db: AsyncSession, period: str, start_date: date, end_date: date,
+                                    code: str | None = None) -> list[Row]:
+    """Get precomputed aggregates of the periods overlapping start_date..end_date, optionally for a single code."""
+    query = select(
+        RateAggregate.period_start, Currency.currency, RateAggregate.code, RateAggregate.avg_mid,
+        RateAggregate.min_mid, RateAggregate.max_mid, RateAggregate.first_mid, RateAggregate.last_mid,
+        RateAggregate.observations,
+    ).join(Currency, Currency.code == RateAggregate.code).where(
+        RateAggregate.period == period,
+        RateAggregate.period_start.between(period_start(period, start_date), end_date),
+    )
+    if code:
+        query = query.where(RateAggregate.code == code)
+
+    return (await db.execute(query.order_by(RateAggregate.period_start, RateAggregate.code))).all()
+
+
+async def iter_rates_for_period(db: AsyncSession, start_date: date, end_date: date, codes: list[str] | None = None,
+                                batch_size: int = 5000) -> AsyncIterator[list[Row]]:
+    """Stream rates for a period in batches from a server-side cursor, so memory does not grow with the range."""
+    query = select(*RATE_ROW).join(Currency).where(Rate.update_date.between(start_date, end_date))
+    if codes:
+        query = query.where(Currency.code.in_(codes))
+
+    result = await db.stream(query.order_by(Rate.update_date, Currency.code).execution_options(yield_per=batch_size))
+    async for batch in result.partitions():
+        yield batch
+
+
+async def add_rates_to_db(db: AsyncSession, rates: Iterable[RateRecord] | AsyncIterable[RateRecord],
+                         commit: bool = True) -> IngestResult:
+    """Bulk load rate records into the database in a single transaction, skipping already existing ones."""
+    result = await copy_rates_async(db, rates)
+    if result.inserted:
+        with metrics.stage("aggregate_refresh"):
+            await refresh_aggregates(db, result.date_from, result.date_to, result.codes)
+    if commit:
+        with metrics.stage("commit"):
+            await db.commit()
+        await invalidate_cached_rates(result)
+    return result
 
 
-def add_rates_to_db(db: Session, rates: list[Rate]) -> None:
-    """Add multiple rates to the database in a single transaction."""
-    db.add_all(rates)
-    db.commit()
+async def add_streamed_rates_to_db(db: AsyncSession, rates: AsyncIterable[RateRecord], start_date: date,
+                                   end_date: date, code: str | None = None, commit: bool = True) -> IngestResult:
+    """
+    Bulk load rates of a period while they are parsed. Rates already stored are dropped as they flow past, the others
+    are copied in batches, so memory does not grow with the period.
+    """
+    new_rates = NewRecordFilter(rates, await get_stored_keys(db, start_date, end_date, code))
+    result = await add_rates_to_db(db, new_rates, commit)
+    return result._replace(skipped=result.skipped + new_rates.skipped)
+
+
+async def add_archive_to_db(db: AsyncSession, chunks: AsyncIterable[bytes],
+                            encoding: str = ARCHIVE_ENCODING) -> IngestResult:
+    """
+    Bulk load an NBP archive CSV while it is read, in a single transaction. Stored (update_date, code) pairs are
+    skipped by the merge. Codes added before the name row of the file was read are named once it is complete.
+    """
+    parser = ArchiveParser(encoding)
+    result = await add_rates_to_db(db, archive_records(chunks, parser), commit=False)
+    if parser.names:
+        currencies = Currency.__table__
+        await db.execute(
+            update(currencies)
+            .where(currencies.c.code == bindparam("archive_code"), currencies.c.currency == currencies.c.code)
+            .values(currency=bindparam("archive_name")),
+            [{"archive_code": code, "archive_name": name} for code, name in parser.names.items()],
+        )
+    with metrics.stage("commit"):
+        await db.commit()
+    await invalidate_cached_rates(result)
+    return result
+
+
+async def ensure_rate_partitions(db: AsyncSession, date_from: date, date_to: date) -> None:
+    """Create the yearly partitions of rates covering date_from..date_to and commit, a no-op for a plain table."""
+    await db.execute(text("SELECT ensure_rate_partitions(:date_from, :date_to)"),
+                     {"date_from": date_from, "date_to": date_to})
+    await db.commit()
+
+
+async def invalidate_cached_rates(result: IngestResult) -> None:
+    """
+    Drop cached results affected by committed rates, update the snapshot and the as-of index and publish the delta to
+    event streams and other workers, must be called after the commit.
+    """
+    if result.inserted:
+        rates_cache.invalidate(result.date_from, result.date_to, set(result.codes))
+        with metrics.stage("snapshot_refresh"):
+            await rate_snapshot.refresh(result.date_from, result.date_to)
+            await as_of_index.refresh(result.date_from, result.date_to)
+        await rate_events.publish(result)
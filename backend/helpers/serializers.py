@@ -0,0 +1,70 @@
+import csv
+import io
+from typing import Sequence
+
+import orjson
+
+RATE_FIELDS = ("update_date", "currency", "code", "mid")
+COLUMNAR_FIELDS = ("update_date", "code", "mid")  # Columns of columnar responses without a projection
+COLUMN_NAMES = {"update_date": "dates", "currency": "currencies", "code": "codes", "mid": "mid"}
+AGGREGATE_FIELDS = ("period_start", "currency", "code", "avg_mid", "min_mid", "max_mid", "first_mid", "last_mid",
+                    "observations")
+
+
+def _objects(rates: Sequence[Sequence], fields: Sequence[str] = RATE_FIELDS) -> list[dict]:
+    if tuple(fields) == RATE_FIELDS:
+        return [
+            {"update_date": update_date, "currency": currency, "code": code, "mid": mid}
+            for update_date, currency, code, mid in rates
+        ]
+    positions = [(field, RATE_FIELDS.index(field)) for field in fields]
+    return [{field: rate[position] for field, position in positions} for rate in rates]
+
+
+def _columns(rates: Sequence[Sequence], fields: Sequence[str] = COLUMNAR_FIELDS) -> dict:
+    columns = tuple(zip(*rates)) if rates else ((),) * len(RATE_FIELDS)
+    return {COLUMN_NAMES[field]: columns[RATE_FIELDS.index(field)] for field in fields}
+
+
+def rates_to_json(rates: Sequence[Sequence], fields: Sequence[str] = RATE_FIELDS) -> bytes:
+    """Serialize (update_date, currency, code, mid) rows straight to a JSON list of objects with the given fields."""
+    return orjson.dumps(_objects(rates, fields))
+
+
+def rates_to_columnar_json(rates: Sequence[Sequence], fields: Sequence[str] = COLUMNAR_FIELDS) -> bytes:
+    """Serialize (update_date, currency, code, mid) rows to JSON with one array per field, for charting clients."""
+    return orjson.dumps(_columns(rates, fields))
+
+
+def rate_groups_to_json(groups: Sequence[dict], columnar: bool = False) -> bytes:
+    """Serialize batch groups, each a dict whose "rates" are (update_date, currency, code, mid) rows."""
+    return orjson.dumps([{**group, "rates": _columns(group["rates"]) if columnar else _objects(group["rates"])}
+                         for group in groups])
+
+
+def aggregates_to_json(aggregates: Sequence[Sequence]) -> bytes:
+    """Serialize (period_start, currency, code, avg, min, max, first, last, observations) rows to JSON objects."""
+    return orjson.dumps([dict(zip(AGGREGATE_FIELDS, aggregate)) for aggregate in aggregates])
+
+
+def series_to_json(payload: dict) -> bytes:
+    """Serialize a payload holding NumPy arrays, NaN values become null."""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def rates_to_ndjson(rates: Sequence[Sequence]) -> bytes:
+    """Serialize rows to newline-delimited JSON, one rate object per line."""
+    return b"".join(
+        orjson.dumps({"update_date": update_date, "currency": currency, "code": code, "mid": mid}) + b"\n"
+        for update_date, currency, code, mid in rates
+    )
+
+
+def rates_to_csv(rates: Sequence[Sequence], header: bool = False) -> bytes:
+    """Serialize rows to CSV lines, optionally preceded by the header line."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(RATE_FIELDS)
+    writer.writerows(rates)
+    return buffer.getvalue().encode()
@@ -1,10 +1,21 @@
+import base64
+import binascii
+import hashlib
+import json
+from bisect import bisect_left, bisect_right
 from datetime import date, timedelta
+from itertools import groupby
 from json import JSONDecodeError
+from operator import itemgetter
+from typing import Iterable, Sequence
 
+from dateutil.relativedelta import relativedelta
 from fastapi import HTTPException
-from requests import Response
+from httpx import Response
 
-from models import Rate
+from helpers import metrics
+
+RateRecord = tuple[date, str, str, float]  # (update_date, currency, code, mid), column order of the rates table
 
 
 def parse_json_response(response: Response) -> dict:
@@ -17,51 +28,130 @@ def parse_json_response(response: Response) -> dict:
         raise HTTPException(status_code=error_code, detail=error_message)
 
 
-def split_fetch_period(start_date: date, end_date: date, split_period=90) -> list[tuple[date, date]]:
-    """Split the period between start_date and end_date into smaller periods defined by split_period."""
-    date_periods = []
-    current_start = start_date
-    while current_start < end_date:
-        current_end = min(current_start + timedelta(days=split_period - 1), end_date)
-        date_periods.append((current_start, current_end))
-        current_start = current_end + timedelta(days=1)
+def make_etag(payload: list | dict) -> str:
+    """Build a strong ETag from the JSON representation of a payload."""
+    body = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False).encode()
+    return f'"{hashlib.sha1(body).hexdigest()}"'
 
-    return date_periods
 
+def etag_matches(etag: str, if_none_match: str | None) -> bool:
+    """Whether an If-None-Match header holds the ETag, compared weakly as RFC 9110 requires, or is *."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+def parse_period(period: str, today: date) -> tuple[date, date]:
+    """
+    Resolve a YYYY, YYYY-QN, YYYY-MM or YYYY-MM-DD period into its first and last day. Years, quarters and months
+    end today at the latest. Raises ValueError for anything else.
+    """
+    if len(period) == 4:  # Year only: YYYY
+        year = int(period)
+        return date(year, 1, 1), min(date(year, 12, 31), today)
+
+    if 'Q' in period:  # Quarter: YYYY-QQ
+        year, quarter = period.split('-Q')
+        start_date = date(int(year), 3 * int(quarter) - 2, 1)
+        return start_date, min(start_date + relativedelta(months=3, days=-1), today)
+
+    if len(period.split('-')) == 2:  # Month: YYYY-MM
+        year, month = map(int, period.split('-'))
+        start_date = date(year, month, 1)
+        return start_date, min(start_date + relativedelta(months=1, days=-1), today)
 
-def get_new_rates(response: Response, rates_to_compare: set[tuple[date, str]]) -> list[Rate]:
-    """Extract new rates from the response and compare them with the existing ones. Return only new rates."""
-    data = parse_json_response(response)
-    new_rates = []
-    if not rates_to_compare:
-        rates_to_compare = set()
+    day = date.fromisoformat(period)  # Full date: YYYY-MM-DD
+    return day, day
 
-    for record in data:
-        rates_date = date.fromisoformat(record.get("effectiveDate"))
-        rates = record.get("rates")
 
-        new_rates.extend([
-            Rate(**rate, update_date=rates_date) for rate in rates
-            if (rates_date, rate.get("code")) not in rates_to_compare
-        ])
+def merge_periods(periods: Iterable[tuple[date, date]]) -> list[tuple[date, date]]:
+    """Merge overlapping or adjacent periods into a sorted list of disjoint ones."""
+    merged = []
+    for start_date, end_date in sorted(periods):
+        if merged and start_date <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_date))
+        else:
+            merged.append((start_date, end_date))
+    return merged
 
-    return new_rates
 
+def encode_cursor(update_date: date, code: str) -> str:
+    """Opaque continuation token of the last (update_date, code) of a page."""
+    return base64.urlsafe_b64encode(f"{update_date.isoformat()}|{code}".encode()).decode().rstrip("=")
 
-def get_new_code_rates(response: Response, code: str, rates_to_compare: set[tuple[date, float]]) -> list[Rate]:
-    """Extract new code-based rates from the response and compare them with the existing ones. Return only new rates."""
-    data = parse_json_response(response)
-    new_rates = []
-    if not rates_to_compare:
-        rates_to_compare = set()
 
-    dates_in_compare = {rate[0] for rate in rates_to_compare}  # Extract only dates, because we don't need mid
+def decode_cursor(cursor: str) -> tuple[date, str]:
+    """Key of a continuation token, raises ValueError if it is not one."""
+    try:
+        update_date, code = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        return date.fromisoformat(update_date), code
+    except (binascii.Error, UnicodeDecodeError) as error:
+        raise ValueError("Invalid cursor") from error
+
+
+def group_rates(rates: Sequence[Sequence], groups: list[tuple[date, date, str]]) -> list[list]:
+    """
+    Split (update_date, currency, code, mid) rows ordered by code and date into the rows of every (start_date,
+    end_date, code) group. Groups may overlap, each is located by bisecting the dates of its code.
+    """
+    rows_by_code = {code: list(rows) for code, rows in groupby(rates, key=itemgetter(2))}
+    dates_by_code = {code: [row[0] for row in rows] for code, rows in rows_by_code.items()}
+    grouped = []
+    for start_date, end_date, code in groups:
+        rows, dates = rows_by_code.get(code, []), dates_by_code.get(code, [])
+        grouped.append(rows[bisect_left(dates, start_date):bisect_right(dates, end_date)])
+    return grouped
+
+
+def split_fetch_period(start_date: date, end_date: date, split_period=90) -> list[tuple[date, date]]:
+    """Split the period between start_date and end_date into smaller periods defined by split_period."""
+    date_periods = []
+    current_start = start_date
+    while current_start <= end_date:
+        current_end = min(current_start + timedelta(days=split_period - 1), end_date)
+        date_periods.append((current_start, current_end))
+        current_start = current_end + timedelta(days=1)
+
+    return date_periods
 
-    currency = data.get("currency")
-    for rate in data.get("rates"):
-        rate_date = date.fromisoformat(rate.get("effectiveDate"))
-        mid = rate.get("mid")
-        if rate_date not in dates_in_compare:
-            new_rates.append(Rate(currency=currency, code=code, mid=mid, update_date=rate_date))
 
-    return new_rates
+def find_missing_periods(start_date: date, end_date: date, stored_dates: set[date]) -> list[tuple[date, date]]:
+    """
+    Group business days of start_date..end_date missing from stored_dates into contiguous periods. Weekends do not
+    split a period, so e.g. a missing Friday and Monday are fetched with a single request.
+    """
+    periods = []
+    day = start_date
+    while day <= end_date:
+        if day.weekday() < 5 and day not in stored_dates:
+            # Extend the last period if only weekend days lie between, a stored business day closes it
+            if periods and all((periods[-1][1] + timedelta(days=offset)).weekday() >= 5
+                               for offset in range(1, (day - periods[-1][1]).days)):
+                periods[-1] = (periods[-1][0], day)
+            else:
+                periods.append((day, day))
+        day += timedelta(days=1)
+    return periods
+
+
+def parse_table_rates(response: Response) -> list[RateRecord]:
+    """Extract rate records of all currencies from a table response."""
+    with metrics.stage("json_parse"):
+        data = parse_json_response(response)
+        return [
+            (date.fromisoformat(record.get("effectiveDate")), rate.get("currency"), rate.get("code"), rate.get("mid"))
+            for record in data
+            for rate in record.get("rates")
+        ]
+
+
+def parse_code_rates(response: Response, code: str) -> list[RateRecord]:
+    """Extract rate records of a single currency from a code-based response."""
+    with metrics.stage("json_parse"):
+        data = parse_json_response(response)
+        currency = data.get("currency")
+        return [
+            (date.fromisoformat(rate.get("effectiveDate")), currency, code, rate.get("mid"))
+            for rate in data.get("rates")
+        ]
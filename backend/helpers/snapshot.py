@@ -0,0 +1,205 @@
+import asyncio
+import fcntl
+import os
+import shutil
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+from sqlalchemy import select
+
+from helpers.analytics import RateMatrix, build_rate_matrix
+from models import Currency, Rate
+from services.db_service import AsyncSessionLocal
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".snapshot")  # Empty disables the snapshot
+SNAPSHOT_ARRAYS = ("dates", "codes", "currencies", "mids")
+SNAPSHOT_KEEP_VERSIONS = 2  # Readers of other workers may still be opening the previous version
+
+
+class RateSnapshot(NamedTuple):
+    dates: np.ndarray  # datetime64[D], sorted
+    codes: np.ndarray  # str, sorted
+    currencies: np.ndarray  # str, currency name of every code
+    mids: np.ndarray  # float64 of shape (dates, codes), NaN where a code has no rate for the date
+
+    def slice(self, start_date: date, end_date: date, codes: list[str] | None = None) -> "RateSnapshot":
+        """Select a date range and optionally codes. Date ranges and single codes are views, no data is copied."""
+        start = np.searchsorted(self.dates, np.datetime64(start_date), side="left")
+        end = np.searchsorted(self.dates, np.datetime64(end_date), side="right")
+        dates, mids = self.dates[start:end], self.mids[start:end]
+        if codes is None:
+            return RateSnapshot(dates, self.codes, self.currencies, mids)
+
+        columns = np.flatnonzero(np.isin(self.codes, codes))
+        if len(columns) == 1:
+            columns = slice(columns[0], columns[0] + 1)
+        return RateSnapshot(dates, self.codes[columns], self.currencies[columns], mids[:, columns])
+
+    def to_rows(self) -> list[tuple[str, str, str, float]]:
+        """Stored rates as (update_date, currency, code, mid) rows ordered by date and code."""
+        date_index, code_index = np.nonzero(~np.isnan(self.mids))
+        return list(zip(
+            np.datetime_as_string(self.dates[date_index], unit="D").tolist(),
+            self.currencies[code_index].tolist(),
+            self.codes[code_index].tolist(),
+            self.mids[date_index, code_index].tolist(),
+        ))
+
+    def to_matrix(self) -> RateMatrix:
+        """Analytics matrix without dates and codes lacking any rate, like a matrix loaded from the database."""
+        valid = ~np.isnan(self.mids)
+        rows, columns = valid.any(axis=1), valid.any(axis=0)
+        return RateMatrix(self.dates[rows], self.codes[columns].tolist(), np.asarray(self.mids[rows][:, columns]))
+
+
+def build_snapshot(rows: list) -> RateSnapshot:
+    """Build a snapshot from (update_date, currency, code, mid) rows."""
+    if not rows:
+        return RateSnapshot(np.array([], dtype="datetime64[D]"), np.array([], dtype=str), np.array([], dtype=str),
+                            np.empty((0, 0)))
+    update_dates, currencies, codes, mids = zip(*rows)
+    matrix = build_rate_matrix(
+        np.array(update_dates, dtype="datetime64[D]"), np.array(codes), np.array(mids, dtype=np.float64)
+    )
+    names = dict(zip(codes, currencies))
+    return RateSnapshot(matrix.dates, np.array(matrix.codes), np.array([names[code] for code in matrix.codes]),
+                        matrix.mids)
+
+
+def merge_snapshots(current: RateSnapshot, update: RateSnapshot) -> RateSnapshot:
+    """Overlay the rates of an update onto the current snapshot, extending its dates and codes as needed."""
+    dates, codes = np.union1d(current.dates, update.dates), np.union1d(current.codes, update.codes)
+    mids = np.full((len(dates), len(codes)), np.nan)
+    mids[np.ix_(np.searchsorted(dates, current.dates), np.searchsorted(codes, current.codes))] = current.mids
+
+    cells = np.ix_(np.searchsorted(dates, update.dates), np.searchsorted(codes, update.codes))
+    mids[cells] = np.where(np.isnan(update.mids), mids[cells], update.mids)
+
+    names = dict(zip(current.codes.tolist(), current.currencies.tolist()))
+    names.update(zip(update.codes.tolist(), update.currencies.tolist()))
+    return RateSnapshot(dates, codes, np.array([names[code] for code in codes.tolist()]), mids)
+
+
+class SnapshotStore:
+    """
+    Versioned snapshot of the rates table as .npy files, opened memory-mapped. A new version is written next to the
+    current one and published by atomically replacing the CURRENT pointer, so every worker maps the same page-cached
+    files and readers never see a partial write.
+    """
+
+    def __init__(self, directory: str | None):
+        self.directory = directory
+        self._snapshot: RateSnapshot | None = None
+        self._version: str | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @property
+    def version(self) -> str | None:
+        """Version of the snapshot returned by the last load."""
+        return self._version
+
+    @property
+    def _current_path(self) -> str:
+        return os.path.join(self.directory, "CURRENT")
+
+    def _read_version(self) -> str | None:
+        try:
+            with open(self._current_path) as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> RateSnapshot | None:
+        """The current snapshot, memory-mapped, re-opened only when another version has been published."""
+        if not self.enabled:
+            return None
+        for _ in range(2):  # The version read may be pruned by another worker before it is opened
+            version = self._read_version()
+            if version is None or version == self._version:
+                return self._snapshot
+            try:
+                self._snapshot = RateSnapshot(*(
+                    np.load(os.path.join(self.directory, version, f"{name}.npy"), mmap_mode="r")
+                    for name in SNAPSHOT_ARRAYS
+                ))
+                self._version = version
+            except FileNotFoundError:
+                continue
+        return self._snapshot
+
+    def stats(self) -> dict:
+        snapshot = self.load()
+        if snapshot is None:
+            return {"enabled": self.enabled, "version": None}
+        return {
+            "enabled": True,
+            "version": self._version,
+            "dates": len(snapshot.dates),
+            "codes": len(snapshot.codes),
+            "date_from": str(snapshot.dates[0]) if len(snapshot.dates) else None,
+            "date_to": str(snapshot.dates[-1]) if len(snapshot.dates) else None,
+            "bytes": sum(array.nbytes for array in snapshot),
+        }
+
+    async def refresh(self, date_from: date | None = None, date_to: date | None = None) -> None:
+        """
+        Update the snapshot with the rates of date_from..date_to from the database. Without a range, or if there is no
+        snapshot yet, it is rebuilt from the whole table.
+        """
+        if not self.enabled:
+            return
+        async with self._lock:
+            if date_from is None or self._read_version() is None:
+                date_from = date_to = None
+            query = select(Rate.update_date, Currency.currency, Currency.code, Rate.mid).join(Currency)
+            if date_from is not None:
+                query = query.where(Rate.update_date.between(date_from, date_to))
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(query)).all()
+            await asyncio.to_thread(self._publish, build_snapshot(rows), date_from is not None)
+
+    def _publish(self, update: RateSnapshot, incremental: bool) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # Serializes writers of all workers
+            current_version = self._read_version()
+            if incremental and current_version is not None:
+                current = RateSnapshot(*(
+                    np.load(os.path.join(self.directory, current_version, f"{name}.npy"))
+                    for name in SNAPSHOT_ARRAYS
+                ))
+                update = merge_snapshots(current, update)
+
+            version = f"{int(current_version or 0) + 1:08d}"
+            temporary_directory = os.path.join(self.directory, f"{version}.tmp")
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+            os.makedirs(temporary_directory)
+            for name, array in zip(SNAPSHOT_ARRAYS, update):
+                np.save(os.path.join(temporary_directory, f"{name}.npy"), np.ascontiguousarray(array))
+            os.replace(temporary_directory, os.path.join(self.directory, version))
+
+            with open(f"{self._current_path}.tmp", "w") as file:
+                file.write(version)
+            os.replace(f"{self._current_path}.tmp", self._current_path)
+
+            versions = sorted(entry for entry in os.listdir(self.directory) if entry.isdigit())
+            for old_version in versions[:-SNAPSHOT_KEEP_VERSIONS]:
+                shutil.rmtree(os.path.join(self.directory, old_version), ignore_errors=True)
+
+
+rate_snapshot = SnapshotStore(SNAPSHOT_DIR)
+
+
+if __name__ == "__main__":
+    async def rebuild() -> None:
+        """Rebuild the snapshot from the whole rates table, e.g. after rates were loaded outside of the API."""
+        from services.db_service import async_engine
+        await rate_snapshot.refresh()
+        await async_engine.dispose()
+
+    asyncio.run(rebuild())
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import date
+from typing import AsyncIterable, AsyncIterator
+
+import ijson
+
+from helpers import metrics
+from helpers.services import RateRecord
+
+STREAM_QUEUE_RECORDS = 1000  # Records buffered between concurrent streams and their consumer
+
+
+class RateRecordParser:
+    """
+    Push parser turning chunks of an NBP table response (or rates response of a single code) into rate records as
+    soon as each rate object is complete, so a response never has to be held in memory as a whole.
+    """
+
+    def __init__(self, code: str | None = None):
+        self.code = code
+        self._events = ijson.sendable_list()
+        self._parser = ijson.parse_coro(self._events, use_float=True)
+        self._rate_prefix = "rates.item" if code else "item.rates.item"
+        self._date_prefix = "rates.item.effectiveDate" if code else "item.effectiveDate"
+        self._update_date: date | None = None
+        self._currency: str | None = None
+        self._rate: dict = {}
+
+    def feed(self, chunk: bytes) -> list[RateRecord]:
+        with metrics.stage("json_parse"):
+            self._parser.send(chunk)
+            return self._drain()
+
+    def close(self) -> list[RateRecord]:
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self) -> list[RateRecord]:
+        records = []
+        for prefix, event, value in self._events:
+            if prefix == self._date_prefix:
+                self._update_date = date.fromisoformat(value)
+            elif prefix == "currency":  # Code responses name the currency once, before the rates
+                self._currency = value
+            elif prefix.startswith(self._rate_prefix + "."):
+                self._rate[prefix.rsplit(".", 1)[1]] = value
+            elif prefix == self._rate_prefix and event == "end_map":
+                rate, self._rate = self._rate, {}
+                if self.code:
+                    records.append((self._update_date, self._currency, self.code, rate.get("mid")))
+                else:
+                    records.append((self._update_date, rate.get("currency"), rate.get("code"), rate.get("mid")))
+        del self._events[:]
+        return records
+
+
+class NewRecordFilter:
+    """Passes on only records whose (update_date, code) is not among the stored keys, counting the others."""
+
+    def __init__(self, records: AsyncIterable[RateRecord], stored_keys: set[tuple[date, str]]):
+        self.records = records
+        self.stored_keys = stored_keys
+        self.skipped = 0
+
+    async def __aiter__(self) -> AsyncIterator[RateRecord]:
+        async for record in self.records:
+            if (record[0], record[2]) in self.stored_keys:
+                self.skipped += 1
+            else:
+                yield record
+
+
+async def merge_streams(streams: list[AsyncIterable[RateRecord]]) -> AsyncIterator[RateRecord]:
+    """
+    Consume several record streams concurrently and yield their records as they arrive. The queue in between is
+    bounded, so slow consumers apply backpressure to the streams instead of buffering them.
+    """
+    if len(streams) == 1:
+        async for record in streams[0]:
+            yield record
+        return
+
+    queue: asyncio.Queue = asyncio.Queue(STREAM_QUEUE_RECORDS)
+    done = object()
+
+    async def pump(stream: AsyncIterable[RateRecord]) -> None:
+        async for record in stream:
+            await queue.put(record)
+
+    async def pump_all() -> None:
+        try:
+            async with asyncio.TaskGroup() as group:  # A failing stream cancels the others
+                for stream in streams:
+                    group.create_task(pump(stream))
+        except ExceptionGroup as error:
+            raise error.exceptions[0]
+        finally:
+            await queue.put(done)
+
+    task = asyncio.create_task(pump_all())
+    try:
+        while (record := await queue.get()) is not done:
+            yield record
+        await task  # Re-raises an error of any stream
+    finally:
+        task.cancel()
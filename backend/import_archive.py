@@ -0,0 +1,55 @@
+"""
+Bulk load NBP table A yearly archive CSVs (archiwum_tab_a_YYYY.csv, published by NBP next to the API) without any
+network access, e.g. to bootstrap a fresh environment with the whole history after `python -m migrate`:
+
+    python -m import_archive archives/archiwum_tab_a_*.csv
+
+Every file is loaded in its own transaction, rates already stored are skipped, so files can be imported again.
+"""
+import argparse
+import asyncio
+import time
+from typing import AsyncIterator
+
+from helpers import queries
+from helpers.archive import ARCHIVE_CHUNK_BYTES, ARCHIVE_ENCODING
+from helpers.ingest import IngestResult
+from services.db_service import AsyncSessionLocal, async_engine
+
+
+async def read_chunks(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := file.read(ARCHIVE_CHUNK_BYTES):
+            yield chunk
+
+
+async def import_files(paths: list[str], encoding: str = ARCHIVE_ENCODING, jobs: int = 1,
+                       verbose: bool = True) -> list[IngestResult]:
+    """Load archive files, up to `jobs` of them concurrently, returns the result of every file."""
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def import_file(path: str) -> IngestResult:
+        async with semaphore, AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            result = await queries.add_archive_to_db(db, read_chunks(path), encoding)
+        if verbose:
+            print(f"{path}: {result.inserted} added, {result.skipped} skipped in {time.perf_counter() - started:.2f}s")
+        return result
+
+    try:
+        return await asyncio.gather(*(import_file(path) for path in paths))
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("paths", nargs="+", metavar="FILE")
+    parser.add_argument("--encoding", default=ARCHIVE_ENCODING)
+    parser.add_argument("--jobs", type=int, default=1, help="Files loaded concurrently")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = asyncio.run(import_files(args.paths, args.encoding, args.jobs))
+    print(f"{sum(result.inserted for result in results)} rates added, "
+          f"{sum(result.skipped for result in results)} skipped in {time.perf_counter() - started:.2f}s")
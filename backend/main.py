@@ -1,22 +1,68 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from routers import rate_router
-from services.db_service import Base, engine
+from helpers.asof import as_of_index
+from helpers.events import rate_events
+from helpers.metrics import MetricsMiddleware
+from helpers.snapshot import rate_snapshot
+from routers import analytics_router, backfill_router, export_router, metrics_router, rate_router, stats_router
+from services import backfill_service, scheduler_service
+from services.db_service import async_engine, warm_pool
+from services.nbp_service import nbp_client
+from services.scheduler_service import ingest_scheduler
+
 
-Base.metadata.create_all(bind=engine)
-app = FastAPI()
-app.include_router(rate_router)
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """
+    Warm up every worker before it accepts requests: open pool connections, map the snapshot (built here only if
+    the migration step did not), load the as-of index and listen for commits of other workers. The schema is left to
+    `python -m migrate`.
+    """
+    await warm_pool()
+    if rate_snapshot.enabled and rate_snapshot.load() is None:
+        await rate_snapshot.refresh()
+    await as_of_index.load()
+    rate_events.start()
+    await backfill_service.resume_jobs(nbp_client)
+    if scheduler_service.SCHEDULER_ENABLED:
+        ingest_scheduler.start()
+    yield
+    await ingest_scheduler.stop()
+    await backfill_service.stop_jobs()
+    await rate_events.stop()
+    await nbp_client.aclose()
+    await async_engine.dispose()
 
-origins = [
+
+ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000"
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+def create_app() -> FastAPI:
+    """Build the app. Building it has no side effects, so it can be imported once and forked into workers."""
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(rate_router)
+    app.include_router(analytics_router)
+    app.include_router(backfill_router)
+    app.include_router(export_router)
+    app.include_router(stats_router)
+    app.include_router(metrics_router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Link"],  # Pagination of GET /currencies/{request_date}
+    )
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,42 @@
+"""
+Schema migration step, run once per deployment before the app workers start, which never touch the schema:
+
+    python -m migrate
+
+Creates missing tables and the rate partitions of the coming year, and builds the rate snapshot if enabled and
+missing. Concurrent runs (e.g. of several containers) wait for each other on an advisory lock. Databases created by
+earlier versions are upgraded with the scripts in migrations/ beforehand.
+"""
+import asyncio
+import time
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+
+import models  # noqa: F401, registers the tables
+from helpers.snapshot import rate_snapshot
+from services.db_service import Base, async_engine, engine
+
+MIGRATE_LOCK_KEY = 4_621_003  # Advisory lock id, next to the scheduler's
+
+
+def migrate() -> None:
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATE_LOCK_KEY})
+        Base.metadata.create_all(bind=connection)
+        connection.execute(text("SELECT ensure_rate_partitions(:date_from, :date_to)"),
+                           {"date_from": date.today(), "date_to": date.today() + relativedelta(years=1)})
+    if rate_snapshot.enabled and rate_snapshot.load() is None:
+        asyncio.run(build_snapshot())
+
+
+async def build_snapshot() -> None:
+    await rate_snapshot.refresh()
+    await async_engine.dispose()  # Connections are bound to this event loop
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    migrate()
+    print(f"schema up to date in {time.perf_counter() - started:.2f}s")
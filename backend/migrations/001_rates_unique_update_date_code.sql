@@ -0,0 +1,8 @@
+-- Databases created before the unique (update_date, code) index: drop duplicates, keeping the oldest row,
+-- then replace the single-column update_date index with the unique composite one.
+DELETE FROM rates r
+USING rates d
+WHERE r.update_date = d.update_date AND r.code = d.code AND r.id > d.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_rates_update_date_code ON rates (update_date, code);
+DROP INDEX IF EXISTS ix_rates_update_date;
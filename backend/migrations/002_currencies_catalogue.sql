@@ -0,0 +1,28 @@
+-- Databases created before the currencies catalogue: create it, keep it populated by a trigger on rates
+-- and fill it from the existing history.
+CREATE TABLE IF NOT EXISTS currencies (
+    id SMALLSERIAL PRIMARY KEY,
+    code VARCHAR NOT NULL UNIQUE,
+    currency VARCHAR NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION add_rate_currencies() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO currencies (code, currency)
+    SELECT DISTINCT ON (n.code) n.code, n.currency
+    FROM new_rates n
+    WHERE NOT EXISTS (SELECT 1 FROM currencies c WHERE c.code = n.code)
+    ORDER BY n.code
+    ON CONFLICT (code) DO NOTHING;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rates_add_currencies ON rates;
+CREATE TRIGGER rates_add_currencies AFTER INSERT ON rates
+REFERENCING NEW TABLE AS new_rates
+FOR EACH STATEMENT EXECUTE FUNCTION add_rate_currencies();
+
+INSERT INTO currencies (code, currency)
+SELECT DISTINCT ON (code) code, currency FROM rates ORDER BY code, update_date DESC
+ON CONFLICT (code) DO NOTHING;
@@ -0,0 +1,21 @@
+-- Databases created before the aggregate table: create it and compute aggregates of the existing history.
+CREATE TABLE IF NOT EXISTS rate_aggregates (
+    period VARCHAR NOT NULL,
+    period_start DATE NOT NULL,
+    code VARCHAR NOT NULL,
+    avg_mid DOUBLE PRECISION NOT NULL,
+    min_mid DOUBLE PRECISION NOT NULL,
+    max_mid DOUBLE PRECISION NOT NULL,
+    first_mid DOUBLE PRECISION NOT NULL,
+    last_mid DOUBLE PRECISION NOT NULL,
+    observations INTEGER NOT NULL,
+    PRIMARY KEY (period, period_start, code)
+);
+
+INSERT INTO rate_aggregates (period, period_start, code, avg_mid, min_mid, max_mid, first_mid, last_mid, observations)
+SELECT p.period, date_trunc(p.period, r.update_date)::date, r.code, avg(r.mid), min(r.mid), max(r.mid),
+       (array_agg(r.mid ORDER BY r.update_date))[1], (array_agg(r.mid ORDER BY r.update_date DESC))[1], count(*)
+FROM rates r
+CROSS JOIN (VALUES ('month'), ('quarter'), ('year')) AS p(period)
+GROUP BY 1, 2, 3
+ON CONFLICT (period, period_start, code) DO NOTHING;
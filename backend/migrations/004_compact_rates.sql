@@ -0,0 +1,55 @@
+-- Databases created before the compact layout: move rates to (update_date, currency_id, mid_micros) rows keyed by
+-- the currencies dimension, with mids as exact integer millionths, replacing the catalogue trigger and the
+-- single-column indexes. See 005 for the optional yearly partitioning.
+BEGIN;
+
+INSERT INTO currencies (code, currency)
+SELECT DISTINCT ON (code) code, currency FROM rates ORDER BY code, update_date DESC
+ON CONFLICT (code) DO NOTHING;
+
+DROP TRIGGER IF EXISTS rates_add_currencies ON rates;
+DROP FUNCTION IF EXISTS add_rate_currencies();
+
+ALTER TABLE rates RENAME TO rates_legacy;
+ALTER INDEX rates_pkey RENAME TO rates_legacy_pkey;
+
+CREATE TABLE rates (
+    update_date DATE NOT NULL,
+    currency_id SMALLINT NOT NULL REFERENCES currencies (id),
+    mid_micros INTEGER NOT NULL,
+    PRIMARY KEY (update_date, currency_id)
+);
+
+INSERT INTO rates (update_date, currency_id, mid_micros)
+SELECT r.update_date, c.id, round(r.mid * 1000000)::INTEGER
+FROM rates_legacy r
+JOIN currencies c ON c.code = r.code
+ORDER BY r.update_date, c.id;
+
+DROP TABLE rates_legacy;
+
+CREATE OR REPLACE FUNCTION ensure_rate_partitions(date_from DATE, date_to DATE) RETURNS void AS $$
+DECLARE
+    year INTEGER;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'rates'::regclass) THEN
+        RETURN;
+    END IF;
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_rate_partitions'));
+    CREATE TABLE IF NOT EXISTS rates_default PARTITION OF rates DEFAULT;
+    FOR year IN EXTRACT(YEAR FROM date_from)::INTEGER..EXTRACT(YEAR FROM date_to)::INTEGER LOOP
+        CONTINUE WHEN to_regclass(format('rates_%s', year)) IS NOT NULL OR EXISTS (
+            SELECT 1 FROM rates_default
+            WHERE update_date >= make_date(year, 1, 1) AND update_date < make_date(year + 1, 1, 1)
+        );
+        EXECUTE format(
+            'CREATE TABLE rates_%s PARTITION OF rates FOR VALUES FROM (%L) TO (%L)',
+            year, make_date(year, 1, 1), make_date(year + 1, 1, 1)
+        );
+    END LOOP;
+END
+$$ LANGUAGE plpgsql;
+
+COMMIT;
+
+ANALYZE rates;
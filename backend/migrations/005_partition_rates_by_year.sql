@@ -0,0 +1,27 @@
+-- Optional, after 004: partition rates by year of update_date, for deployments running with RATES_PARTITIONED=true.
+-- Partitions cover 2002 (the start of the NBP API archive) to next year, other dates go to rates_default.
+BEGIN;
+
+ALTER TABLE rates RENAME TO rates_unpartitioned;
+ALTER INDEX rates_pkey RENAME TO rates_unpartitioned_pkey;
+
+CREATE TABLE rates (
+    update_date DATE NOT NULL,
+    currency_id SMALLINT NOT NULL REFERENCES currencies (id),
+    mid_micros INTEGER NOT NULL,
+    PRIMARY KEY (update_date, currency_id)
+) PARTITION BY RANGE (update_date);
+
+SELECT ensure_rate_partitions(
+    least(DATE '2002-01-01', (SELECT min(update_date) FROM rates_unpartitioned)),
+    (current_date + INTERVAL '1 year')::DATE
+);
+
+INSERT INTO rates (update_date, currency_id, mid_micros)
+SELECT update_date, currency_id, mid_micros FROM rates_unpartitioned ORDER BY update_date, currency_id;
+
+DROP TABLE rates_unpartitioned;
+
+COMMIT;
+
+ANALYZE rates;
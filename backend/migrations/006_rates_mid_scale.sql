@@ -0,0 +1,12 @@
+-- After 004 (and 005): keep mids as integer hundred-millionths, exact for the 8 decimals of per-unit mids of
+-- currencies quoted per 10000 units in the NBP archives (e.g. IDR), which integer millionths rounded to 6 decimals.
+-- Rates stored before keep their 6 decimals; importing the archives again does not correct them, as stored rates
+-- are skipped, so delete and import the affected codes again where it matters. Also applies to the partitions.
+BEGIN;
+
+ALTER TABLE rates RENAME COLUMN mid_micros TO mid_scaled;
+ALTER TABLE rates ALTER COLUMN mid_scaled TYPE BIGINT USING mid_scaled::BIGINT * 100;
+
+COMMIT;
+
+ANALYZE rates;
@@ -1,3 +1,6 @@
+from .aggregate import RateAggregate
+from .backfill import BackfillJob, BackfillChunk
+from .currency import Currency
 from .rate import Rate
 
-__all__ = ['Rate']
+__all__ = ['Rate', 'Currency', 'RateAggregate', 'BackfillJob', 'BackfillChunk']
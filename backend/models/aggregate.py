@@ -0,0 +1,19 @@
+from datetime import date
+
+from sqlalchemy.orm import Mapped, mapped_column
+
+from services.db_service import Base
+
+
+class RateAggregate(Base):
+    """Per code statistics of rates in a calendar month, quarter or year, refreshed on every ingest."""
+    __tablename__ = 'rate_aggregates'
+    period: Mapped[str] = mapped_column(primary_key=True)  # month, quarter, year
+    period_start: Mapped[date] = mapped_column(primary_key=True)
+    code: Mapped[str] = mapped_column(primary_key=True)
+    avg_mid: Mapped[float] = mapped_column()
+    min_mid: Mapped[float] = mapped_column()
+    max_mid: Mapped[float] = mapped_column()
+    first_mid: Mapped[float] = mapped_column()
+    last_mid: Mapped[float] = mapped_column()
+    observations: Mapped[int] = mapped_column()
@@ -0,0 +1,32 @@
+from datetime import date, datetime
+
+from sqlalchemy import ForeignKey, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from services.db_service import Base
+
+
+class BackfillJob(Base):
+    __tablename__ = 'backfill_jobs'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    date_from: Mapped[date] = mapped_column()
+    date_to: Mapped[date] = mapped_column()
+    status: Mapped[str] = mapped_column(default="pending", index=True)  # pending, running, completed, failed
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    started_at: Mapped[datetime | None] = mapped_column()
+    finished_at: Mapped[datetime | None] = mapped_column()
+
+
+class BackfillChunk(Base):
+    __tablename__ = 'backfill_chunks'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    job_id: Mapped[int] = mapped_column(ForeignKey("backfill_jobs.id", ondelete="CASCADE"), index=True)
+    date_from: Mapped[date] = mapped_column()
+    date_to: Mapped[date] = mapped_column()
+    status: Mapped[str] = mapped_column(default="pending")  # pending, done, failed
+    rows_inserted: Mapped[int] = mapped_column(default=0)
+    rows_skipped: Mapped[int] = mapped_column(default=0)
+    error: Mapped[str | None] = mapped_column()
+    finished_at: Mapped[datetime | None] = mapped_column()
+
+    __table_args__ = (UniqueConstraint("job_id", "date_from"),)
@@ -0,0 +1,12 @@
+from sqlalchemy import SmallInteger
+from sqlalchemy.orm import Mapped, mapped_column
+
+from services.db_service import Base
+
+
+class Currency(Base):
+    """Currency dimension of rates, filled with new codes by every load before its rates are merged."""
+    __tablename__ = 'currencies'
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    code: Mapped[str] = mapped_column(unique=True)
+    currency: Mapped[str] = mapped_column()
@@ -1,17 +1,57 @@
-from ast import Index
+import os
 from datetime import date
 
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import BigInteger, DDL, Float, ForeignKey, SmallInteger, cast, event
+from sqlalchemy.orm import Mapped, column_property, mapped_column
 
 from services.db_service import Base
 
+MID_SCALE = 100_000_000  # Mids are stored exactly as integer hundred-millionths: NBP publishes 4 to 6 decimals,
+# archive rates of 10000 units (e.g. IDR) have 8 decimals per unit
+RATES_PARTITIONED = os.getenv("RATES_PARTITIONED", "false").lower() == "true"  # Yearly range partitions
+
 
 class Rate(Base):
+    """
+    One mid rate per day and currency. Codes and names are kept once in the currency dimension, so a row is a date,
+    a smallint key and a scaled integer. The primary key also serves update_date range scans.
+    """
     __tablename__ = 'rates'
-    id: Mapped[int] = mapped_column(primary_key=True)
-    update_date: Mapped[date] = mapped_column(index=True)
-    currency: Mapped[str] = mapped_column(index=True)
-    code: Mapped[str] = mapped_column(index=True)
-    mid: Mapped[float] = mapped_column()
+    update_date: Mapped[date] = mapped_column(primary_key=True)
+    currency_id: Mapped[int] = mapped_column(SmallInteger, ForeignKey("currencies.id"), primary_key=True)
+    mid_scaled: Mapped[int] = mapped_column(BigInteger)
+    mid: Mapped[float] = column_property(cast(mid_scaled, Float) / MID_SCALE)
+
+    __table_args__ = {"postgresql_partition_by": "RANGE (update_date)"} if RATES_PARTITIONED else {}
+
+
+# Creates the yearly partitions covering a date range, a no-op while rates is a plain table. Rates of years without
+# a partition land in the default one; a year already holding rows there keeps them there. Partitions take an
+# exclusive lock on rates, so they are created ahead (with the table and at startup), never by loads.
+RATE_PARTITIONS_FUNCTION = DDL("""
+    CREATE OR REPLACE FUNCTION ensure_rate_partitions(date_from DATE, date_to DATE) RETURNS void AS $$
+    DECLARE
+        year INTEGER;
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'rates'::regclass) THEN
+            RETURN;
+        END IF;
+        PERFORM pg_advisory_xact_lock(hashtext('ensure_rate_partitions'));
+        CREATE TABLE IF NOT EXISTS rates_default PARTITION OF rates DEFAULT;
+        FOR year IN EXTRACT(YEAR FROM date_from)::INTEGER..EXTRACT(YEAR FROM date_to)::INTEGER LOOP
+            CONTINUE WHEN to_regclass(format('rates_%%s', year)) IS NOT NULL OR EXISTS (
+                SELECT 1 FROM rates_default
+                WHERE update_date >= make_date(year, 1, 1) AND update_date < make_date(year + 1, 1, 1)
+            );
+            EXECUTE format(
+                'CREATE TABLE rates_%%s PARTITION OF rates FOR VALUES FROM (%%L) TO (%%L)',
+                year, make_date(year, 1, 1), make_date(year + 1, 1, 1)
+            );
+        END LOOP;
+    END
+    $$ LANGUAGE plpgsql;
+
+    SELECT ensure_rate_partitions(DATE '2002-01-01', (current_date + INTERVAL '1 year')::DATE);
+""")
 
-    date_code_index = Index( ("update_date", "code"), ) # Indexing together for faster search
+event.listen(Rate.__table__, "after_create", RATE_PARTITIONS_FUNCTION)
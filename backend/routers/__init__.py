@@ -1,3 +1,9 @@
+from .analytics import router as analytics_router
+from .backfill import router as backfill_router
+from .export import router as export_router
+from .metrics import router as metrics_router
 from .rate import router as rate_router
+from .stats import router as stats_router
 
-__all__ = ["rate_router"]
+__all__ = ["rate_router", "analytics_router", "backfill_router", "export_router", "stats_router",
+           "metrics_router"]
@@ -0,0 +1,104 @@
+from datetime import date
+from typing import Annotated
+
+import numpy as np
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import analytics, exceptions, metrics, serializers
+from helpers.snapshot import rate_snapshot
+from services.db_service import get_async_db
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+async def get_rate_matrix(
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        date_from: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+        date_to: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+        codes: Annotated[list[str] | None, Query(alias="code", description="Currency codes, all if omitted")] = None,
+) -> analytics.RateMatrix:
+    if date_from > date_to:
+        exceptions.raise_400_bad_request("The beginning date cannot be older than the end date.")
+
+    codes = [code.upper() for code in codes] if codes else None
+    snapshot = rate_snapshot.load()
+    if snapshot is not None:  # Slicing the shared memory-mapped snapshot spares a query of every row
+        matrix = snapshot.slice(date_from, date_to, codes).to_matrix()
+    else:
+        matrix = await analytics.load_rate_matrix(db, date_from, date_to, codes)
+    if not matrix.codes:
+        exceptions.raise_404_not_found("No rates found for the requested period. Try to download them first.")
+    return matrix
+
+
+def by_code(codes: list[str], values: np.ndarray) -> dict[str, np.ndarray]:
+    """Split a date x code matrix into contiguous per code series."""
+    return dict(zip(codes, np.ascontiguousarray(values.T)))
+
+
+def iso_dates(dates: np.ndarray) -> list[str]:
+    return np.datetime_as_string(dates, unit="D").tolist()
+
+
+def json_response(payload: dict) -> Response:
+    with metrics.stage("serialize"):
+        body = serializers.series_to_json(payload)
+    return Response(body, media_type="application/json")
+
+
+@router.get("/returns")
+async def get_log_returns(matrix: Annotated[analytics.RateMatrix, Depends(get_rate_matrix)]):
+    return json_response({
+        "dates": iso_dates(matrix.dates),
+        "returns": by_code(matrix.codes, analytics.log_returns(matrix.mids)),
+    })
+
+
+@router.get("/rolling")
+async def get_rolling_statistics(
+        matrix: Annotated[analytics.RateMatrix, Depends(get_rate_matrix)],
+        window: Annotated[int, Query(ge=2, le=1000, description="Number of observations per window")] = 20,
+):
+    mean, std = analytics.rolling_mean_std(matrix.mids, window)
+    return json_response({
+        "dates": iso_dates(matrix.dates),
+        "window": window,
+        "mean": by_code(matrix.codes, mean),
+        "std": by_code(matrix.codes, std),
+    })
+
+
+@router.get("/summary")
+async def get_summary(matrix: Annotated[analytics.RateMatrix, Depends(get_rate_matrix)]):
+    statistics = {name: values.tolist() for name, values in analytics.summary(matrix.mids).items()}
+    return json_response({
+        code: {name: values[index] for name, values in statistics.items()}
+        for index, code in enumerate(matrix.codes)
+    })
+
+
+@router.get("/cross")
+async def get_cross_rates(
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        date_from: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+        date_to: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+        pairs: Annotated[list[str], Query(alias="pair", description="Currency pairs as BASE/QUOTE, e.g. USD/EUR")],
+):
+    try:
+        parsed_pairs = [tuple(pair.upper().split("/")) for pair in pairs]
+        if any(len(pair) != 2 for pair in parsed_pairs):
+            raise ValueError
+    except ValueError:
+        exceptions.raise_400_bad_request("Invalid currency pair. Use BASE/QUOTE, e.g. USD/EUR.")
+
+    codes = sorted({code for pair in parsed_pairs for code in pair} - {analytics.BASE_CODE})
+    matrix = await get_rate_matrix(db, date_from, date_to, codes or [analytics.BASE_CODE])
+    missing = set(codes) - set(matrix.codes)
+    if missing:
+        exceptions.raise_404_not_found(f"No {', '.join(sorted(missing))} rates found for the requested period.")
+
+    return json_response({
+        "dates": iso_dates(matrix.dates),
+        "rates": by_code(["/".join(pair) for pair in parsed_pairs], analytics.cross_rates(matrix, parsed_pairs)),
+    })
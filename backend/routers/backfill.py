@@ -0,0 +1,58 @@
+from datetime import date
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import exceptions
+from schemas import BackfillJobSchema
+from services import backfill_service
+from services.db_service import get_async_db
+from services.nbp_service import NBPClient, get_nbp_client
+
+NBP_TABLE_A_FIRST_DATE = date(2002, 1, 2)
+
+router = APIRouter(prefix="/backfill", tags=["Backfill"])
+
+
+@router.post("/", response_model=BackfillJobSchema, status_code=202)
+async def create_backfill_job(
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        nbp: Annotated[NBPClient, Depends(get_nbp_client)],
+        date_from: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+        date_to: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+):
+    if date_from > date_to:
+        exceptions.raise_400_bad_request("The beginning date cannot be older than the end date.")
+
+    if date_to > date.today():
+        exceptions.raise_400_bad_request("Date cannot be in the future.")
+
+    if date_from < NBP_TABLE_A_FIRST_DATE:
+        exceptions.raise_400_bad_request(f"NBP rates are available from {NBP_TABLE_A_FIRST_DATE} onwards.")
+
+    job = await backfill_service.create_job(db, date_from, date_to)
+    backfill_service.start_job(job.id, nbp)
+    return await backfill_service.get_job_status(db, job.id)
+
+
+@router.get("/{job_id}", response_model=BackfillJobSchema)
+async def get_backfill_job(db: Annotated[AsyncSession, Depends(get_async_db)], job_id: int):
+    status = await backfill_service.get_job_status(db, job_id)
+    if status is None:
+        exceptions.raise_404_not_found(f"Backfill job {job_id} not found.")
+    return status
+
+
+@router.post("/{job_id}/resume", response_model=BackfillJobSchema, status_code=202)
+async def resume_backfill_job(
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        nbp: Annotated[NBPClient, Depends(get_nbp_client)],
+        job_id: int,
+):
+    if await backfill_service.get_job_status(db, job_id) is None:
+        exceptions.raise_404_not_found(f"Backfill job {job_id} not found.")
+
+    await backfill_service.retry_failed_chunks(db, job_id)
+    backfill_service.start_job(job_id, nbp)
+    return await backfill_service.get_job_status(db, job_id)
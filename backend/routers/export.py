@@ -0,0 +1,49 @@
+from datetime import date
+from typing import Annotated, AsyncIterator, Literal
+
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+from helpers import exceptions, queries, serializers
+from services.db_service import AsyncSessionLocal
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+
+async def stream_rates(date_from: date, date_to: date, codes: list[str] | None,
+                       export_format: str) -> AsyncIterator[bytes]:
+    """
+    Yield serialized batches of rates. The generator owns its session, as a request-scoped one would be closed
+    before the response body is streamed.
+    """
+    async with AsyncSessionLocal() as db:
+        if export_format == "csv":
+            yield serializers.rates_to_csv([], header=True)
+        async for batch in queries.iter_rates_for_period(db, date_from, date_to, codes):
+            if export_format == "csv":
+                yield serializers.rates_to_csv(batch)
+            else:
+                yield serializers.rates_to_ndjson(batch)
+
+
+@router.get("/rates")
+async def export_rates(
+        date_from: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+        date_to: Annotated[date, Query(description="Date in YYYY-MM-DD format")],
+        codes: Annotated[list[str] | None, Query(alias="code", description="Currency codes, repeat for more")] = None,
+        export_format: Annotated[Literal["ndjson", "csv"], Query(alias="format")] = "ndjson",
+):
+    if date_from > date_to:
+        exceptions.raise_400_bad_request("The beginning date cannot be older than the end date.")
+
+    if codes:
+        codes = [code.upper() for code in codes]
+
+    filename = f"rates_{date_from}_{date_to}.{export_format}"
+    return StreamingResponse(
+        stream_rates(date_from, date_to, codes, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
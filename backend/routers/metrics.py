@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from helpers import metrics
+from helpers.asof import as_of_index
+from helpers.cache import rates_cache
+from helpers.events import rate_events
+from helpers.snapshot import rate_snapshot
+from services.db_service import get_pool_stats
+from services.fill_service import fill_flight
+from services.nbp_service import nbp_client
+from services.scheduler_service import ingest_scheduler
+
+router = APIRouter(tags=["Metrics"])
+
+metrics.register_stats({
+    "db_pool": get_pool_stats,
+    "rates_cache": rates_cache.stats,
+    "nbp_client": nbp_client.stats,
+    "fill_missing": fill_flight.stats,
+    "rate_snapshot": rate_snapshot.stats,
+    "as_of_index": as_of_index.stats,
+    "ingest_scheduler": ingest_scheduler.stats,
+    "rate_events": rate_events.stats,
+})
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(metrics.latest(), media_type=CONTENT_TYPE_LATEST)
@@ -1,71 +1,227 @@
+import codecs
 from datetime import date
-from typing import Annotated
+from typing import Annotated, Literal
+
+import numpy as np
+from fastapi import APIRouter, Depends, Query, Path, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import exceptions, metrics, queries, serializers, services
+from helpers.archive import ARCHIVE_ENCODING
+from helpers.asof import as_of_index
+from helpers.events import rate_events
+from helpers.snapshot import rate_snapshot
+from helpers.streaming import merge_streams
+from schemas import ConversionBatchSchema, RateResponseSchema, RateResponseOnlyCurrencies
+from services import fill_service
+from services.db_service import get_async_db
+from services.nbp_service import NBPClient, get_nbp_client, NBP_API_TABLES_URL, NBP_API_RATES_URL, TABLE_SPLIT_PERIOD
 
-from dateutil.relativedelta import relativedelta
-from fastapi import APIRouter, Depends, Query, Path
-from requests import request
-from sqlalchemy.orm import Session
-
-from helpers import exceptions, queries, services
-from schemas import RateResponseSchema, RateResponseOnlyCurrencies
-from services.db_service import get_db
-
-NBP_API_TABLES_URL = "https://api.nbp.pl/api/exchangerates/tables/a"
-NBP_API_RATES_URL = "https://api.nbp.pl/api/exchangerates/rates/a"
 REQUEST_LIMIT_PERIOD = 366
-TABLE_SPLIT_PERIOD = 90
+BATCH_MAX_GROUPS = 100  # (period, code) pairs of one batch request
+CONVERT_MAX_ITEMS = 100_000
+PAGE_DEFAULT_LIMIT = 1000  # Rates per page when only a cursor is given
+PAGE_MAX_LIMIT = 10_000
+PERIOD_FORMAT_ERROR = ("Invalid date format. Use YYYY for year, YYYY-MM for month, YYYY-Q1/Q2/Q3/Q4 for quarter, "
+                       "or YYYY-MM-DD for specific date")
 
 router = APIRouter(prefix="/currencies", tags=["Rate"])
 
 
 @router.get("/", response_model=list[RateResponseOnlyCurrencies])
-async def get_all_currencies(db: Annotated[Session, Depends(get_db)]):
-    currencies = queries.get_currencies(db)
+async def get_all_currencies(db: Annotated[AsyncSession, Depends(get_async_db)], request: Request, response: Response):
+    currencies = await queries.get_currencies(db)
     if not currencies:
         exceptions.raise_404_not_found("No currencies found. Try to fetch them first.")
+
+    etag = services.make_etag(currencies)
+    if services.etag_matches(etag, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return currencies
 
 
+@router.get("/events")
+async def get_rate_events():
+    """
+    Server-sent events stream: a `rates` event with the delta of every commit of new rates, by any worker, with the
+    rows in columns unless there are too many, then only the range and codes to query. After a `resync` event, or
+    when reconnecting, deltas may have been missed and shown rates should be queried again.
+    """
+    return StreamingResponse(
+        rate_events.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # Not buffered by proxies
+    )
+
+
+@router.get("/batch")
+async def get_rates_batch(
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        codes: Annotated[list[str], Query(alias="code", description="Currency codes (e.g., USD, EUR)")],
+        periods: Annotated[list[str], Query(
+            alias="period", description="Periods in YYYY, YYYY-MM, YYYY-QQ or YYYY-MM-DD format"
+        )],
+        response_format: Annotated[Literal["rows", "columnar"], Query(
+            alias="format", description="rows: list of rate objects, columnar: {dates, codes, mid} arrays per group"
+        )] = "rows",
+):
+    """Rates of every code in every period, read with a single query and returned as one group per (period, code)."""
+    today = date.today()
+    codes = list(dict.fromkeys(code.upper() for code in codes))
+    periods = list(dict.fromkeys(periods))
+    if len(codes) * len(periods) > BATCH_MAX_GROUPS:
+        exceptions.raise_400_bad_request(f"A batch can request at most {BATCH_MAX_GROUPS} (period, code) pairs.")
+
+    try:
+        ranges = {period: services.parse_period(period, today) for period in periods}
+    except ValueError:
+        exceptions.raise_400_bad_request(PERIOD_FORMAT_ERROR)
+    if any(start_date > today or end_date > today for start_date, end_date in ranges.values()):
+        exceptions.raise_400_bad_request("Date cannot be in the future.")
+
+    rates = await queries.get_rates_for_periods(db, list(ranges.values()), codes)
+    if not rates:
+        exceptions.raise_404_not_found("No rates found for the requested periods. Try to download them first.")
+
+    pairs = [(period, code) for period in periods for code in codes]
+    grouped_rates = services.group_rates(rates, [(*ranges[period], code) for period, code in pairs])
+    with metrics.stage("serialize"):
+        body = serializers.rate_groups_to_json([
+            {"period": period, "code": code, "date_from": ranges[period][0], "date_to": ranges[period][1],
+             "rates": rows}
+            for (period, code), rows in zip(pairs, grouped_rates)
+        ], columnar=response_format == "columnar")
+    return Response(body, media_type="application/json")
+
+
+@router.get("/asof/{request_date}", response_model=list[RateResponseSchema])
+async def get_rates_as_of(
+        request_date: Annotated[date, Path(description="Date in YYYY-MM-DD format")],
+        codes: Annotated[list[str] | None, Query(alias="code", description="Currency codes, all if omitted")] = None,
+):
+    """Latest rates published on or before the date, e.g. on weekends and holidays those of the last business day."""
+    if request_date > date.today():
+        exceptions.raise_400_bad_request("Date cannot be in the future.")
+
+    await as_of_index.load()
+    codes = [code.upper() for code in codes] if codes else as_of_index.codes
+    found = as_of_index.lookup(codes, np.full(len(codes), np.datetime64(request_date)))
+    published = ~np.isnan(found.mids)
+    if not published.any():
+        exceptions.raise_404_not_found("No rates found on or before the requested date. Try to download them first.")
+
+    rates = [
+        (rate_date, as_of_index.currency(code), code, mid)
+        for rate_date, code, mid in zip(np.datetime_as_string(found.dates[published], unit="D").tolist(),
+                                        np.asarray(codes)[published].tolist(), found.mids[published].tolist())
+    ]
+    with metrics.stage("serialize"):
+        body = serializers.rates_to_json(rates)
+    return Response(body, media_type="application/json")
+
+
+@router.get("/convert")
+async def convert_amount(
+        amount: Annotated[float, Query(description="Amount in the source currency")],
+        from_code: Annotated[str, Query(alias="from", description="Source currency code, PLN included")],
+        to_code: Annotated[str, Query(alias="to", description="Target currency code, PLN included")],
+        request_date: Annotated[date, Query(alias="date", description="Date in YYYY-MM-DD format")],
+):
+    """Convert an amount at the latest mids published on or before the date."""
+    conversions = await convert_amounts([amount], [from_code], [to_code], [request_date])
+    if conversions["result"][0] is None:
+        exceptions.raise_404_not_found(
+            f"No {from_code.upper()}/{to_code.upper()} rates found on or before {request_date}. "
+            f"Try to download them first."
+        )
+    with metrics.stage("serialize"):
+        body = serializers.series_to_json({column: values[0] for column, values in conversions.items()})
+    return Response(body, media_type="application/json")
+
+
+@router.post("/convert")
+async def convert_amounts_batch(batch: ConversionBatchSchema):
+    """
+    Convert many amounts in one call, each at the latest mids published on or before its date. The batch and its
+    results are columns in request order, amounts without a rate on or before their date get null results.
+    """
+    if len(batch.amounts) > CONVERT_MAX_ITEMS:
+        exceptions.raise_400_bad_request(f"A batch can convert at most {CONVERT_MAX_ITEMS} amounts.")
+    conversions = await convert_amounts(batch.amounts, batch.from_codes, batch.to_codes, batch.dates)
+    with metrics.stage("serialize"):
+        body = serializers.series_to_json(conversions)
+    return Response(body, media_type="application/json")
+
+
+async def convert_amounts(amounts: list[float], from_codes: list[str], to_codes: list[str],
+                          request_dates: list[date]) -> dict[str, list]:
+    dates = np.array(request_dates, dtype="datetime64[D]")
+    if len(dates) and dates.max() > np.datetime64(date.today()):
+        exceptions.raise_400_bad_request("Date cannot be in the future.")
+
+    await as_of_index.load()
+    with metrics.stage("convert"):
+        conversions = as_of_index.convert(np.array(amounts, dtype=np.float64), [code.upper() for code in from_codes],
+                                          [code.upper() for code in to_codes], dates)
+    missing = np.isnan(conversions.results)
+    return {
+        "result": np.where(missing, None, conversions.results).tolist(),
+        "rate": np.where(missing, None, conversions.rates).tolist(),
+        "from_rate_date": np.where(missing, None, np.datetime_as_string(conversions.from_dates, unit="D")).tolist(),
+        "to_rate_date": np.where(missing, None, np.datetime_as_string(conversions.to_dates, unit="D")).tolist(),
+    }
+
+
 @router.get("/{request_date}", response_model=list[RateResponseSchema])
 async def get_rates(
-        db: Annotated[Session, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        nbp: Annotated[NBPClient, Depends(get_nbp_client)],
+        request: Request,
         request_date: str = Path(..., description="Date in YYYY, YYYY-MM, YYYY-QQ or YYYY-MM-DD format"),
-        code: Annotated[str | None, Query(description="Currency code (e.g., USD, EUR)")] = None
+        code: Annotated[str | None, Query(description="Currency code (e.g., USD, EUR)")] = None,
+        response_format: Annotated[Literal["rows", "columnar"], Query(
+            alias="format", description="rows: list of rate objects, columnar: {dates, codes, mid} arrays"
+        )] = "rows",
+        aggregate: Annotated[Literal["month", "quarter", "year"] | None, Query(
+            description="Return avg/min/max/first/last mid per code for each period instead of daily rates"
+        )] = None,
+        fetch_missing: Annotated[bool, Query(
+            description="Fetch dates missing from the database from NBP and store them before answering"
+        )] = False,
+        source: Annotated[Literal["db", "snapshot"], Query(
+            description="snapshot: serve daily rates from the memory-mapped snapshot instead of querying the database"
+        )] = "db",
+        fields: Annotated[str | None, Query(
+            description="Comma separated fields of every rate, of update_date, currency, code and mid"
+        )] = None,
+        limit: Annotated[int | None, Query(
+            ge=1, le=PAGE_MAX_LIMIT, description="Rates per page, the X-Next-Cursor header holds the cursor of the next"
+        )] = None,
+        cursor: Annotated[str | None, Query(description="X-Next-Cursor of the previous page")] = None,
 ):
     today = date.today()
-    start_date = end_date = None
-
-    try:  # Parse date parameter
-        if len(request_date) == 4:  # Year only: YYYY
-            year = int(request_date)
-            start_date = date(year, 1, 1)
-            end_date = date(year, 12, 31)
-            if end_date > today:
-                end_date = today
-        elif 'Q' in request_date:  # Quarter: YYYY-QQ
-
-            year, quarter = request_date.split('-Q')
-            quarter = int(quarter)
-            start_date = date(int(year), 3 * quarter - 2, 1)
-            end_date = start_date + relativedelta(months=3, days=-1)
-            if end_date > today:
-                end_date = today
-
-        elif len(request_date.split('-')) == 2:  # Month: YYYY-MM
-            year, month = map(int, request_date.split('-'))
-            start_date = date(year, month, 1)
-            end_date = start_date + relativedelta(months=1, days=-1)
-            if end_date > today:
-                end_date = today
-
-        else:  # Full date: YYYY-MM-DD
-            start_date = end_date = date.fromisoformat(request_date)
-
+    try:
+        start_date, end_date = services.parse_period(request_date, today)
     except ValueError:
-        exceptions.raise_400_bad_request(
-            f"Invalid date format. "
-            f"Use YYYY for year, YYYY-MM for month, YYYY-Q1/Q2/Q3/Q4 for quarter, or YYYY-MM-DD for specific date"
-        )
+        exceptions.raise_400_bad_request(PERIOD_FORMAT_ERROR)
+
+    paginated = limit is not None or cursor is not None
+    if (paginated or fields) and aggregate:
+        exceptions.raise_400_bad_request("Pagination and fields are not supported for aggregates.")
+    if paginated and source == "snapshot":
+        exceptions.raise_400_bad_request("Pagination is not supported for the snapshot source.")
+    if fields is not None:
+        fields = tuple(dict.fromkeys(field.strip() for field in fields.split(",")))
+        if not set(fields) <= set(serializers.RATE_FIELDS):
+            exceptions.raise_400_bad_request(f"Fields must be of {', '.join(serializers.RATE_FIELDS)}.")
+    after = None
+    if cursor is not None:
+        try:
+            after = services.decode_cursor(cursor)
+        except ValueError:
+            exceptions.raise_400_bad_request("Invalid cursor.")
 
     if start_date > today or end_date > today:
         exceptions.raise_400_bad_request("Date cannot be in the future.")
@@ -73,28 +229,63 @@ async def get_rates(
     if code is not None:
         code = code.upper()
 
-    rates, start_date, end_date = queries.get_rates_for_period(db, start_date, end_date, code)
-    if not rates and code:
-        exceptions.raise_404_not_found(f"No {code} rates found for the requested period. Try to download them first.")
-    elif not rates:
+    if fetch_missing:
+        await fill_service.fill_missing_rates(db, nbp, start_date, end_date, code)
+
+    if aggregate:
+        rates = await queries.get_aggregates_for_period(db, aggregate, start_date, end_date, code)
+    elif source == "snapshot":
+        snapshot = rate_snapshot.load()
+        if snapshot is None:
+            exceptions.raise_404_not_found("The rate snapshot is not available.")
+        rates = snapshot.slice(start_date, end_date, [code] if code else None).to_rows()
+    elif paginated:
+        limit = limit or PAGE_DEFAULT_LIMIT
+        rates = await queries.get_rates_page(db, start_date, end_date, code, after, limit + 1)  # One more, if any
+    else:
+        rates, start_date, end_date = await queries.get_rates_for_period(db, start_date, end_date, code)
+
+    headers = {}
+    if paginated and len(rates) > limit:
+        rates = rates[:limit]
+        next_cursor = services.encode_cursor(rates[-1][0], rates[-1][2])
+        headers = {"X-Next-Cursor": next_cursor,
+                   "Link": f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'}
+
+    if not rates and cursor is None:  # A page after the last one is empty, not missing
+        if code:
+            exceptions.raise_404_not_found(
+                f"No {code} rates found for the requested period. Try to download them first.")
         exceptions.raise_404_not_found("No rates found for the requested period. Try to download them first.")
 
-    return rates
+    # Rows are plain tuples, serialized directly instead of validating every row through response_model
+    with metrics.stage("serialize"):
+        if aggregate:
+            body = serializers.aggregates_to_json(rates)
+        elif response_format == "columnar":
+            body = serializers.rates_to_columnar_json(rates, fields or serializers.COLUMNAR_FIELDS)
+        else:
+            body = serializers.rates_to_json(rates, fields or serializers.RATE_FIELDS)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @router.post("/fetch/tables")
 async def download_rates_for_table(
-        db: Annotated[Session, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        nbp: Annotated[NBPClient, Depends(get_nbp_client)],
         date_from: Annotated[date | None, Query(description="Date in YYYY-MM-DD format")] = None,
         date_to: Annotated[date | None, Query(description="Date in YYYY-MM-DD format")] = None
 ):
     if (date_from is None) != (date_to is None):
         exceptions.raise_400_bad_request("Both or none dates are required.")
 
+    new_rates = []
+    urls = []
+
     if not date_from and not date_to:
-        """If no dates are provided, set them to the last available date"""
-        response = request("get", url=f"{NBP_API_TABLES_URL}/last").json()
-        date_from = date_to = date.fromisoformat(response[0].get("effectiveDate"))
+        """If no dates are provided, use the last available table, its response already holds the rates"""
+        new_rates = services.parse_table_rates(await nbp.get(f"{NBP_API_TABLES_URL}/last"))
+        date_from = date_to = new_rates[0][0]
 
     if date_from > date_to:
         exceptions.raise_400_bad_request("The beginning date cannot be older than the end date.")
@@ -105,30 +296,29 @@ async def download_rates_for_table(
     if (date_to - date_from).days > REQUEST_LIMIT_PERIOD:
         exceptions.raise_400_bad_request("The period cannot be longer than 366 days.")
 
-    new_rates = []
-    urls = []
-    existing_rates = queries.get_rates(db, date_from, date_to)
-
     # Split dates into periods, if request period is longer than 90 days (to avoid limitation of NBP API)
-    if (date_to - date_from).days > TABLE_SPLIT_PERIOD:
+    if not new_rates and (date_to - date_from).days > TABLE_SPLIT_PERIOD:
         date_periods = services.split_fetch_period(date_from, date_to, TABLE_SPLIT_PERIOD)
         for date_period in date_periods:
             urls.append(f"{NBP_API_TABLES_URL}/{date_period[0]}/{date_period[1]}")
-    else:
+    elif not new_rates:
         urls.append(f"{NBP_API_TABLES_URL}/{date_from}/{date_to}")
 
-    for url in urls:
-        new_rates.extend(services.get_new_rates(request("get", url), existing_rates))
-
-    if len(new_rates) == 0:
+    if new_rates:
+        result = await queries.add_rates_to_db(db, new_rates)
+    else:
+        # Stream all periods concurrently over the shared connection pool, rates are copied while they are parsed
+        streams = [nbp.stream_records(url) for url in urls]
+        result = await queries.add_streamed_rates_to_db(db, merge_streams(streams), date_from, date_to)
+    if result.inserted == 0:
         exceptions.raise_400_bad_request("All rates for specified period are already in the database.")
-    queries.add_rates_to_db(db, new_rates)
-    return {"message": f"Added {len(new_rates)} rates"}
+    return {"message": f"Added {result.inserted} rates", "inserted": result.inserted, "skipped": result.skipped}
 
 
 @router.post("/fetch/rates")
 async def download_rates_for_currency(
-        db: Annotated[Session, Depends(get_db)],
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        nbp: Annotated[NBPClient, Depends(get_nbp_client)],
         code: str = Query(..., description="Currency code"),
         date_from: Annotated[date | None, Query(description="Date in YYYY-MM-DD format")] = None,
         date_to: Annotated[date | None, Query(description="Date in YYYY-MM-DD format")] = None
@@ -136,10 +326,13 @@ async def download_rates_for_currency(
     if (date_from is None) != (date_to is None):
         exceptions.raise_400_bad_request("Both or none dates are required.")
 
+    code = code.upper()
+    new_rates = []
+
     if not date_from and not date_to:
-        """If no dates are provided, set them to the last available date"""
-        url = f"{NBP_API_RATES_URL}/{code}/last"
-        date_from = date_to = date.fromisoformat(request("get", url).json().get("rates")[0].get("effectiveDate"))
+        """If no dates are provided, use the last available rate, its response already holds it"""
+        new_rates = services.parse_code_rates(await nbp.get(f"{NBP_API_RATES_URL}/{code}/last"), code)
+        date_from = date_to = new_rates[0][0]
 
     if date_from > date_to:
         exceptions.raise_400_bad_request("The beginning date cannot be older than the end date.")
@@ -150,12 +343,36 @@ async def download_rates_for_currency(
     if (date_to - date_from).days > REQUEST_LIMIT_PERIOD:
         exceptions.raise_400_bad_request("The period cannot be longer than 366 days.")
 
-    code = code.upper()
-    existing_rates = queries.get_code_rates(db, code, date_from, date_to)
-    url = f"{NBP_API_RATES_URL}/{code}/{date_from}/{date_to}"
-    new_rates = services.get_new_code_rates(request("get", url), code, existing_rates)
-
-    if len(new_rates) == 0:
+    if new_rates:
+        result = await queries.add_rates_to_db(db, new_rates)
+    else:
+        url = f"{NBP_API_RATES_URL}/{code}/{date_from}/{date_to}"
+        result = await queries.add_streamed_rates_to_db(db, nbp.stream_records(url, code), date_from, date_to, code)
+    if result.inserted == 0:
         exceptions.raise_400_bad_request(f"All {code} rates for specified period are already in the database.")
-    queries.add_rates_to_db(db, new_rates)
-    return {"message": f"Added {len(new_rates)} rates"}
+    return {"message": f"Added {result.inserted} rates", "inserted": result.inserted, "skipped": result.skipped}
+
+
+@router.post("/import/archive")
+async def import_rates_archive(
+        db: Annotated[AsyncSession, Depends(get_async_db)],
+        request: Request,
+        encoding: Annotated[str, Query(description="Encoding of the file, NBP archives are Windows-1250")] = (
+            ARCHIVE_ENCODING),
+):
+    """
+    Bulk load an NBP table A yearly archive CSV (archiwum_tab_a_YYYY.csv) sent as the request body, parsed while it is
+    received, e.g. `curl --data-binary @archiwum_tab_a_2024.csv .../currencies/import/archive`.
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        exceptions.raise_400_bad_request(f"Unknown encoding {encoding}.")
+
+    try:
+        result = await queries.add_archive_to_db(db, request.stream(), encoding)
+    except ValueError as error:  # Also undecodable bytes
+        exceptions.raise_400_bad_request(f"Invalid archive file: {error}")
+    if result.inserted == 0:
+        exceptions.raise_400_bad_request("All rates of the archive are already in the database.")
+    return {"message": f"Added {result.inserted} rates", "inserted": result.inserted, "skipped": result.skipped}
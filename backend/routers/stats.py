@@ -0,0 +1,36 @@
+from fastapi import APIRouter
+
+from helpers.asof import as_of_index
+from helpers.cache import rates_cache
+from helpers.events import rate_events
+from helpers.snapshot import rate_snapshot
+from services.db_service import get_pool_stats
+from services.nbp_service import nbp_client
+from services.scheduler_service import ingest_scheduler
+
+router = APIRouter(prefix="/stats", tags=["Stats"])
+
+
+@router.get("/cache")
+async def get_cache_stats():
+    return {"rates": rates_cache.stats(), "nbp": nbp_client.stats(), "as_of": as_of_index.stats()}
+
+
+@router.get("/db")
+async def get_db_pool_stats():
+    return {"pool": get_pool_stats()}
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    return {"scheduler": ingest_scheduler.stats()}
+
+
+@router.get("/snapshot")
+async def get_snapshot_stats():
+    return {"snapshot": rate_snapshot.stats()}
+
+
+@router.get("/events")
+async def get_event_stats():
+    return {"events": rate_events.stats()}
@@ -1,3 +1,4 @@
-from .rate_schema import RateResponseSchema, RateResponseOnlyCurrencies
+from .backfill_schema import BackfillJobSchema
+from .rate_schema import ConversionBatchSchema, RateResponseSchema, RateResponseOnlyCurrencies
 
-__all__ = ["RateResponseSchema", "RateResponseOnlyCurrencies"]
+__all__ = ["RateResponseSchema", "RateResponseOnlyCurrencies", "ConversionBatchSchema", "BackfillJobSchema"]
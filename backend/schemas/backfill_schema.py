@@ -0,0 +1,20 @@
+from datetime import date, datetime
+
+from pydantic import BaseModel
+
+
+class BackfillJobSchema(BaseModel):
+    id: int
+    status: str
+    date_from: date
+    date_to: date
+    chunks_total: int
+    chunks_done: int
+    chunks_failed: int
+    rows_inserted: int
+    rows_skipped: int
+    created_at: datetime
+    started_at: datetime | None
+    finished_at: datetime | None
+    elapsed_seconds: float
+    rows_per_second: float
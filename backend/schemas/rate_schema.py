@@ -1,6 +1,6 @@
 from datetime import date
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 
 
 class RateResponseSchema(BaseModel):
@@ -19,3 +19,17 @@ class RateResponseOnlyCurrencies(BaseModel):
 
     class ConfigDict:
         from_attributes = True
+
+
+class ConversionBatchSchema(BaseModel):
+    """Amounts to convert as columns of equal length, validated as whole arrays instead of item by item."""
+    amounts: list[float]
+    from_codes: list[str] = Field(alias="from")
+    to_codes: list[str] = Field(alias="to")
+    dates: list[date]
+
+    @model_validator(mode="after")
+    def check_lengths(self) -> "ConversionBatchSchema":
+        if not len(self.amounts) == len(self.from_codes) == len(self.to_codes) == len(self.dates):
+            raise ValueError("amounts, from, to and dates must have the same length")
+        return self
@@ -0,0 +1,125 @@
+"""
+Production server: imports the app once, then forks uvicorn workers sharing one listening socket, so every worker
+starts from the preloaded modules (shared copy-on-write) and only runs the lifespan warm-up. Workers that die are
+replaced, SIGTERM and SIGINT shut all of them down gracefully. The schema must be migrated first:
+
+    python -m migrate && python -m serve --host 0.0.0.0 --port 8080 --workers 4
+
+With several workers, request and stage metrics are aggregated over them in PROMETHEUS_MULTIPROC_DIR, a temporary
+directory unless set.
+"""
+import argparse
+import gc
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+STARTUP_FAILURE = 3  # Exit code of a worker whose lifespan startup failed, like uvicorn's
+RESTART_DELAY = 1.0  # Seconds before replacing a worker that died, so a crash loop does not spin
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    def handle_exit(self, sig, frame) -> None:
+        from helpers.events import rate_events  # Preloaded with the app, after the metrics directory was set
+
+        super().handle_exit(sig, frame)
+        rate_events.close_streams_threadsafe()  # Open event streams would hold the graceful shutdown forever
+
+
+def run_worker(app, sock: socket.socket, log_level: str) -> None:
+    """Serve on the inherited socket until told to exit, never returns to the caller."""
+    code = 1
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)  # uvicorn installs its own handlers once serving
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        server = WorkerServer(uvicorn.Config(app, lifespan="on", log_level=log_level, proxy_headers=True))
+        server.run(sockets=[sock])
+        code = 0 if server.started else STARTUP_FAILURE
+    finally:
+        os._exit(code)
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info") -> int:
+    """Run the workers until a signal stops them, returns the exit code of the server."""
+    metrics_dir = None
+    if workers > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+
+    from prometheus_client import multiprocess
+
+    from main import app  # Preloaded, once for all workers
+
+    sock = bind_socket(host, port)
+    gc.freeze()  # Keeps the preloaded objects out of collections, whose writes would unshare their pages
+    pids: set[int] = set()
+    stopping = False
+    exit_code = 0
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            run_worker(app, sock, log_level)
+        pids.add(pid)
+
+    def stop(*_) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"serving on http://{host}:{port} with {workers} worker(s)", flush=True)
+    for _ in range(workers):
+        spawn()
+
+    while pids:
+        pid, status = os.wait()
+        pids.discard(pid)
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            multiprocess.mark_process_dead(pid)
+        code = os.waitstatus_to_exitcode(status)
+        if stopping:
+            continue
+        if code == STARTUP_FAILURE:  # E.g. the database is down or not migrated, replacing it would fail alike
+            print(f"worker {pid} failed to start, stopping", file=sys.stderr, flush=True)
+            exit_code = STARTUP_FAILURE
+            stop()
+        else:
+            print(f"worker {pid} exited with {code}, replacing it", file=sys.stderr, flush=True)
+            time.sleep(RESTART_DELAY)
+            spawn()
+
+    sock.close()
+    if metrics_dir is not None:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY, help="Defaults to WEB_CONCURRENCY or CPUs")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    sys.exit(serve(args.host, args.port, args.workers, args.log_level))
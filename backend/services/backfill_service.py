@@ -0,0 +1,203 @@
+import asyncio
+import os
+from datetime import date, datetime
+
+from sqlalchemy import func, select, update
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import queries, services
+from helpers.ingest import IngestResult
+from models import BackfillChunk, BackfillJob
+from services.db_service import AsyncSessionLocal
+from services.nbp_service import NBPClient, NBP_API_TABLES_URL, TABLE_SPLIT_PERIOD
+
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 4))
+
+_running_jobs: dict[int, asyncio.Task] = {}
+_rerun_jobs: set[int] = set()  # Jobs resumed while their previous run was finishing
+
+
+async def create_job(db: AsyncSession, date_from: date, date_to: date) -> BackfillJob:
+    """Create a backfill job with one pending chunk per NBP table request window."""
+    job = BackfillJob(date_from=date_from, date_to=date_to)
+    periods = services.split_fetch_period(date_from, date_to, TABLE_SPLIT_PERIOD)
+    db.add(job)
+    await db.flush()
+    db.add_all([BackfillChunk(job_id=job.id, date_from=start, date_to=end) for start, end in periods])
+    await db.commit()
+    return job
+
+
+async def get_job_status(db: AsyncSession, job_id: int) -> dict | None:
+    """Get job details with chunk progress and ingestion throughput."""
+    job = await db.get(BackfillJob, job_id, populate_existing=True)
+    if job is None:
+        return None
+
+    chunks_total, chunks_done, chunks_failed, rows_inserted, rows_skipped = (await db.execute(
+        select(
+            func.count(),
+            func.count().filter(BackfillChunk.status == "done"),
+            func.count().filter(BackfillChunk.status == "failed"),
+            func.coalesce(func.sum(BackfillChunk.rows_inserted), 0),
+            func.coalesce(func.sum(BackfillChunk.rows_skipped), 0),
+        ).where(BackfillChunk.job_id == job_id)
+    )).one()
+
+    elapsed = 0.0
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.now()) - job.started_at).total_seconds()
+
+    return {
+        "id": job.id,
+        "status": job.status,
+        "date_from": job.date_from,
+        "date_to": job.date_to,
+        "chunks_total": chunks_total,
+        "chunks_done": chunks_done,
+        "chunks_failed": chunks_failed,
+        "rows_inserted": rows_inserted,
+        "rows_skipped": rows_skipped,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "elapsed_seconds": elapsed,
+        "rows_per_second": rows_inserted / elapsed if elapsed else 0.0,
+    }
+
+
+async def _set_job_status(job_id: int, status: str) -> None:
+    async with AsyncSessionLocal() as db:
+        job = await db.get(BackfillJob, job_id)
+        job.status = status
+        if status == "running":
+            job.started_at = job.started_at or datetime.now()
+            job.finished_at = None
+        else:
+            job.finished_at = datetime.now()
+        await db.commit()
+
+
+async def _finish_job(job_id: int) -> None:
+    """Mark the job as finished, unless chunks are still being processed by another process."""
+    async with AsyncSessionLocal() as db:
+        status = await get_job_status(db, job_id)
+    if status["chunks_failed"]:
+        await _set_job_status(job_id, "failed")
+    elif status["chunks_done"] == status["chunks_total"]:
+        await _set_job_status(job_id, "completed")
+
+
+async def _claim_chunk(db: AsyncSession, job_id: int) -> BackfillChunk | None:
+    """
+    Lock the next pending chunk of a job. The row lock is held until the chunk transaction ends, so workers of other
+    processes resuming the same job skip it instead of fetching it twice.
+    """
+    return (await db.scalars(
+        select(BackfillChunk)
+        .where(BackfillChunk.job_id == job_id, BackfillChunk.status == "pending")
+        .order_by(BackfillChunk.date_from)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )).first()
+
+
+async def _complete_chunk(db: AsyncSession, chunk: BackfillChunk, nbp: NBPClient) -> None:
+    """Stream chunk rates into the database and checkpoint the chunk in the same transaction."""
+    url = f"{NBP_API_TABLES_URL}/{chunk.date_from}/{chunk.date_to}"
+    try:
+        async with db.begin_nested():  # A failed stream rolls back to here, the chunk stays locked
+            result = await queries.add_streamed_rates_to_db(
+                db, nbp.stream_records(url), chunk.date_from, chunk.date_to, commit=False
+            )
+    except HTTPException as error:
+        if error.status_code != 404:
+            raise
+        result = IngestResult(0, 0)  # A window without any published table (e.g. holidays only) is answered with 404
+    chunk.status = "done"
+    chunk.rows_inserted = result.inserted
+    chunk.rows_skipped = result.skipped
+    chunk.finished_at = datetime.now()
+    await db.commit()
+    await queries.invalidate_cached_rates(result)
+
+
+async def _fail_chunk(chunk_id: int, error: str) -> None:
+    async with AsyncSessionLocal() as db:
+        chunk = await db.get(BackfillChunk, chunk_id)
+        chunk.status = "failed"
+        chunk.error = error
+        chunk.finished_at = datetime.now()
+        await db.commit()
+
+
+async def _worker(job_id: int, nbp: NBPClient) -> None:
+    """Process pending chunks of a job one at a time until none are left."""
+    while True:
+        async with AsyncSessionLocal() as db:
+            chunk = await _claim_chunk(db, job_id)
+            if chunk is None:
+                return
+            try:
+                await _complete_chunk(db, chunk, nbp)
+            except Exception as error:
+                chunk_id = chunk.id
+                await db.rollback()
+                await _fail_chunk(chunk_id, str(getattr(error, "detail", None) or error))
+
+
+async def run_job(job_id: int, nbp: NBPClient, workers: int = BACKFILL_WORKERS) -> None:
+    """Run all pending chunks of a job on a bounded pool of workers."""
+    try:
+        while True:
+            _rerun_jobs.discard(job_id)
+            await _set_job_status(job_id, "running")
+            await asyncio.gather(*(_worker(job_id, nbp) for _ in range(workers)))
+            await _finish_job(job_id)
+            if job_id not in _rerun_jobs:
+                break
+    finally:
+        _running_jobs.pop(job_id, None)
+        _rerun_jobs.discard(job_id)
+
+
+def start_job(job_id: int, nbp: NBPClient) -> None:
+    """Run a job in the background of the current event loop. A job already running in this process runs once more."""
+    if job_id in _running_jobs:
+        _rerun_jobs.add(job_id)
+    else:
+        _running_jobs[job_id] = asyncio.create_task(run_job(job_id, nbp))
+
+
+async def retry_failed_chunks(db: AsyncSession, job_id: int) -> None:
+    """Reset failed chunks and the job to pending, so the next run picks them up."""
+    await db.execute(
+        update(BackfillChunk)
+        .where(BackfillChunk.job_id == job_id, BackfillChunk.status == "failed")
+        .values(status="pending", error=None, finished_at=None)
+    )
+    await db.execute(
+        update(BackfillJob)
+        .where(BackfillJob.id == job_id, BackfillJob.status != "running")
+        .values(status="pending", finished_at=None)
+    )
+    await db.commit()
+
+
+async def resume_jobs(nbp: NBPClient) -> None:
+    """Restart jobs interrupted by a shutdown or crash, continuing from their last checkpointed chunk."""
+    async with AsyncSessionLocal() as db:
+        job_ids = (await db.scalars(
+            select(BackfillJob.id).where(BackfillJob.status.in_(("pending", "running")))
+        )).all()
+    for job_id in job_ids:
+        start_job(job_id, nbp)
+
+
+async def stop_jobs() -> None:
+    """Cancel running jobs, their uncommitted chunks stay pending and are resumed on the next start."""
+    tasks = list(_running_jobs.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,15 +1,44 @@
+import asyncio
 import os
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = (f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
-                f"@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}")
+DATABASE_CREDENTIALS = (f"{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}"
+                        f"@{os.getenv('POSTGRES_HOST')}:{os.getenv('POSTGRES_PORT')}/{os.getenv('POSTGRES_DB')}")
+DATABASE_URL = f"postgresql://{DATABASE_CREDENTIALS}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DATABASE_CREDENTIALS}"
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 0))  # Milliseconds, 0 disables the timeout
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", 2))  # Connections opened by every worker at startup
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+# Synchronous engine for schema management, scripts and tests
+engine = create_engine(
+    DATABASE_URL, connect_args={"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}, **POOL_OPTIONS
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Asynchronous engine used by the API, so queries do not block the event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}},
+    **POOL_OPTIONS
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -19,3 +48,27 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def warm_pool(connections: int = DB_POOL_WARM) -> None:
+    """Open connections of the async pool ahead of the first requests, they are returned to the pool idle."""
+    async def ping() -> None:
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(min(connections, DB_POOL_SIZE + DB_MAX_OVERFLOW))))
+
+
+def get_pool_stats() -> dict[str, int]:
+    pool = async_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
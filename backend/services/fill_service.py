@@ -0,0 +1,60 @@
+import asyncio
+from datetime import date
+from functools import partial
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from helpers import queries, services
+from helpers.cache import RangeCache, SingleFlight
+from services.db_service import AsyncSessionLocal
+from services.nbp_service import NBPClient, NBP_API_RATES_URL, NBP_API_TABLES_URL, TABLE_SPLIT_PERIOD
+
+fill_flight = SingleFlight()
+# Periods NBP has no tables for (holidays, today before publication) or no rates missing from the database (e.g. a
+# currency dropped from the table leaves its dates short of a code), so they are not requested on every read.
+# Past periods are kept, periods including today expire like cached ranges of today.
+empty_periods = RangeCache()
+
+
+async def fill_missing_rates(db: AsyncSession, nbp: NBPClient, start_date: date, end_date: date,
+                             code: str | None = None) -> int:
+    """
+    Fetch the business day periods of start_date..end_date missing from the database concurrently and store them.
+    Concurrent calls for the same period share one upstream fetch. Returns the number of inserted rates.
+    """
+    if code:
+        stored_dates = await queries.get_stored_dates(db, start_date, end_date, code)
+    else:  # Dates only some codes were stored for are completed with their table
+        stored_dates = await queries.get_complete_dates(db, start_date, end_date)
+    periods = [
+        period for period in services.find_missing_periods(start_date, end_date, stored_dates)
+        if empty_periods.get(*period, code) is None
+    ]
+    inserted = await asyncio.gather(*(
+        fill_flight.do((*period, code), partial(_fetch_period, nbp, *period, code)) for period in periods
+    ))
+    return sum(inserted)
+
+
+async def _fetch_period(nbp: NBPClient, start_date: date, end_date: date, code: str | None) -> int:
+    if code:
+        paths = [f"{NBP_API_RATES_URL}/{code}/{start_date}/{end_date}"]
+    else:
+        periods = services.split_fetch_period(start_date, end_date, TABLE_SPLIT_PERIOD)
+        paths = [f"{NBP_API_TABLES_URL}/{start}/{end}" for start, end in periods]
+
+    records = []
+    for response in await nbp.get_many(paths):
+        if response.status_code == 404:  # No table published in the period
+            continue
+        records.extend(services.parse_code_rates(response, code) if code else services.parse_table_rates(response))
+
+    if not records:
+        empty_periods.put(start_date, end_date, code, True)
+        return 0
+
+    async with AsyncSessionLocal() as db:
+        inserted = (await queries.add_rates_to_db(db, records)).inserted
+    if not inserted:
+        empty_periods.put(start_date, end_date, code, True)
+    return inserted
@@ -0,0 +1,220 @@
+import asyncio
+import os
+from datetime import date
+from functools import partial
+from typing import AsyncIterator
+
+import httpx
+from fastapi import HTTPException
+
+from helpers import metrics
+from helpers.cache import ResponseCache, SingleFlight
+from helpers.services import RateRecord
+from helpers.streaming import RateRecordParser
+
+NBP_API_URL = os.getenv("NBP_API_URL", "https://api.nbp.pl/api")
+NBP_MAX_CONNECTIONS = int(os.getenv("NBP_MAX_CONNECTIONS", 10))
+NBP_TIMEOUT = float(os.getenv("NBP_TIMEOUT", 10))
+NBP_RETRIES = int(os.getenv("NBP_RETRIES", 3))
+NBP_BACKOFF = float(os.getenv("NBP_BACKOFF", 0.5))
+NBP_CACHE_DIR = os.getenv("NBP_CACHE_DIR", ".nbp_cache")  # Empty keeps final responses in memory only
+NBP_CACHE_TTL = float(os.getenv("NBP_CACHE_TTL", 60))  # Seconds, for /last and windows including today
+NBP_STREAM_CHUNK_SIZE = 64 * 1024
+
+NBP_API_TABLES_URL = "/exchangerates/tables/a"
+NBP_API_RATES_URL = "/exchangerates/rates/a"
+TABLE_SPLIT_PERIOD = 90  # NBP API returns at most 93 days per table request
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+CACHEABLE_STATUS_CODES = {200, 404}
+
+
+def is_final(path: str) -> bool:
+    """Whether the response of a path can never change, i.e. it ends with a date before today."""
+    try:
+        return date.fromisoformat(path.rstrip("/").rsplit("/", 1)[-1]) < date.today()
+    except ValueError:  # /last, /today
+        return False
+
+
+def raise_for_status(status: int, body: bytes) -> None:
+    """Raise an unsuccessful NBP response as an HTTPException with its plain text message."""
+    if status != 200:
+        raise HTTPException(status_code=status, detail=body.decode(errors="replace"))
+
+
+class NBPClient:
+    """Asynchronous NBP API client sharing one pooled keep-alive HTTP session."""
+
+    def __init__(
+            self,
+            base_url: str = NBP_API_URL,
+            max_connections: int = NBP_MAX_CONNECTIONS,
+            timeout: float = NBP_TIMEOUT,
+            retries: int = NBP_RETRIES,
+            backoff: float = NBP_BACKOFF,
+            cache_dir: str | None = NBP_CACHE_DIR,
+            cache_ttl: float = NBP_CACHE_TTL,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = ResponseCache(cache_dir, cache_ttl)
+        self._flight = SingleFlight()
+        self._session: httpx.AsyncClient | None = None
+
+    @property
+    def session(self) -> httpx.AsyncClient:
+        """Create the pooled session lazily, so it is bound to the running event loop."""
+        if self._session is None or self._session.is_closed:
+            self._session = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(self.timeout),
+                headers={"Accept": "application/json"},
+            )
+        return self._session
+
+    async def get(self, path: str) -> httpx.Response:
+        """
+        GET a path relative to the NBP API root. Responses are served from the cache when possible and concurrent
+        requests of the same path share one upstream call.
+        """
+        cached = self.cache.get(path)
+        if cached is not None:
+            return httpx.Response(cached[0], content=cached[1])
+        return await self._flight.do(path, partial(self._fetch, path))
+
+    async def _fetch(self, path: str) -> httpx.Response:
+        """Request a path upstream, retrying transient failures with exponential backoff."""
+        response = await self._request(path)
+        if response.status_code in CACHEABLE_STATUS_CODES:
+            self.cache.put(path, response.status_code, response.content, is_final(path))
+        return response
+
+    async def _request(self, path: str) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.stage("upstream_fetch"):
+                    response = await self.session.get(path)
+                metrics.UPSTREAM_REQUESTS.labels(str(response.status_code)).inc()
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+            except httpx.TransportError:
+                metrics.UPSTREAM_REQUESTS.labels("error").inc()
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def stream_records(self, path: str, code: str | None = None) -> AsyncIterator[RateRecord]:
+        """
+        Rate records of a table response (or rates response of the code) parsed while the body arrives, so memory
+        stays bounded by the chunk size instead of growing with the window. Errors raise an HTTPException like
+        parse_json_response.
+        """
+        parser = RateRecordParser(code)
+        async for chunk in self._body_chunks(path):
+            for record in parser.feed(chunk):
+                yield record
+        for record in parser.close():
+            yield record
+
+    async def _body_chunks(self, path: str) -> AsyncIterator[bytes]:
+        """
+        Chunks of a successful response body, from the memory cache, the persisted cache or upstream. Windows
+        including today are fetched whole by get(), which coalesces and caches them for the TTL. Final responses
+        stream once however many read them concurrently: the first persists them while they stream (or keeps them in
+        memory without a cache directory), the others wait for it and read the cache.
+        """
+        while True:
+            cached = self.cache.peek(path)
+            if cached is not None:
+                status, body = cached
+                raise_for_status(status, body)
+                for start in range(0, len(body), NBP_STREAM_CHUNK_SIZE):
+                    yield body[start:start + NBP_STREAM_CHUNK_SIZE]
+                return
+
+            persisted = self.cache.open_persisted(path)
+            if persisted is not None:
+                status, file = persisted
+                with file:
+                    if status != 200:
+                        raise_for_status(status, file.read())
+                    while chunk := file.read(NBP_STREAM_CHUNK_SIZE):
+                        yield chunk
+                return
+
+            if not is_final(path):
+                response = await self.get(path)
+                raise_for_status(response.status_code, response.content)
+                for start in range(0, len(response.content), NBP_STREAM_CHUNK_SIZE):
+                    yield response.content[start:start + NBP_STREAM_CHUNK_SIZE]
+                return
+
+            in_flight = self._flight.join(("stream", path)) or self._flight.join(path)
+            if in_flight is None:
+                break
+            await asyncio.shield(in_flight)  # Looked up again, or streamed here if the other read failed
+
+        self.cache.count_miss()
+        with self._flight.lead(("stream", path)):
+            response = await self._open_stream(path)
+            try:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    if response.status_code in CACHEABLE_STATUS_CODES:
+                        self.cache.put(path, response.status_code, body, True)
+                    raise_for_status(response.status_code, body)
+                chunks = None if self.cache.directory else []
+                with self.cache.persisting(path, 200) as persist:
+                    async for chunk in response.aiter_bytes(NBP_STREAM_CHUNK_SIZE):
+                        if persist is not None:
+                            persist(chunk)
+                        else:
+                            chunks.append(chunk)
+                        yield chunk
+                if chunks is not None:
+                    self.cache.put(path, 200, b"".join(chunks), True)
+            finally:
+                await response.aclose()
+
+    async def _open_stream(self, path: str) -> httpx.Response:
+        """Open a streamed response, retrying transient failures until the body starts, like _request."""
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.stage("upstream_fetch"):  # Until the response headers, the body is streamed afterwards
+                    response = await self.session.send(self.session.build_request("GET", path), stream=True)
+                metrics.UPSTREAM_REQUESTS.labels(str(response.status_code)).inc()
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                await response.aclose()
+            except httpx.TransportError:
+                metrics.UPSTREAM_REQUESTS.labels("error").inc()
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get_many(self, paths: list[str]) -> list[httpx.Response]:
+        """GET several paths concurrently, preserving their order. Concurrency is bounded by the pool size."""
+        return list(await asyncio.gather(*(self.get(path) for path in paths)))
+
+    def stats(self) -> dict:
+        return {"cache": self.cache.stats(), "requests": self._flight.stats()}
+
+    async def aclose(self) -> None:
+        if self._session is not None:
+            await self._session.aclose()
+            self._session = None
+
+
+nbp_client = NBPClient()
+
+
+def get_nbp_client() -> NBPClient:
+    return nbp_client
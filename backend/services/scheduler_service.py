@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+from datetime import date, datetime, time as day_time, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from helpers import queries, services
+from models import Currency, Rate
+from services.db_service import AsyncSessionLocal, async_engine
+from services.nbp_service import NBPClient, NBP_API_TABLES_URL, TABLE_SPLIT_PERIOD, nbp_client
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_TIMEZONE = ZoneInfo("Europe/Warsaw")
+# NBP publishes table A on business days between 11:45 and 12:15 Warsaw time
+SCHEDULER_PUBLISH_TIME = day_time.fromisoformat(os.getenv("SCHEDULER_PUBLISH_TIME", "12:15"))
+SCHEDULER_POLL_UNTIL = day_time.fromisoformat(os.getenv("SCHEDULER_POLL_UNTIL", "16:00"))
+SCHEDULER_RETRY_INTERVAL = float(os.getenv("SCHEDULER_RETRY_INTERVAL", 600))  # Seconds
+SCHEDULER_LOCK_KEY = 4_621_002  # Advisory lock id shared by all app workers using the same database
+
+
+def next_run_at(now: datetime, latest_date: date | None) -> datetime:
+    """
+    Next poll time: every retry interval while today's table is late, otherwise the publication time of the next
+    business day. `now` must be timezone aware.
+    """
+    now = now.astimezone(SCHEDULER_TIMEZONE)
+    today = now.date()
+    publish_at = datetime.combine(today, SCHEDULER_PUBLISH_TIME, SCHEDULER_TIMEZONE)
+    poll_until = datetime.combine(today, SCHEDULER_POLL_UNTIL, SCHEDULER_TIMEZONE)
+
+    if today.weekday() < 5:
+        if now < publish_at:
+            return publish_at
+        if (latest_date is None or latest_date < today) and now < poll_until:
+            return min(now + timedelta(seconds=SCHEDULER_RETRY_INTERVAL), poll_until)
+
+    day = today + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return datetime.combine(day, SCHEDULER_PUBLISH_TIME, SCHEDULER_TIMEZONE)
+
+
+class IngestScheduler:
+    """
+    Polls the latest NBP table and ingests the dates missing from the database. Of all app workers only the one
+    holding the Postgres advisory lock polls, the lock is released with its connection when the worker exits.
+    """
+
+    def __init__(self, nbp: NBPClient, lock_key: int = SCHEDULER_LOCK_KEY):
+        self.nbp = nbp
+        self.lock_key = lock_key
+        self._leader: AsyncConnection | None = None
+        self._task: asyncio.Task | None = None
+        self._stats = {
+            "leader": False,
+            "runs": 0,
+            "status": None,
+            "error": None,
+            "last_run_at": None,
+            "last_run_seconds": None,
+            "rows_inserted": 0,
+            "rows_skipped": 0,
+            "total_rows_inserted": 0,
+            "latest_date": None,
+            "next_run_at": None,
+        }
+
+    async def acquire_leadership(self) -> bool:
+        """Take (or confirm) the advisory lock on a dedicated connection, held for as long as this worker leads."""
+        if self._leader is not None:
+            try:
+                await self._leader.execute(text("SELECT 1"))
+                await self._leader.commit()
+                return True
+            except DBAPIError:
+                await self._drop_leader_connection()
+
+        connection = await async_engine.connect()
+        try:
+            locked = await connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key})
+            await connection.commit()  # The session level lock outlives the transaction
+        except BaseException:
+            await connection.close()
+            raise
+        if locked:
+            self._leader = connection
+        else:
+            await connection.close()
+        self._stats["leader"] = bool(locked)
+        return bool(locked)
+
+    async def release_leadership(self) -> None:
+        if self._leader is None:
+            return
+        try:
+            await self._leader.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+            await self._leader.commit()
+            await self._leader.close()
+        except DBAPIError:
+            await self._drop_leader_connection()
+        self._leader = None
+        self._stats["leader"] = False
+
+    async def _drop_leader_connection(self) -> None:
+        """Discard the leader connection instead of returning it to the pool, which also frees a held lock."""
+        try:
+            await self._leader.invalidate()
+            await self._leader.close()
+        except DBAPIError:
+            pass
+        self._leader = None
+        self._stats["leader"] = False
+
+    async def ingest_missing(self) -> date | None:
+        """Fetch the latest table and every table published since the last date in the database."""
+        started = time.perf_counter()
+        self._stats["last_run_at"] = datetime.now(SCHEDULER_TIMEZONE)
+        self._stats["runs"] += 1
+        try:
+            async with AsyncSessionLocal() as db:
+                today = date.today()  # Partitions of the coming year, the leader keeps them ahead of loads
+                await queries.ensure_rate_partitions(db, today, today + timedelta(days=366))
+                last_response = await self.nbp.get(f"{NBP_API_TABLES_URL}/last")
+                records = services.parse_table_rates(last_response)
+                # Stored tables end where the code stored least recently ends, as single codes may be fetched ahead
+                table_codes = sorted({record[2] for record in records})
+                latest_by_code = (
+                    select(func.max(Rate.update_date).label("latest_date")).join(Currency)
+                    .where(Currency.code.in_(table_codes)).group_by(Currency.code).subquery()
+                )
+                latest_stored = await db.scalar(select(func.min(latest_by_code.c.latest_date)))
+                latest_date = records[0][0] if records else latest_stored
+
+                # Dates between the stored and the latest table, e.g. after downtime
+                if latest_stored is not None and latest_date and (latest_date - latest_stored).days > 1:
+                    periods = services.split_fetch_period(
+                        latest_stored + timedelta(days=1), latest_date - timedelta(days=1), TABLE_SPLIT_PERIOD
+                    )
+                    for response in await self.nbp.get_many(
+                            [f"{NBP_API_TABLES_URL}/{start}/{end}" for start, end in periods]):
+                        # A window without any published table (e.g. holidays only) is answered with 404
+                        if response.status_code != 404:
+                            records.extend(services.parse_table_rates(response))
+
+                result = await queries.add_rates_to_db(db, records)  # Rates already stored are skipped by the merge
+        finally:
+            self._stats["last_run_seconds"] = time.perf_counter() - started
+
+        self._stats.update(
+            status="ok", error=None, rows_inserted=result.inserted, rows_skipped=result.skipped,
+            total_rows_inserted=self._stats["total_rows_inserted"] + result.inserted, latest_date=latest_date,
+        )
+        return latest_date
+
+    async def run(self) -> None:
+        """Poll on schedule for the lifetime of the app, catching up once right after startup."""
+        latest_date = None
+        next_run = datetime.now(SCHEDULER_TIMEZONE)
+        while True:
+            self._stats["next_run_at"] = next_run
+            await asyncio.sleep(max((next_run - datetime.now(SCHEDULER_TIMEZONE)).total_seconds(), 0))
+            try:
+                if await self.acquire_leadership():
+                    latest_date = await self.ingest_missing()
+                else:
+                    latest_date = None  # Another worker polls, check back at its next poll time
+            except Exception as error:  # The next poll retries
+                self._stats.update(status="error", error=str(getattr(error, "detail", None) or error))
+            next_run = next_run_at(datetime.now(SCHEDULER_TIMEZONE), latest_date)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.release_leadership()
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+
+ingest_scheduler = IngestScheduler(nbp_client)
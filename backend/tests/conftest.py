@@ -0,0 +1,81 @@
+import os
+
+# Tests drive ingestion explicitly, the scheduler must not poll NBP in the background of every TestClient, and NBP
+# responses and snapshots must not be persisted between test runs. Set before the services read them on import.
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+os.environ.setdefault("NBP_CACHE_DIR", "")
+os.environ.setdefault("SNAPSHOT_DIR", "")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from helpers.asof import as_of_index
+from helpers.cache import rates_cache
+from main import app
+from migrate import migrate
+from services.db_service import Base, SessionLocal, engine
+from services.fill_service import empty_periods
+from services.nbp_service import NBPClient, get_nbp_client
+from tests.nbp_stub import NBPStubServer
+
+
+@pytest.fixture(scope="session", autouse=True)
+def migrated_schema():
+    """The app leaves the schema to the migration step, as in deployments."""
+    migrate()
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Tests recreate the tables, so in-process caches must not outlive a test."""
+    yield
+    rates_cache.clear()
+    as_of_index.clear()
+    empty_periods.clear()
+
+
+def recreate_tables() -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with NBPStubServer() as server:
+        yield server
+
+
+@pytest.fixture
+def nbp_options() -> dict:
+    """NBPClient arguments of the nbp fixture, overridden by modules, e.g. to fail without retries."""
+    return {"backoff": 0.01}
+
+
+@pytest.fixture
+def nbp(stub, nbp_options):
+    """Client of the stub, which starts without recorded requests, failures or latency."""
+    stub.requests.clear()
+    stub.fail_next = 0
+    stub.latency = 0.0
+    return NBPClient(base_url=stub.url, **nbp_options)
+
+
+@pytest.fixture
+def db():
+    """Synchronous session, the tables are recreated after the test."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        recreate_tables()
+
+
+@pytest.fixture
+def client(nbp):
+    """TestClient of the app fetching from the stub, the tables are recreated after the test."""
+    app.dependency_overrides[get_nbp_client] = lambda: nbp
+    with TestClient(app) as test_client:
+        yield test_client
+    app.dependency_overrides.clear()
+    recreate_tables()
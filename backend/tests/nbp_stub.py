@@ -0,0 +1,168 @@
+"""Local stand-in for api.nbp.pl serving synthetic table A data, so fetch paths can run without network access."""
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CURRENCIES = {
+    "THB": "bat (Tajlandia)",
+    "USD": "dolar amerykański",
+    "AUD": "dolar australijski",
+    "CAD": "dolar kanadyjski",
+    "EUR": "euro",
+    "HUF": "forint (Węgry)",
+    "CHF": "frank szwajcarski",
+    "GBP": "funt szterling",
+    "JPY": "jen (Japonia)",
+    "CZK": "korona czeska",
+}
+
+
+def business_days(start_date: date, end_date: date) -> list[date]:
+    days = (end_date - start_date).days + 1
+    return [day for day in (start_date + timedelta(days=i) for i in range(days)) if day.weekday() < 5]
+
+
+def synthetic_mid(day: date, code: str) -> float:
+    """Deterministic, slowly drifting mid rate for a date and currency."""
+    base = 1 + sum(map(ord, code)) % 50 / 10
+    return round(base + (day.toordinal() % 365) / 10000, 4)
+
+
+ARCHIVE_UNITS = {"HUF": 100, "JPY": 100, "ISK": 100, "CLP": 100, "INR": 100, "KRW": 100, "IDR": 10000}
+
+
+def archive_csv(year: int, currencies: dict | None = None, last_date: date | None = None) -> bytes:
+    """
+    Synthetic rates of a year in the layout and encoding of the NBP table A archives (archiwum_tab_a_YYYY.csv), rates
+    of some codes quoted per 100 or 10000 units, codes and names in trailing rows.
+    """
+    currencies = currencies or CURRENCIES
+    units = {code: ARCHIVE_UNITS.get(code, 1) for code in currencies}
+    lines = [";".join(["data", *(f"{units[code]}{code}" for code in currencies), "nr tabeli", "pełny numer tabeli"])]
+    for number, day in enumerate(business_days(date(year, 1, 1), min(date(year, 12, 31), last_date or date.max)), 1):
+        rates = (f"{synthetic_mid(day, code) * units[code]:.4f}".replace(".", ",") for code in currencies)
+        lines.append(";".join([day.strftime("%Y%m%d"), *rates, str(number), f"{number:03d}/A/NBP/{year}"]))
+    lines.append(";".join(["kod ISO", *currencies]))
+    lines.append(";".join(["nazwa waluty", *currencies.values()]))
+    lines.append(";".join(["liczba jednostek", *map(str, units.values())]))
+    return ("\r\n".join(lines) + "\r\n").encode("cp1250")
+
+
+class NBPStubServer:
+    """Threaded HTTP server mimicking the NBP exchangerates endpoints for table A."""
+
+    def __init__(self, last_date: date = date(2025, 1, 22), latency: float = 0.0, currencies: dict | None = None):
+        self.last_date = last_date
+        self.latency = latency
+        self.currencies = currencies or CURRENCIES
+        self.fail_next = 0  # Number of upcoming requests answered with 503
+        self.requests: list[str] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api"
+
+    def start(self) -> "NBPStubServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "NBPStubServer":
+        return self.start()
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+    def tables(self, start_date: date, end_date: date) -> list[dict]:
+        return [
+            {
+                "table": "A",
+                "no": f"{day.timetuple().tm_yday:03d}/A/NBP/{day.year}",
+                "effectiveDate": day.isoformat(),
+                "rates": [
+                    {"currency": currency, "code": code, "mid": synthetic_mid(day, code)}
+                    for code, currency in self.currencies.items()
+                ],
+            }
+            for day in business_days(start_date, end_date)
+        ]
+
+    def code_rates(self, code: str, start_date: date, end_date: date) -> dict | None:
+        if code not in self.currencies:
+            return None
+        return {
+            "table": "A",
+            "currency": self.currencies[code],
+            "code": code,
+            "rates": [
+                {"no": f"{day.timetuple().tm_yday:03d}/A/NBP/{day.year}", "effectiveDate": day.isoformat(),
+                 "mid": synthetic_mid(day, code)}
+                for day in business_days(start_date, end_date)
+            ],
+        }
+
+    def resolve(self, path: str) -> dict | list | None:
+        parts = path.strip("/").split("/")[1:]  # Drop the "api" prefix
+        if parts[:3] == ["exchangerates", "tables", "a"]:
+            args = parts[3:]
+            if args == ["last"]:
+                return self.tables(self.last_date, self.last_date)[-1:] or None
+            start_date, end_date = date.fromisoformat(args[0]), date.fromisoformat(args[-1])
+            return self.tables(start_date, end_date) or None
+        if parts[:3] == ["exchangerates", "rates", "a"]:
+            code, args = parts[3].upper(), parts[4:]
+            if args == ["last"]:
+                data = self.code_rates(code, self.last_date, self.last_date)
+            else:
+                data = self.code_rates(code, date.fromisoformat(args[0]), date.fromisoformat(args[-1]))
+            return data if data and data["rates"] else None
+        return None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append(self.path)
+                    failing = stub.fail_next > 0
+                    stub.fail_next -= failing
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                if failing:
+                    self._send(503, b"Service Unavailable", "text/plain")
+                    return
+                try:
+                    data = stub.resolve(self.path)
+                except (ValueError, IndexError):
+                    self._send(400, b"400 BadRequest - Nieprawid\xc5\x82owy zakres dat", "text/plain")
+                    return
+                if data is None:
+                    self._send(404, b"404 NotFound - Brak danych", "text/plain")
+                    return
+                self._send(200, json.dumps(data, ensure_ascii=False).encode(), "application/json")
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        return Handler
@@ -0,0 +1,9 @@
+"""Helpers for tests and benchmarks serving the app or a stub on localhost."""
+import socket
+
+
+def free_port() -> int:
+    """A TCP port free on localhost, e.g. to serve the app on from a subprocess."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,79 @@
+import math
+from datetime import date
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from helpers import analytics
+from helpers.ingest import copy_rates
+from main import app
+from services.db_service import Base, SessionLocal, engine
+
+MIDS = np.array([
+    [np.nan, 4.0, 4.2],
+    [2.0, np.nan, 4.3],
+    [3.0, 3.0, 4.1],
+    [1.5, 5.0, 4.4],
+    [2.5, 4.5, 4.0],
+])
+
+
+@pytest.fixture
+def client():
+    db = SessionLocal()
+    codes = ["AAA", "BBB", "EUR"]
+    dates = [date(2025, 1, day) for day in (20, 21, 22, 23, 24)]
+    copy_rates(db, [
+        (day, code, code, mid) for day, row in zip(dates, MIDS) for code, mid in zip(codes, row) if not math.isnan(mid)
+    ])
+    db.commit()
+    db.close()
+    with TestClient(app) as test_client:
+        yield test_client
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def test_rolling_mean_std_matches_naive_windows():
+    mean, std = analytics.rolling_mean_std(MIDS, 3)
+    for row in range(len(MIDS)):
+        for column in range(MIDS.shape[1]):
+            window = MIDS[max(row - 2, 0):row + 1, column]
+            if row < 2 or np.isnan(window).any():
+                assert np.isnan(mean[row, column]) and np.isnan(std[row, column])
+            else:
+                assert mean[row, column] == pytest.approx(window.mean())
+                assert std[row, column] == pytest.approx(window.std(ddof=1))
+
+
+def test_summary_and_drawdown():
+    statistics = analytics.summary(MIDS)
+    assert statistics["observations"].tolist() == [4, 4, 5]
+    assert statistics["first"].tolist() == [2.0, 4.0, 4.2]
+    assert statistics["last"].tolist() == [2.5, 4.5, 4.0]
+    assert statistics["min"].tolist() == [1.5, 3.0, 4.0]
+    assert statistics["max_drawdown"] == pytest.approx([-0.5, -0.25, 4.0 / 4.4 - 1])
+
+
+def test_log_returns_endpoint(client):
+    response = client.get("/analytics/returns", params={"date_from": "2025-01-20", "date_to": "2025-01-24",
+                                                        "code": ["aaa", "bbb"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["dates"] == ["2025-01-20", "2025-01-21", "2025-01-22", "2025-01-23", "2025-01-24"]
+    assert data["returns"]["AAA"][:3] == [None, None, pytest.approx(math.log(3 / 2))]
+    assert data["returns"]["BBB"][1] == 0.0  # Missing mid carried forward
+
+
+def test_cross_rates_endpoint(client):
+    response = client.get("/analytics/cross", params={"date_from": "2025-01-20", "date_to": "2025-01-24",
+                                                      "pair": ["BBB/EUR", "EUR/PLN"]})
+    assert response.status_code == 200
+    rates = response.json()["rates"]
+    assert rates["BBB/EUR"][0] == pytest.approx(4.0 / 4.2)
+    assert rates["EUR/PLN"] == pytest.approx(MIDS[:, 2].tolist())
+
+    response = client.get("/analytics/cross", params={"date_from": "2025-01-20", "date_to": "2025-01-24",
+                                                      "pair": ["USD/EUR"]})
+    assert response.status_code == 404
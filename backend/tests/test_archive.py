@@ -0,0 +1,108 @@
+import asyncio
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from helpers import services
+from helpers.archive import ARCHIVE_ENCODING, ArchiveParser
+from import_archive import import_files
+from main import app
+from services.db_service import Base, engine
+from tests.nbp_stub import CURRENCIES, archive_csv, business_days, synthetic_mid
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def parse_in_chunks(body: bytes, encoding: str = "cp1250", chunk_size: int = 7) -> list[services.RateRecord]:
+    parser = ArchiveParser(encoding)
+    records = []
+    for start in range(0, len(body), chunk_size):
+        records.extend(parser.feed(body[start:start + chunk_size]))
+    return records + parser.close()
+
+
+def test_parse_archive_in_chunks():
+    records = parse_in_chunks(archive_csv(2025, last_date=date(2025, 1, 17)))
+    assert [(day, code) for day, _, code, _ in records] == [
+        (day, code) for day in business_days(date(2025, 1, 1), date(2025, 1, 17)) for code in CURRENCIES
+    ]
+    # Rates of 100 HUF and 100 JPY are stored per unit, like those of the API
+    assert all(mid == pytest.approx(synthetic_mid(day, code), abs=1e-9) for day, _, code, mid in records)
+
+
+def test_parse_archive_layout_variants():
+    body = "\n".join([
+        "\ufeffdata;1USD;100JPY;1XEU;nr tabeli;",
+        ";dolar amerykański;jen (Japonia);ECU;;",
+        "nazwa waluty;dolar amerykański;jen (Japonia);ECU",
+        "2002-01-02;3,9847;3,0270;0,0000;1;",
+        "20020103;3,9881;;3,5100",
+        "kod ISO;USD;JPY;XEU",
+    ]).encode("utf-8")
+    parser = ArchiveParser("utf-8")
+    assert parser.feed(body) + parser.close() == [
+        (date(2002, 1, 2), "dolar amerykański", "USD", 3.9847),
+        (date(2002, 1, 2), "jen (Japonia)", "JPY", 0.03027),
+        (date(2002, 1, 3), "dolar amerykański", "USD", 3.9881),
+        (date(2002, 1, 3), "ECU", "XEU", 3.51),
+    ]
+
+    with pytest.raises(ValueError, match="header"):
+        parse_in_chunks(b'[{"table": "A"}]')
+
+
+def test_import_archive(client):
+    body = archive_csv(2025, last_date=date(2025, 1, 17))
+    response = client.post("/currencies/import/archive", content=body)
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 13 * len(CURRENCIES)
+
+    # Names from the trailing row replace the codes new currencies were added with
+    rates = {rate["code"]: rate for rate in client.get("/currencies/2025-01-15").json()}
+    assert rates["JPY"]["currency"] == "jen (Japonia)"
+    assert rates["JPY"]["mid"] == pytest.approx(synthetic_mid(date(2025, 1, 15), "JPY"))
+
+    response = client.post("/currencies/import/archive", content=body)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "All rates of the archive are already in the database."
+
+    response = client.post("/currencies/import/archive", content=b"data;1USD\n20250130;4,1x\n")
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Invalid archive file")
+    assert client.post("/currencies/import/archive", params={"encoding": "nope"}, content=body).status_code == 400
+
+
+def test_import_archive_keeps_decimals_of_10000_units(client):
+    body = "\n".join(["data;10000IDR;1USD", "20250102;2,4557;4,1012", "kod ISO;IDR;USD",
+                       "nazwa waluty;rupia indonezyjska;dolar amerykański"]).encode(ARCHIVE_ENCODING)
+    assert client.post("/currencies/import/archive", content=body).json()["inserted"] == 2
+    rates = client.get("/currencies/2025-01-02").json()
+    assert [(rate["code"], rate["mid"]) for rate in rates] == [("IDR", 0.00024557), ("USD", 4.1012)]
+
+
+def test_import_archive_files(tmp_path):
+    paths = []
+    for year in (2023, 2024):
+        paths.append(str(tmp_path / f"archiwum_tab_a_{year}.csv"))
+        with open(paths[-1], "wb") as file:
+            file.write(archive_csv(year))
+
+    results = asyncio.run(import_files(paths, jobs=2, verbose=False))
+    expected = [len(business_days(date(year, 1, 1), date(year, 12, 31))) * len(CURRENCIES) for year in (2023, 2024)]
+    assert [result.inserted for result in results] == expected
+
+    results = asyncio.run(import_files(paths, verbose=False))
+    assert [(result.inserted, result.skipped) for result in results] == [(0, count) for count in expected]
+    with engine.connect() as connection:
+        assert connection.scalar(text("SELECT count(*) FROM rates")) == sum(expected)
+        assert connection.scalar(text("SELECT currency FROM currencies WHERE code = 'HUF'")) == "forint (Węgry)"
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
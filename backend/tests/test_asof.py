@@ -0,0 +1,111 @@
+from datetime import date
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from helpers.asof import RateSeries, as_of_index, merge_series
+from helpers.snapshot import rate_snapshot
+from tests.nbp_stub import synthetic_mid
+
+
+@pytest.fixture
+def client(client):
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-13", "date_to": "2025-01-17"})
+    return client
+
+
+def as_of_date(client: TestClient, request_date: str) -> str:
+    return client.get(f"/currencies/asof/{request_date}", params={"code": "USD"}).json()[0]["update_date"]
+
+
+def test_merge_series():
+    current = RateSeries(np.array(["2025-01-02", "2025-01-06"], dtype="datetime64[D]"), np.array([1.0, 3.0]))
+    update = RateSeries(np.array(["2025-01-03", "2025-01-06"], dtype="datetime64[D]"), np.array([2.0, 4.0]))
+    merged = merge_series(current, update)
+    assert merged.dates.astype(str).tolist() == ["2025-01-02", "2025-01-03", "2025-01-06"]
+    assert merged.mids.tolist() == [1.0, 2.0, 4.0]
+
+
+def test_rates_as_of_weekend(stub, client):
+    response = client.get("/currencies/asof/2025-01-19", params={"code": ["usd", "EUR", "XXX"]})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"update_date": "2025-01-17", "currency": "dolar amerykański", "code": "USD",
+         "mid": synthetic_mid(date(2025, 1, 17), "USD")},
+        {"update_date": "2025-01-17", "currency": "euro", "code": "EUR",
+         "mid": synthetic_mid(date(2025, 1, 17), "EUR")},
+    ]
+    assert len(client.get("/currencies/asof/2025-01-15").json()) == len(stub.currencies)
+    assert client.get("/currencies/asof/2025-01-10").status_code == 404
+    assert client.get("/currencies/asof/2999-01-01").status_code == 400
+
+
+def test_index_follows_ingestion(client):
+    assert as_of_date(client, "2025-01-22") == "2025-01-17"
+    loaded_rates = client.get("/stats/cache").json()["as_of"]["rates"]
+
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-20", "date_to": "2025-01-21"})
+    assert as_of_date(client, "2025-01-22") == "2025-01-21"
+    stats = client.get("/stats/cache").json()["as_of"]
+    assert (stats["source"], stats["rates"]) == ("db", loaded_rates + 2 * stats["codes"])
+
+
+def test_convert(client):
+    usd, eur = synthetic_mid(date(2025, 1, 17), "USD"), synthetic_mid(date(2025, 1, 17), "EUR")
+    params = {"amount": 100, "from": "usd", "to": "EUR", "date": "2025-01-18"}
+    response = client.get("/currencies/convert", params=params)
+    assert response.status_code == 200
+    assert response.json() == {"result": pytest.approx(100 * usd / eur), "rate": pytest.approx(usd / eur),
+                               "from_rate_date": "2025-01-17", "to_rate_date": "2025-01-17"}
+
+    response = client.get("/currencies/convert", params={**params, "amount": 10, "to": "PLN", "date": "2025-01-14"})
+    assert response.json()["result"] == pytest.approx(10 * synthetic_mid(date(2025, 1, 14), "USD"))
+
+    response = client.get("/currencies/convert", params={**params, "date": "2025-01-01"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "No USD/EUR rates found on or before 2025-01-01. Try to download them first."
+
+
+def test_convert_batch(client):
+    rng = np.random.default_rng(0)
+    days = [date(2025, 1, day) for day in range(10, 20)]
+    items = [
+        {"amount": float(amount), "from": str(source), "to": str(target), "date": str(day)}
+        for amount, source, target, day in zip(
+            rng.uniform(1, 1000, 5000), rng.choice(["USD", "EUR", "CHF", "PLN"], 5000),
+            rng.choice(["GBP", "PLN", "JPY"], 5000), rng.choice(days, 5000),
+        )
+    ]
+    batch = {"amounts": [item["amount"] for item in items], "from": [item["from"] for item in items],
+             "to": [item["to"] for item in items], "dates": [item["date"] for item in items]}
+    response = client.post("/currencies/convert", json=batch)
+    assert response.status_code == 200
+    columns = response.json()
+    results = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    assert len(results) == len(items)
+
+    for item, result in list(zip(items, results))[:200]:
+        single = client.get("/currencies/convert", params=item)
+        if date.fromisoformat(item["date"]) < date(2025, 1, 13) and item["from"] + item["to"] != "PLNPLN":
+            assert (single.status_code, result["result"]) == (404, None)
+        else:
+            assert single.json() == result
+
+    assert client.post("/currencies/convert", json={**batch, "dates": ["2999-01-01"] * len(items)}).status_code == 400
+    assert client.post("/currencies/convert", json={**batch, "dates": batch["dates"][1:]}).status_code == 422
+    assert client.post("/currencies/convert", json={**batch, "amounts": ["many"] * len(items)}).status_code == 422
+
+
+def test_index_from_snapshot(client, tmp_path):
+    rate_snapshot.directory = str(tmp_path)
+    try:
+        client.post("/currencies/fetch/tables", params={"date_from": "2025-01-20", "date_to": "2025-01-20"})
+        assert as_of_date(client, "2025-01-21") == "2025-01-20"
+        assert client.get("/stats/cache").json()["as_of"]["source"] == "snapshot"
+
+        client.post("/currencies/fetch/tables", params={"date_from": "2025-01-21", "date_to": "2025-01-21"})
+        assert as_of_date(client, "2025-01-21") == "2025-01-21"
+    finally:
+        rate_snapshot.directory = ""
+        rate_snapshot._snapshot = rate_snapshot._version = None
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from models import BackfillChunk, Rate
+from services import backfill_service
+from services.db_service import AsyncSessionLocal, async_engine
+from tests.nbp_stub import business_days
+
+
+@pytest.fixture
+def nbp_options() -> dict:
+    return {"retries": 0}  # Failed chunks are tested without waiting for retries
+
+
+def wait_for_job(client: TestClient, job_id: int) -> dict:
+    for _ in range(100):
+        status = client.get(f"/backfill/{job_id}").json()
+        if status["status"] in ("completed", "failed"):
+            return status
+        time.sleep(0.05)
+    raise TimeoutError(f"Backfill job {job_id} did not finish")
+
+
+def test_backfill_beyond_request_limit(stub, client, db):
+    date_from, date_to = date(2023, 1, 1), date(2024, 12, 31)
+    response = client.post("/backfill/", params={"date_from": date_from, "date_to": date_to})
+    assert response.status_code == 202
+
+    status = wait_for_job(client, response.json()["id"])
+    expected_rows = len(business_days(date_from, date_to)) * len(stub.currencies)
+    assert status["status"] == "completed"
+    assert status["chunks_done"] == status["chunks_total"] == 9
+    assert status["rows_inserted"] == expected_rows
+    assert db.query(Rate).count() == expected_rows
+
+
+def test_backfill_includes_last_day_of_a_split_period_plus_one(stub, client, db):
+    date_from, date_to = date(2024, 1, 2), date(2024, 4, 1)  # 91 days, one more than a table window
+    response = client.post("/backfill/", params={"date_from": date_from, "date_to": date_to})
+    status = wait_for_job(client, response.json()["id"])
+    assert (status["status"], status["chunks_total"]) == ("completed", 2)
+    assert status["rows_inserted"] == len(business_days(date_from, date_to)) * len(stub.currencies)
+    assert db.query(Rate).filter(Rate.update_date == date_to).count() == len(stub.currencies)
+
+
+def test_backfill_window_without_tables(stub, client, db):
+    response = client.post("/backfill/", params={"date_from": "2025-01-18", "date_to": "2025-01-19"})  # Weekend
+    status = wait_for_job(client, response.json()["id"])
+    assert (status["status"], status["chunks_done"], status["rows_inserted"]) == ("completed", 1, 0)
+
+
+def test_backfill_resumes_from_checkpoint(stub, nbp, db):
+    async def resume_after_crash():
+        try:
+            async with AsyncSessionLocal() as session:
+                job = await backfill_service.create_job(session, date(2024, 1, 1), date(2024, 6, 30))
+                await session.execute(  # First chunk checkpointed before a crash
+                    update(BackfillChunk)
+                    .where(BackfillChunk.job_id == job.id, BackfillChunk.date_from == date(2024, 1, 1))
+                    .values(status="done")
+                )
+                await session.commit()
+
+                await backfill_service.run_job(job.id, nbp)
+                return await backfill_service.get_job_status(session, job.id)
+        finally:
+            await async_engine.dispose()
+
+    status = asyncio.run(resume_after_crash())
+
+    assert sorted(stub.requests) == ["/api/exchangerates/tables/a/2024-03-31/2024-06-28",
+                                     "/api/exchangerates/tables/a/2024-06-29/2024-06-30"]
+    assert status["status"] == "completed"
+
+
+def test_backfill_failed_chunks_can_be_resumed(stub, client):
+    stub.fail_next = 100
+    response = client.post("/backfill/", params={"date_from": "2024-01-01", "date_to": "2024-01-31"})
+    status = wait_for_job(client, response.json()["id"])
+    assert status["status"] == "failed"
+    assert status["chunks_failed"] == 1
+
+    stub.fail_next = 0
+    client.post(f"/backfill/{status['id']}/resume")
+    status = wait_for_job(client, status["id"])
+    assert status["status"] == "completed"
+    assert status["rows_inserted"] == 23 * len(stub.currencies)
+
+
+def test_backfill_invalid_dates(client):
+    response = client.post("/backfill/", params={"date_from": "2001-12-31", "date_to": "2002-01-31"})
+    assert response.status_code == 400
+    assert "available from 2002-01-02" in response.json()["detail"]
+
+    response = client.get("/backfill/999")
+    assert response.status_code == 404
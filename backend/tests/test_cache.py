@@ -0,0 +1,84 @@
+import asyncio
+from datetime import date, timedelta
+
+from helpers import queries
+from helpers.cache import RangeCache, rates_cache
+from services.db_service import AsyncSessionLocal, Base, async_engine, engine
+
+
+def test_lru_eviction_and_counters():
+    cache = RangeCache(max_entries=2)
+    cache.put(date(2024, 1, 1), date(2024, 1, 31), None, ["january"])
+    cache.put(date(2024, 2, 1), date(2024, 2, 29), None, ["february"])
+    assert cache.get(date(2024, 1, 1), date(2024, 1, 31)) == ["january"]
+
+    cache.put(date(2024, 3, 1), date(2024, 3, 31), None, ["march"])  # Evicts february, the least recently used
+    assert cache.get(date(2024, 2, 1), date(2024, 2, 29)) is None
+    assert cache.stats() | {"hit_rate": None} == {
+        "entries": 2, "max_entries": 2, "hits": 1, "misses": 1, "hit_rate": None
+    }
+
+
+def test_ranges_including_today_expire():
+    cache = RangeCache(today_ttl=0)
+    cache.put(date.today() - timedelta(days=7), date.today(), None, ["this week"])
+    cache.put(date(2024, 1, 1), date(2024, 1, 31), None, ["january"])
+    assert cache.get(date.today() - timedelta(days=7), date.today()) is None
+    assert cache.get(date(2024, 1, 1), date(2024, 1, 31)) == ["january"]
+
+
+def test_invalidate_only_overlapping_ranges():
+    cache = RangeCache()
+    cache.put(date(2024, 1, 1), date(2024, 12, 31), None, ["2024"])
+    cache.put(date(2024, 1, 1), date(2024, 1, 31), "USD", ["USD january"])
+    cache.put(date(2024, 1, 1), date(2024, 1, 31), "EUR", ["EUR january"])
+    cache.put(date(2024, 2, 1), date(2024, 2, 29), "USD", ["USD february"])
+
+    cache.invalidate(date(2024, 1, 15), date(2024, 1, 16), {"USD"})
+
+    assert cache.get(date(2024, 1, 1), date(2024, 12, 31)) is None
+    assert cache.get(date(2024, 1, 1), date(2024, 1, 31), "USD") is None
+    assert cache.get(date(2024, 1, 1), date(2024, 1, 31), "EUR") == ["EUR january"]
+    assert cache.get(date(2024, 2, 1), date(2024, 2, 29), "USD") == ["USD february"]
+
+
+def test_results_queried_before_an_invalidation_are_not_cached():
+    cache = RangeCache()
+    generation = cache.generation
+    cache.invalidate(date(2024, 3, 1), date(2024, 3, 1), {"USD"})
+    cache.put(date(2024, 1, 1), date(2024, 1, 31), None, ["january"], generation)
+    assert cache.get(date(2024, 1, 1), date(2024, 1, 31)) is None
+    cache.put(date(2024, 1, 1), date(2024, 1, 31), None, ["january"], cache.generation)
+    assert cache.get(date(2024, 1, 1), date(2024, 1, 31)) == ["january"]
+
+
+def test_read_interleaved_with_an_ingest():
+    january = (date(2024, 1, 1), date(2024, 1, 31))
+
+    async def read_while_ingesting():
+        try:
+            async with AsyncSessionLocal() as db:
+                await queries.add_rates_to_db(db, [(date(2024, 1, 2), "euro", "EUR", 4.36)])
+            async with AsyncSessionLocal() as reader:
+                execute = reader.execute
+
+                async def execute_then_ingest(*args, **kwargs):
+                    result = await execute(*args, **kwargs)
+                    async with AsyncSessionLocal() as db:  # Commits and invalidates before the reader caches
+                        await queries.add_rates_to_db(db, [(date(2024, 1, 3), "euro", "EUR", 4.35)])
+                    return result
+
+                reader.execute = execute_then_ingest
+                stale, _, _ = await queries.get_rates_for_period(reader, *january)
+            async with AsyncSessionLocal() as db:
+                current, _, _ = await queries.get_rates_for_period(db, *january)
+            return stale, current
+        finally:
+            await async_engine.dispose()
+            Base.metadata.drop_all(bind=engine)
+            Base.metadata.create_all(bind=engine)
+
+    stale, current = asyncio.run(read_while_ingesting())
+    assert [rate.update_date for rate in stale] == [date(2024, 1, 2)]
+    assert [rate.update_date for rate in current] == [date(2024, 1, 2), date(2024, 1, 3)]
+    assert rates_cache.get(*january) == current
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import signal
+import subprocess
+import sys
+import time
+from datetime import date
+
+import httpx
+import pytest
+
+from helpers import ingest, queries
+from helpers.cache import rates_cache
+from helpers.events import RateEvents, rate_events
+from services.db_service import AsyncSessionLocal, Base, async_engine, engine
+from tests.nbp_stub import archive_csv
+from tests.servers import free_port
+
+
+@pytest.fixture(autouse=True)
+def recreate_tables():
+    yield
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def event_data(event: bytes) -> dict:
+    name, data = event.decode().strip().split("\n")
+    assert name == "event: rates"
+    return json.loads(data.removeprefix("data: "))
+
+
+def test_publish_to_local_and_other_workers(monkeypatch):
+    other_worker = RateEvents()
+
+    async def ingest_and_receive():
+        try:
+            other_worker.start()
+            rate_events.start(listen=False)
+            while not other_worker.stats()["listening"]:
+                await asyncio.sleep(0.01)
+            local, remote = rate_events.stream(), other_worker.stream()
+            assert await anext(local) == await anext(remote) == b"retry: 3000\n\n"
+            rates_cache.put(date(2025, 1, 1), date(2025, 1, 31), None, ["cached by the other worker"])
+
+            records = [(date(2025, 1, 23), "euro", "EUR", 4.21),
+                       (date(2025, 1, 23), "dolar amerykański", "USD", 4.0124)]
+            async with AsyncSessionLocal() as db:
+                await queries.add_rates_to_db(db, records)
+            received = [event_data(await asyncio.wait_for(anext(stream), 5)) for stream in (local, remote)]
+
+            async with AsyncSessionLocal() as db:  # Spans the stored 2025-01-23, only inserted rows are sent
+                await queries.add_rates_to_db(db, [(date(2025, 1, 22), "dolar amerykański", "USD", 4.03),
+                                                   (date(2025, 1, 24), "dolar amerykański", "USD", 4.01)])
+            received.append(event_data(await asyncio.wait_for(anext(remote), 5)))
+
+            monkeypatch.setattr(ingest, "INSERTED_ROWS_MAX", 1)  # Larger deltas only carry range and codes
+            async with AsyncSessionLocal() as db:
+                await queries.add_rates_to_db(db, [(date(2025, 1, 27), "euro", "EUR", 4.2),
+                                                   (date(2025, 1, 27), "dolar amerykański", "USD", 4.01)])
+            received.append(event_data(await asyncio.wait_for(anext(remote), 5)))
+            return received
+        finally:
+            await other_worker.stop()
+            await rate_events.stop()
+            await async_engine.dispose()
+
+    local, remote, spanning, large = asyncio.run(ingest_and_receive())
+    assert local == remote
+    assert local["rates"] == {"dates": ["2025-01-23", "2025-01-23"], "currencies": ["euro", "dolar amerykański"],
+                              "codes": ["EUR", "USD"], "mid": [4.21, 4.0124]}
+    assert (local["date_from"], local["codes"], local["inserted"]) == ("2025-01-23", ["EUR", "USD"], 2)
+    assert rates_cache.get(date(2025, 1, 1), date(2025, 1, 31)) is None
+    assert spanning["rates"]["dates"] == ["2025-01-22", "2025-01-24"]
+    assert (large["date_to"], large["inserted"], large["rates"]) == ("2025-01-27", 2, None)
+
+
+def test_event_stream_of_workers():
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "serve", "--port", str(port), "--workers", "2",
+                               "--log-level", "warning"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/stats/events")
+                break
+            except httpx.TransportError:
+                assert server.poll() is None and time.monotonic() < deadline
+                time.sleep(0.1)
+
+        # Whichever worker serves the stream, it is told of the import by any of them
+        with httpx.stream("GET", f"http://127.0.0.1:{port}/currencies/events", timeout=10) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            lines = response.iter_lines()
+            assert next(lines) == "retry: 3000"
+            body = archive_csv(2025, {"USD": "dolar amerykański"}, last_date=date(2025, 1, 3))
+            assert httpx.post(f"http://127.0.0.1:{port}/currencies/import/archive", content=body).status_code == 200
+            while next(lines) != "event: rates":
+                pass
+            delta = json.loads(next(lines).removeprefix("data: "))
+            assert (delta["date_from"], delta["date_to"], delta["inserted"]) == ("2025-01-01", "2025-01-03", 3)
+            assert delta["rates"]["currencies"] == ["dolar amerykański"] * 3
+
+            server.send_signal(signal.SIGTERM)  # Open streams end with the shutdown instead of holding it
+            assert list(lines)[-1:] in ([], [""])
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
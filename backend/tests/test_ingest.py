@@ -0,0 +1,116 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+
+from helpers import queries
+from helpers.ingest import copy_rates, copy_rates_async
+from models import Currency, Rate
+from services.db_service import AsyncSessionLocal, SessionLocal, async_engine
+
+
+def test_copy_rates_reports_inserted_and_skipped(db):
+    records = [
+        (date(2025, 1, 22), "dolar amerykański", "USD", 4.0901),
+        (date(2025, 1, 22), "euro", "EUR", 4.2614),
+        (date(2025, 1, 23), "euro", "EUR", 4.2598),
+    ]
+    assert copy_rates(db, iter(records))[:2] == (3, 0)
+    db.commit()
+
+    records.append((date(2025, 1, 23), "euro", "EUR", 4.2598))  # Duplicate inside one batch
+    records.append((date(2025, 1, 23), "nazwa\tz tabulatorem \\", "XXX", 1.0))
+    assert copy_rates(db, records)[:4] == (1, 4, date(2025, 1, 23), date(2025, 1, 23))
+    db.commit()
+
+    assert db.query(Rate).count() == 4
+    assert db.query(Currency.currency).filter(Currency.code == "XXX").scalar() == "nazwa\tz tabulatorem \\"
+
+
+def test_overlapping_loads_do_not_duplicate_rates(db):
+    records = [(date(2025, 1, 22), "euro", "EUR", 4.2614), (date(2025, 1, 22), "dolar amerykański", "USD", 4.0901)]
+    other_db = SessionLocal()
+    try:
+        assert copy_rates(db, records[:1])[:2] == (1, 0)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            overlapping = executor.submit(copy_rates, other_db, records)  # Waits on the uncommitted EUR row
+            db.commit()
+            assert overlapping.result(timeout=10)[:2] == (1, 1)
+        other_db.commit()
+    finally:
+        other_db.close()
+
+    assert db.query(Rate).count() == 2
+
+
+def test_rates_reference_currencies_and_keep_exact_mids(db):
+    records = [
+        (date(2025, 1, 22), "forint (Węgry)", "HUF", 0.010353),
+        (date(2025, 1, 22), "euro", "EUR", 4.2614),
+        (date(2025, 1, 23), "euro", "EUR", 4.259812),
+    ]
+    copy_rates(db, records)
+    copy_rates(db, [(date(2025, 1, 24), "euro (nowa nazwa)", "EUR", 4.25)])
+    db.commit()
+
+    assert db.query(Currency.code, Currency.currency).order_by(Currency.code).all() == [
+        ("EUR", "euro"), ("HUF", "forint (Węgry)")
+    ]
+    stored = db.query(Rate.update_date, Currency.code, Rate.mid_scaled, Rate.mid).join(Currency).order_by(
+        Rate.update_date, Currency.code
+    ).all()
+    assert [mid_scaled for _, _, mid_scaled, _ in stored] == [426140000, 1035300, 425981200, 425000000]
+    assert [(day, code, mid) for day, code, _, mid in stored] == [
+        (day, code, mid) for day, _, code, mid in sorted(records, key=lambda record: record[::2])
+    ] + [(date(2025, 1, 24), "EUR", 4.25)]
+
+
+def test_concurrent_ingests_keep_aggregates_exact(db):
+    first = [(date(2025, 1, day), "euro", "EUR", 4.2 + day / 1000) for day in (2, 3, 6)]
+    second = [(date(2025, 1, day), "euro", "EUR", 4.3 + day / 1000) for day in (7, 8)]
+    db.add(Currency(code="EUR", currency="euro"))  # Ingests adding the same new code would wait for each other
+    db.commit()
+
+    async def ingest_concurrently():
+        try:
+            async with AsyncSessionLocal() as first_db, AsyncSessionLocal() as second_db:
+                await queries.add_rates_to_db(first_db, first, commit=False)
+                overlapping = asyncio.create_task(queries.add_rates_to_db(second_db, second))
+                await asyncio.sleep(0.5)  # The second ingest refreshes January while the first is uncommitted
+                await first_db.commit()
+                await overlapping
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(ingest_concurrently())
+    assert db.execute(text(
+        "SELECT period, observations, avg_mid FROM rate_aggregates WHERE code = 'EUR' ORDER BY period"
+    )).all() == db.execute(text(
+        "SELECT p.period, count(*), sum(r.mid_scaled)::float8 / count(*) / 100000000 FROM rates r "
+        "CROSS JOIN (VALUES ('month'), ('quarter'), ('year')) p(period) GROUP BY p.period ORDER BY p.period"
+    )).all()
+
+
+def test_insert_stage_excludes_waiting_for_streamed_records(db):
+    async def slow_records():
+        for day in (20, 21, 22):
+            await asyncio.sleep(0.2)  # E.g. the next chunk of an upstream response
+            yield date(2025, 1, day), "dolar amerykański", "USD", 4.09
+
+    async def ingest():
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await copy_rates_async(session, slow_records())
+                await session.commit()
+                return result
+        finally:
+            await async_engine.dispose()
+
+    def insert_seconds() -> float:
+        return REGISTRY.get_sample_value("stage_duration_seconds_sum", {"stage": "insert"}) or 0.0
+
+    before = insert_seconds()
+    assert asyncio.run(ingest()).inserted == 3
+    assert insert_seconds() - before < 0.3
@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def scrape(client: TestClient) -> dict[tuple[str, tuple], float]:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+
+
+def test_request_latency_by_route_template(client):
+    before = scrape(client)
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-13", "date_to": "2025-01-17"})
+    client.get("/currencies/2025-01-13")
+    client.get("/currencies/2025-01-14")
+    client.get("/no-such-route")
+    after = scrape(client)
+
+    def increase(name: str, **labels) -> float:
+        key = (name, tuple(sorted(labels.items())))
+        return after.get(key, 0) - before.get(key, 0)
+
+    route_labels = {"method": "GET", "route": "/currencies/{request_date}", "status": "200"}
+    assert increase("http_request_duration_seconds_count", **route_labels) == 2
+    assert increase("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") == 1
+    assert increase("nbp_upstream_requests_total", status="200") == 1
+    for stage in ("upstream_fetch", "json_parse", "insert", "diff", "aggregate_refresh", "commit", "db_query",
+                  "serialize"):
+        assert increase("stage_duration_seconds_count", stage=stage) >= 1, stage
+
+
+def test_stats_gauges(client):
+    client.get("/currencies/2025-01-13")
+    samples = scrape(client)
+    for name in ("db_pool_size", "db_pool_checked_out", "rates_cache_hit_rate", "nbp_client_cache_hits",
+                 "fill_missing_coalesced", "ingest_scheduler_runs"):
+        assert (name, ()) in samples, name
@@ -0,0 +1,200 @@
+import asyncio
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from services import fill_service
+from services.db_service import AsyncSessionLocal, Base, async_engine, engine
+from services.nbp_service import NBPClient
+from tests.nbp_stub import business_days, synthetic_mid
+
+
+def test_get_retries_transient_errors(stub, nbp):
+    stub.fail_next = 2
+    response = asyncio.run(nbp.get("/exchangerates/tables/a/last"))
+    assert response.status_code == 200
+    assert len(stub.requests) == 3
+
+
+def test_get_gives_up_after_retries(stub, nbp):
+    stub.fail_next = nbp.retries + 1
+    response = asyncio.run(nbp.get("/exchangerates/tables/a/last"))
+    assert response.status_code == 503
+    assert len(stub.requests) == nbp.retries + 1
+
+
+def test_get_does_not_retry_client_errors(stub, nbp):
+    response = asyncio.run(nbp.get("/exchangerates/tables/a/2025-01-18/2025-01-19"))
+    assert response.status_code == 404
+    assert len(stub.requests) == 1
+
+
+def test_get_many_runs_concurrently(stub, nbp):
+    stub.latency = 0.2
+    paths = [f"/exchangerates/tables/a/2024-0{month}-01/2024-0{month}-28" for month in range(1, 5)]
+
+    started = time.perf_counter()
+    responses = asyncio.run(nbp.get_many(paths))
+    elapsed = time.perf_counter() - started
+
+    assert [response.json()[0]["effectiveDate"][:7] for response in responses] == [
+        "2024-01", "2024-02", "2024-03", "2024-04"
+    ]
+    assert elapsed < 0.2 * len(paths)
+
+
+def test_fetch_table_over_split_period(stub, client):
+    date_to = date(2025, 1, 22)
+    date_from = date_to - timedelta(days=200)
+    response = client.post("/currencies/fetch/tables", params={"date_from": date_from, "date_to": date_to})
+    assert response.status_code == 200
+    assert len(stub.requests) == 3  # 201 days split into 90-day windows
+
+    response = client.get("/currencies/2025-01-22")
+    assert len(response.json()) == len(stub.currencies)
+
+
+def test_fetch_last_table_and_rates(stub, client):
+    response = client.post("/currencies/fetch/tables")
+    assert response.json()["message"] == f"Added {len(stub.currencies)} rates"
+
+    response = client.post("/currencies/fetch/rates", params={"code": "usd", "date_from": "2025-01-13",
+                                                              "date_to": "2025-01-22"})
+    assert response.json()["message"] == "Added 7 rates"
+
+
+def test_fetch_invalidates_cached_rates(stub, client):
+    client.post("/currencies/fetch/rates", params={"code": "USD", "date_from": "2025-01-20", "date_to": "2025-01-20"})
+    assert len(client.get("/currencies/2025-01", params={"code": "USD"}).json()) == 1
+    assert len(client.get("/currencies/2025-01", params={"code": "USD"}).json()) == 1
+    assert client.get("/stats/cache").json()["rates"]["hits"] >= 1
+
+    client.post("/currencies/fetch/rates", params={"code": "USD", "date_from": "2025-01-21", "date_to": "2025-01-22"})
+    assert len(client.get("/currencies/2025-01", params={"code": "USD"}).json()) == 3
+
+
+def test_aggregates_follow_ingestion(stub, client):
+    client.post("/currencies/fetch/rates", params={"code": "USD", "date_from": "2024-12-02", "date_to": "2025-01-10"})
+    response = client.get("/currencies/2025", params={"code": "USD", "aggregate": "month"})
+    assert response.status_code == 200
+    assert [(row["period_start"], row["observations"]) for row in response.json()] == [("2025-01-01", 8)]
+
+    client.post("/currencies/fetch/rates", params={"code": "USD", "date_from": "2025-01-13", "date_to": "2025-01-22"})
+    january = client.get("/currencies/2025-01", params={"code": "USD", "aggregate": "month"}).json()
+    assert len(january) == 1
+    expected = [synthetic_mid(day, "USD") for day in business_days(date(2025, 1, 1), date(2025, 1, 22))]
+    assert january[0]["observations"] == len(expected) == 16
+    assert january[0]["avg_mid"] == pytest.approx(sum(expected) / len(expected))
+    assert (january[0]["first_mid"], january[0]["last_mid"]) == (expected[0], expected[-1])
+
+    quarters = client.get("/currencies/2024", params={"aggregate": "quarter"}).json()
+    assert [(row["period_start"], row["code"], row["observations"]) for row in quarters] == [("2024-10-01", "USD", 22)]
+
+
+def test_fetch_missing_fills_only_gaps(stub, client):
+    client.post("/currencies/fetch/rates", params={"code": "USD", "date_from": "2025-01-13", "date_to": "2025-01-15"})
+    stub.requests.clear()
+
+    response = client.get("/currencies/2025-01", params={"code": "USD", "fetch_missing": True})
+    assert response.status_code == 200
+    assert [row["update_date"] for row in response.json()] == [
+        day.isoformat() for day in business_days(date(2025, 1, 1), date(2025, 1, 31))
+    ]
+    assert sorted(stub.requests) == [
+        "/api/exchangerates/rates/a/USD/2025-01-01/2025-01-10", "/api/exchangerates/rates/a/USD/2025-01-16/2025-01-31"
+    ]
+
+    stub.requests.clear()
+    assert client.get("/currencies/2025-01", params={"code": "USD", "fetch_missing": True}).status_code == 200
+    assert stub.requests == []
+
+
+def test_fetch_missing_completes_tables_of_single_code_dates(stub, client):
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-01", "date_to": "2025-01-13"})
+    client.post("/currencies/fetch/rates", params={"code": "USD", "date_from": "2025-01-14", "date_to": "2025-01-15"})
+    stub.requests.clear()
+
+    response = client.get("/currencies/2025-01", params={"fetch_missing": True})
+    assert len(response.json()) == len(business_days(date(2025, 1, 1), date(2025, 1, 31))) * len(stub.currencies)
+    assert stub.requests == ["/api/exchangerates/tables/a/2025-01-14/2025-01-31"]
+
+    stub.requests.clear()
+    assert client.get("/currencies/2025-01", params={"fetch_missing": True}).status_code == 200
+    assert stub.requests == []
+
+
+def test_fetch_missing_remembers_empty_periods(stub, client):
+    assert client.get("/currencies/2025-01-01", params={"code": "XYZ", "fetch_missing": True}).status_code == 404
+    assert client.get("/currencies/2025-01-01", params={"code": "XYZ", "fetch_missing": True}).status_code == 404
+    assert stub.requests == ["/api/exchangerates/rates/a/XYZ/2025-01-01/2025-01-01"]
+
+
+def test_fetch_missing_coalesces_concurrent_requests(stub, nbp):
+    stub.latency = 0.2
+
+    async def concurrent_fills():
+        try:
+            async with AsyncSessionLocal() as first, AsyncSessionLocal() as second:
+                return await asyncio.gather(
+                    fill_service.fill_missing_rates(first, nbp, date(2025, 1, 20), date(2025, 1, 22)),
+                    fill_service.fill_missing_rates(second, nbp, date(2025, 1, 20), date(2025, 1, 22)),
+                )
+        finally:
+            await async_engine.dispose()
+            Base.metadata.drop_all(bind=engine)
+            Base.metadata.create_all(bind=engine)
+
+    assert asyncio.run(concurrent_fills()) == [3 * len(stub.currencies)] * 2
+    assert stub.requests == ["/api/exchangerates/tables/a/2025-01-20/2025-01-22"]
+
+
+def test_get_coalesces_and_caches_historical_windows(stub, nbp):
+    stub.latency = 0.1
+    path = "/exchangerates/tables/a/2025-01-13/2025-01-17"
+
+    async def get_repeatedly():
+        first = await nbp.get_many([path, path, path])
+        return first + [await nbp.get(path)]
+
+    responses = asyncio.run(get_repeatedly())
+    assert {response.content for response in responses} == {responses[0].content}
+    assert stub.requests == [f"/api{path}"]
+    assert nbp.stats()["requests"]["coalesced"] == 2
+
+
+def test_get_persists_historical_windows(stub, tmp_path):
+    stub.requests.clear()
+    path = "/exchangerates/rates/a/USD/2025-01-13/2025-01-17"
+    first = asyncio.run(NBPClient(base_url=stub.url, cache_dir=str(tmp_path)).get(path))
+    restarted = asyncio.run(NBPClient(base_url=stub.url, cache_dir=str(tmp_path)).get(path))
+    assert restarted.json() == first.json()
+    assert stub.requests == [f"/api{path}"]
+
+
+def test_get_last_expires_after_ttl(stub):
+    stub.requests.clear()
+
+    async def get_last_twice(nbp):
+        return [(await nbp.get("/exchangerates/tables/a/last")).status_code for _ in range(2)]
+
+    assert asyncio.run(get_last_twice(NBPClient(base_url=stub.url, cache_ttl=60))) == [200, 200]
+    assert len(stub.requests) == 1
+    assert asyncio.run(get_last_twice(NBPClient(base_url=stub.url, cache_ttl=0))) == [200, 200]
+    assert len(stub.requests) == 3
+
+
+def test_get_does_not_cache_failures(stub, nbp):
+    stub.fail_next = nbp.retries + 1
+    path = "/exchangerates/tables/a/2025-01-13/2025-01-17"
+
+    async def get_twice():
+        return [(await nbp.get(path)).status_code for _ in range(2)]
+
+    assert asyncio.run(get_twice()) == [503, 200]
+
+
+def test_fetch_default_date_uses_last_response(stub, client):
+    assert client.post("/currencies/fetch/tables").status_code == 200
+    assert client.post("/currencies/fetch/rates", params={"code": "USD"}).status_code == 400  # Already stored
+    assert stub.requests == ["/api/exchangerates/tables/a/last", "/api/exchangerates/rates/a/USD/last"]
@@ -1,10 +1,11 @@
+import json
 from datetime import date, timedelta
 
 import pytest
 from fastapi.testclient import TestClient
 
+from helpers.ingest import copy_rates
 from main import app
-from models import Rate
 from services.db_service import get_db, Base, engine
 
 
@@ -40,10 +41,10 @@ def db():
 def mock_rates(db):
     """Add mock rates to the test database."""
     rates = [
-        Rate(update_date=date(2025, 1, 23), currency="dolar amerykański", code="USD", mid=4.0124),
-        Rate(update_date=date(2025, 1, 23), currency="euro", code="EUR", mid=4.21),
+        (date(2025, 1, 23), "dolar amerykański", "USD", 4.0124),
+        (date(2025, 1, 23), "euro", "EUR", 4.21),
     ]
-    db.add_all(rates)
+    copy_rates(db, rates)
     db.commit()
     return rates
 
@@ -92,8 +93,7 @@ def mock_rates_for_fetch(db):
     ]
     request_date = data[0].get("update_date")
     rates = data[0].get("rates")
-    for rate in rates:
-        db.add(Rate(update_date=request_date, currency=rate, code="AAA", mid=1.000))
+    copy_rates(db, [(request_date, rate, "AAA", 1.000) for rate in rates])
     db.commit()
 
 
@@ -115,12 +115,38 @@ def empty_valid_urls_for_get_rates():
 client = TestClient(app)
 
 
+@pytest.fixture(scope="module", autouse=True)
+def client_lifespan():
+    """Run all requests of the module inside one app lifespan, so pooled connections share an event loop."""
+    with client:
+        yield
+
+
 def test_get_currencies(mock_rates):
     response = client.get("/currencies/")
     assert response.status_code == 200
     assert len(response.json()) > 0
 
 
+def test_get_currencies_etag(mock_rates, db):
+    response = client.get("/currencies/")
+    etag = response.headers["ETag"]
+    assert [currency["code"] for currency in response.json()] == ["USD", "EUR"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get("/currencies/", headers={"If-None-Match": header})
+        assert response.status_code == 304
+    for header in (etag[:-5] + '"', f'"{etag}"', f'"x{etag[1:]}'):  # Only whole tags match
+        assert client.get("/currencies/", headers={"If-None-Match": header}).status_code == 200
+
+    copy_rates(db, [(date(2025, 1, 23), "frank szwajcarski", "CHF", 4.4801)])
+    db.commit()
+    response = client.get("/currencies/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()) == 3
+
+
 def test_get_currencies_empty_db():
     response = client.get("/currencies/")
     assert response.status_code == 404
@@ -141,6 +167,99 @@ def test_get_rates_code(mock_rates, valid_urls_for_get_rates):
             assert len(response.json()) > 0
 
 
+def test_get_rates_columnar(mock_rates):
+    response = client.get("/currencies/2025-01", params={"format": "columnar"})
+    assert response.status_code == 200
+    assert response.json() == {"dates": ["2025-01-23", "2025-01-23"], "codes": ["EUR", "USD"], "mid": [4.21, 4.0124]}
+
+
+def get_pages(url: str, **params) -> list[list[dict]]:
+    pages = []
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            return pages
+        assert response.headers["Link"].endswith('rel="next"')
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+
+def test_get_rates_pages(mock_rates, db):
+    copy_rates(db, [(date(2025, 1, day), "dolar amerykański", "USD", 4.0 + day / 100) for day in range(2, 23)])
+    db.commit()
+
+    # Pages from the database, then from the cache of the full period, concatenate to the full response
+    uncached = get_pages("/currencies/2025-01", limit=4)
+    rates = client.get("/currencies/2025-01").json()
+    assert [rate for page in uncached for rate in page] == rates
+    assert get_pages("/currencies/2025-01", limit=4) == uncached
+    assert [len(page) for page in uncached] == [4, 4, 4, 4, 4, 3]
+    assert [rate for page in get_pages("/currencies/2025-01", code="eur", limit=1) for rate in page] == [rates[-2]]
+
+    assert get_pages("/currencies/2025-01", limit=23) == [rates]
+    response = client.get("/currencies/2025-02", params={"limit": 10})
+    assert response.status_code == 404
+    response = client.get("/currencies/2025-01", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+    assert client.get("/currencies/2025-01", params={"limit": 4, "aggregate": "month"}).status_code == 400
+
+
+def test_get_rates_fields(mock_rates):
+    response = client.get("/currencies/2025-01-23", params={"fields": "code, mid"})
+    assert response.json() == [{"code": "EUR", "mid": 4.21}, {"code": "USD", "mid": 4.0124}]
+    response = client.get("/currencies/2025-01", params={"fields": "mid,currency", "format": "columnar"})
+    assert response.json() == {"mid": [4.21, 4.0124], "currencies": ["euro", "dolar amerykański"]}
+    response = client.get("/currencies/2025-01", params={"fields": "code,rate"})
+    assert response.status_code == 400
+
+
+def test_get_rates_batch(mock_rates, db):
+    copy_rates(db, [(date(2024, 11, 5), "dolar amerykański", "USD", 4.0312), (date(2024, 11, 5), "euro", "EUR", 4.38)])
+    db.commit()
+    params = {"code": ["usd", "EUR"], "period": ["2025-Q1", "2024-11-05", "2024"]}
+    response = client.get("/currencies/batch", params=params)
+    assert response.status_code == 200
+    groups = response.json()
+    assert [(group["period"], group["code"]) for group in groups] == [
+        ("2025-Q1", "USD"), ("2025-Q1", "EUR"), ("2024-11-05", "USD"), ("2024-11-05", "EUR"), ("2024", "USD"),
+        ("2024", "EUR"),
+    ]
+    assert (groups[0]["date_from"], groups[0]["date_to"]) == ("2025-01-01", "2025-03-31")
+    assert groups[0]["rates"] == [{"update_date": "2025-01-23", "currency": "dolar amerykański", "code": "USD",
+                                   "mid": 4.0124}]
+    assert [rate["mid"] for group in groups[2:] for rate in group["rates"]] == [4.0312, 4.38, 4.0312, 4.38]
+
+    response = client.get("/currencies/batch", params={**params, "code": ["EUR", "CHF"], "format": "columnar"})
+    assert response.json()[0]["rates"] == {"dates": ["2025-01-23"], "codes": ["EUR"], "mid": [4.21]}
+    assert response.json()[1]["rates"] == {"dates": [], "codes": [], "mid": []}
+
+
+def test_get_rates_batch_errors(mock_rates):
+    response = client.get("/currencies/batch", params={"code": "USD", "period": ["2025", "2025-010-22"]})
+    assert response.status_code == 400
+    response = client.get("/currencies/batch", params={"code": "USD", "period": [f"{date.today().year + 1}"]})
+    assert response.json()["detail"] == "Date cannot be in the future."
+    response = client.get("/currencies/batch", params={"code": [f"C{index:02d}" for index in range(11)],
+                                                       "period": [f"2025-{month:02d}" for month in range(1, 11)]})
+    assert response.status_code == 400
+    response = client.get("/currencies/batch", params={"code": "USD", "period": "2024"})
+    assert response.status_code == 404
+    assert client.get("/currencies/batch", params={"code": "USD"}).status_code == 422
+
+
+def test_export_rates(mock_rates):
+    params = {"date_from": "2025-01-01", "date_to": "2025-01-31"}
+    response = client.get("/export/rates", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["code"] for line in lines] == ["EUR", "USD"]
+
+    response = client.get("/export/rates", params={**params, "format": "csv", "code": ["usd"]})
+    assert response.text.splitlines() == ["update_date,currency,code,mid", "2025-01-23,dolar amerykański,USD,4.0124"]
+
+
 def test_get_rates_empty_db(empty_valid_urls_for_get_rates):
     for url in empty_valid_urls_for_get_rates:
         response = client.get(url)
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import date, datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from helpers.ingest import copy_rates
+from main import app
+from services.db_service import Base, SessionLocal, async_engine, engine
+from services.nbp_service import NBPClient
+from services.scheduler_service import IngestScheduler, SCHEDULER_TIMEZONE, next_run_at
+from tests.nbp_stub import business_days, synthetic_mid
+
+
+@pytest.fixture
+def scheduler(stub):
+    stub.requests.clear()
+    yield IngestScheduler(NBPClient(base_url=stub.url, retries=0, cache_ttl=0))  # Polls are minutes apart
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def run(coroutine):
+    async def run_and_dispose():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(run_and_dispose())
+
+
+def warsaw(*args) -> datetime:
+    return datetime(*args, tzinfo=SCHEDULER_TIMEZONE)
+
+
+@pytest.mark.parametrize("now, latest_date, expected", [
+    (warsaw(2025, 1, 22, 9, 0), date(2025, 1, 21), warsaw(2025, 1, 22, 12, 15)),  # Before publication
+    (warsaw(2025, 1, 22, 12, 15), date(2025, 1, 21), warsaw(2025, 1, 22, 12, 25)),  # Table is late, retry
+    (warsaw(2025, 1, 22, 15, 55), date(2025, 1, 21), warsaw(2025, 1, 22, 16, 0)),  # Last retry of the day
+    (warsaw(2025, 1, 22, 12, 20), date(2025, 1, 22), warsaw(2025, 1, 23, 12, 15)),  # Up to date
+    (warsaw(2025, 1, 24, 12, 20), date(2025, 1, 24), warsaw(2025, 1, 27, 12, 15)),  # Friday, skip the weekend
+    (warsaw(2025, 1, 25, 10, 0), date(2025, 1, 24), warsaw(2025, 1, 27, 12, 15)),  # Saturday
+])
+def test_next_run_at(now, latest_date, expected):
+    assert next_run_at(now, latest_date) == expected
+
+
+def test_ingest_latest_table_into_empty_database(stub, scheduler):
+    assert run(scheduler.ingest_missing()) == stub.last_date
+    assert stub.requests == ["/api/exchangerates/tables/a/last"]
+
+    stats = scheduler.stats()
+    assert (stats["status"], stats["latest_date"]) == ("ok", stub.last_date)
+    assert stats["rows_inserted"] == len(stub.currencies)
+    assert stats["last_run_seconds"] > 0
+
+
+def test_ingest_only_missing_dates(stub, scheduler):
+    with SessionLocal() as db:
+        copy_rates(db, [(day, "dolar amerykański", "USD", synthetic_mid(day, "USD"))
+                        for day in business_days(date(2025, 1, 2), date(2025, 1, 15))])
+        db.commit()
+
+    async def ingest_twice():
+        await scheduler.ingest_missing()
+        first = list(stub.requests), scheduler.stats()["rows_inserted"]
+        stub.requests.clear()
+        await scheduler.ingest_missing()
+        return first, (list(stub.requests), scheduler.stats()["rows_inserted"])
+
+    first, second = run(ingest_twice())
+    assert first == (
+        ["/api/exchangerates/tables/a/last", "/api/exchangerates/tables/a/2025-01-16/2025-01-21"],
+        len(business_days(date(2025, 1, 16), date(2025, 1, 22))) * len(stub.currencies),
+    )
+    assert second == (["/api/exchangerates/tables/a/last"], 0)  # Nothing missing, nothing fetched besides /last
+    assert scheduler.stats()["runs"] == 2
+
+
+def test_ingest_table_of_a_date_with_single_code_stored(stub, scheduler):
+    with SessionLocal() as db:  # E.g. POST /currencies/fetch/rates?code=USD ran before the poll
+        copy_rates(db, [(stub.last_date, "dolar amerykański", "USD", synthetic_mid(stub.last_date, "USD"))])
+        db.commit()
+
+    run(scheduler.ingest_missing())
+    assert stub.requests == ["/api/exchangerates/tables/a/last"]
+    assert (scheduler.stats()["rows_inserted"], scheduler.stats()["rows_skipped"]) == (len(stub.currencies) - 1, 1)
+
+
+def test_single_leader_across_workers(scheduler):
+    follower = IngestScheduler(scheduler.nbp)
+
+    async def elect():
+        leader_elected = await scheduler.acquire_leadership()
+        follower_elected = await follower.acquire_leadership()
+        leader_kept = await scheduler.acquire_leadership()
+        await scheduler.release_leadership()
+        follower_after_release = await follower.acquire_leadership()
+        await follower.release_leadership()
+        return leader_elected, follower_elected, leader_kept, follower_after_release
+
+    assert run(elect()) == (True, False, True, True)
+
+
+def test_scheduler_stats_endpoint(scheduler):
+    with TestClient(app) as client:
+        response = client.get("/stats/scheduler")
+    assert response.status_code == 200
+    assert set(response.json()["scheduler"]) >= {"leader", "last_run_seconds", "rows_inserted", "next_run_at"}
@@ -0,0 +1,46 @@
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from sqlalchemy import inspect
+
+from main import create_app
+from migrate import migrate
+from services.db_service import Base, engine
+from tests.servers import free_port
+
+
+def test_create_app_leaves_schema_to_migrate():
+    Base.metadata.drop_all(bind=engine)
+    try:
+        create_app()
+        assert not inspect(engine).has_table("rates")
+        with ThreadPoolExecutor(3) as executor:  # Concurrent deployments wait for each other
+            list(executor.map(lambda _: migrate(), range(3)))
+        assert set(Base.metadata.tables) <= set(inspect(engine).get_table_names())
+    finally:
+        migrate()
+
+
+def test_serve_workers():
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "serve", "--port", str(port), "--workers", "2",
+                               "--log-level", "warning"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/stats/cache")
+                break
+            except httpx.TransportError:
+                assert server.poll() is None and time.monotonic() < deadline
+                time.sleep(0.1)
+        assert response.status_code == 200
+        assert 'http_request_duration_seconds_count{method="GET",route="/stats/cache"' in httpx.get(
+            f"http://127.0.0.1:{port}/metrics").text
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
@@ -0,0 +1,84 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from helpers.snapshot import build_snapshot, merge_snapshots, rate_snapshot
+
+ROWS = [
+    (date(2025, 1, 2), "dolar amerykański", "USD", 4.1),
+    (date(2025, 1, 2), "euro", "EUR", 4.3),
+    (date(2025, 1, 3), "euro", "EUR", 4.31),
+    (date(2025, 1, 6), "dolar amerykański", "USD", 4.12),
+]
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    rate_snapshot.directory = str(tmp_path)
+    yield tmp_path
+    rate_snapshot.directory = ""
+    rate_snapshot._snapshot = rate_snapshot._version = None
+
+
+@pytest.fixture
+def client(snapshot_dir, client):
+    return client  # Started once the snapshot directory is set
+
+
+def test_build_and_slice_snapshot():
+    snapshot = build_snapshot(ROWS)
+    assert snapshot.codes.tolist() == ["EUR", "USD"]
+    assert snapshot.currencies.tolist() == ["euro", "dolar amerykański"]
+    assert snapshot.mids.shape == (3, 2)
+
+    usd = snapshot.slice(date(2025, 1, 3), date(2025, 1, 6), ["USD"])
+    assert np.shares_memory(usd.mids, snapshot.mids)  # Date range and single code are views
+    assert usd.to_rows() == [("2025-01-06", "dolar amerykański", "USD", 4.12)]
+    assert snapshot.to_rows() == [(day.isoformat(), *rest) for day, *rest in sorted(ROWS, key=lambda row: row[::2])]
+    assert snapshot.slice(date(2025, 1, 4), date(2025, 1, 5)).to_rows() == []
+
+
+def test_merge_snapshots():
+    current = build_snapshot(ROWS[:2])
+    merged = merge_snapshots(current, build_snapshot(ROWS[2:] + [(date(2025, 1, 3), "frank szwajcarski", "CHF", 4.5)]))
+    assert merged.codes.tolist() == ["CHF", "EUR", "USD"]
+    assert len(merged.to_rows()) == len(ROWS) + 1
+    assert merged.slice(date(2025, 1, 2), date(2025, 1, 2)).to_rows() == build_snapshot(ROWS[:2]).to_rows()
+
+
+def test_snapshot_follows_ingestion(stub, client):
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-13", "date_to": "2025-01-17"})
+    first_version = client.get("/stats/snapshot").json()["snapshot"]
+    assert (first_version["dates"], first_version["codes"]) == (5, len(stub.currencies))
+
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-02", "date_to": "2025-01-03"})
+    stats = client.get("/stats/snapshot").json()["snapshot"]
+    assert int(stats["version"]) == int(first_version["version"]) + 1
+    assert (stats["dates"], stats["date_from"], stats["date_to"]) == (7, "2025-01-02", "2025-01-17")
+    assert isinstance(rate_snapshot.load().mids, np.memmap)
+
+    for params in ({}, {"code": "USD"}, {"format": "columnar"}):
+        from_db = client.get("/currencies/2025-01", params=params)
+        from_snapshot = client.get("/currencies/2025-01", params={**params, "source": "snapshot"})
+        assert from_snapshot.status_code == 200
+        assert from_snapshot.json() == from_db.json()
+
+    assert client.get("/currencies/2024-12", params={"source": "snapshot"}).status_code == 404
+
+
+def test_analytics_from_snapshot(client):
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-02", "date_to": "2025-01-17"})
+    params = {"date_from": "2025-01-01", "date_to": "2025-01-31", "code": ["USD", "EUR"]}
+    from_snapshot = client.get("/analytics/summary", params=params).json()
+
+    rate_snapshot.directory = ""
+    assert client.get("/analytics/summary", params=params).json() == from_snapshot
+
+
+def test_snapshot_disabled(stub, client):
+    rate_snapshot.directory = ""
+    client.post("/currencies/fetch/tables", params={"date_from": "2025-01-13", "date_to": "2025-01-17"})
+    response = client.get("/currencies/2025-01", params={"source": "snapshot"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "The rate snapshot is not available."
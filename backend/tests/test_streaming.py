@@ -0,0 +1,129 @@
+import asyncio
+import json
+import tracemalloc
+from datetime import date, timedelta
+
+import pytest
+
+from helpers import services
+from helpers.streaming import RateRecordParser, merge_streams
+from services.nbp_service import NBPClient
+
+
+def parse_in_chunks(body: bytes, code: str | None = None, chunk_size: int = 7) -> list[services.RateRecord]:
+    parser = RateRecordParser(code)
+    records = []
+    for start in range(0, len(body), chunk_size):
+        records.extend(parser.feed(body[start:start + chunk_size]))
+    return records + parser.close()
+
+
+def test_parser_matches_full_parse(stub):
+    tables = json.dumps(stub.tables(date(2025, 1, 13), date(2025, 1, 17)), ensure_ascii=False).encode()
+    expected = [(date.fromisoformat(table["effectiveDate"]), rate["currency"], rate["code"], rate["mid"])
+                for table in json.loads(tables) for rate in table["rates"]]
+    assert parse_in_chunks(tables) == expected
+
+    usd = json.dumps(stub.code_rates("USD", date(2025, 1, 13), date(2025, 1, 17)), ensure_ascii=False).encode()
+    assert parse_in_chunks(usd, "USD") == [
+        (date.fromisoformat(rate["effectiveDate"]), "dolar amerykański", "USD", rate["mid"])
+        for rate in json.loads(usd)["rates"]
+    ]
+
+
+def test_parser_memory_is_bounded_by_chunks(stub):
+    tables = stub.tables(date(2024, 1, 1), date(2024, 12, 31))
+    rates = [rate for table in tables for rate in table["rates"]]
+
+    def chunks():  # The body is generated table by table, the stub runs in-process and would be traced too
+        yield b"["
+        for index in range(20):  # ~20 years of ~33 currencies, about 12 MB
+            for position, table in enumerate(tables):
+                separator = b"," if index or position else b""
+                yield separator + json.dumps({**table, "rates": rates[:33]}, ensure_ascii=False).encode()
+        yield b"]"
+
+    body_size = sum(len(chunk) for chunk in chunks())
+    parser = RateRecordParser()
+    count = 0
+    tracemalloc.start()
+    for chunk in chunks():
+        count += len(parser.feed(chunk))
+    count += len(parser.close())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert count == 20 * len(tables) * 33
+    assert peak < body_size / 20
+
+
+def test_stream_errors_and_persisted_cache(stub, tmp_path):
+    stub.requests.clear()
+
+    async def stream(path: str) -> list:
+        nbp = NBPClient(base_url=stub.url, cache_dir=str(tmp_path))
+        try:
+            return [record async for record in nbp.stream_records(path)]
+        finally:
+            await nbp.aclose()
+
+    path = "/exchangerates/tables/a/2025-01-13/2025-01-14"
+    assert asyncio.run(stream(path)) == asyncio.run(stream(path))  # Second run reads the persisted response
+    assert stub.requests == [f"/api{path}"]
+
+    with pytest.raises(Exception) as error:
+        asyncio.run(stream("/exchangerates/tables/a/2025-01-18/2025-01-19"))
+    assert error.value.status_code == 404
+
+
+@pytest.mark.parametrize("cache_dir", [None, "persisted"])
+def test_concurrent_identical_streams_fetch_once(stub, tmp_path, cache_dir):
+    stub.requests.clear()
+    stub.latency = 0.2
+    today = date.today()
+    paths = ["/exchangerates/tables/a/2025-01-13/2025-01-17",
+             f"/exchangerates/tables/a/{today - timedelta(days=7)}/{today}"]  # Coalesced and cached by get()
+
+    async def stream_concurrently(path: str) -> list:
+        nbp = NBPClient(base_url=stub.url, cache_dir=cache_dir and str(tmp_path))
+
+        async def stream() -> list:
+            return [record async for record in nbp.stream_records(path)]
+
+        try:
+            return [*await asyncio.gather(*(stream() for _ in range(5))), await stream()]  # The last reads the cache
+        finally:
+            await nbp.aclose()
+
+    try:
+        for path in paths:
+            streams = asyncio.run(stream_concurrently(path))
+            assert all(records == streams[0] for records in streams) and streams[0]
+    finally:
+        stub.latency = 0.0
+    assert stub.requests == [f"/api{path}" for path in paths]
+
+
+def test_merge_streams_propagates_errors():
+    async def records(count: int, fail: bool = False):
+        for index in range(count):
+            yield index
+            await asyncio.sleep(0)
+        if fail:
+            raise ValueError("stream failed")
+
+    async def collect(*streams):
+        return sorted([record async for record in merge_streams(list(streams))])
+
+    assert asyncio.run(collect(records(3), records(2))) == [0, 0, 1, 1, 2]
+    with pytest.raises(ValueError):
+        asyncio.run(collect(records(3), records(2, fail=True)))
+
+
+def test_fetch_skips_stored_keys_while_streaming(stub, client):
+    client.post("/currencies/fetch/rates", params={"code": "USD", "date_from": "2025-01-13", "date_to": "2025-01-15"})
+    response = client.post("/currencies/fetch/tables", params={"date_from": "2025-01-13", "date_to": "2025-01-17"})
+    assert response.status_code == 200
+    assert (response.json()["inserted"], response.json()["skipped"]) == (5 * len(stub.currencies) - 3, 3)
+
+    response = client.post("/currencies/fetch/tables", params={"date_from": "2025-01-18", "date_to": "2025-01-19"})
+    assert response.status_code == 404  # No table published on a weekend, as before
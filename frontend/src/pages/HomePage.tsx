@@ -1,10 +1,19 @@
-import {useEffect, useState} from 'react';
+import {useEffect, useRef, useState} from 'react';
 import axios from 'axios';
 import DateSelector from '../components/DateSelector';
 import CurrencySelector from '../components/CurrencySelector';
 import RatesTable from '../components/RatesTable';
 import CurrencyChart from '../components/CurrencyChart';
-import {endOfMonth, endOfQuarter, endOfYear, format, parseISO} from 'date-fns';
+import {
+    endOfMonth,
+    endOfQuarter,
+    endOfYear,
+    format,
+    parseISO,
+    startOfMonth,
+    startOfQuarter,
+    startOfYear
+} from 'date-fns';
 
 
 interface Rate {
@@ -19,6 +28,32 @@ interface Currency {
     code: string;
 }
 
+// Delta of rates committed by the backend, rows in columns unless there were too many
+interface RatesDelta {
+    date_from: string;
+    date_to: string;
+    codes: string[];
+    inserted: number;
+    rates: { dates: string[]; currencies: string[]; codes: string[]; mid: number[] } | null;
+}
+
+interface ShownPeriod {
+    requestDate: string;
+    dateFrom: string;
+    dateTo: string;
+    code: string;
+}
+
+const sortRates = (rates: Rate[]) => rates.sort((a: Rate, b: Rate) =>
+    new Date(b.update_date).getTime() - new Date(a.update_date).getTime()
+);
+
+const mergeRates = (current: Rate[], incoming: Rate[]) => {
+    const merged = new Map(current.map(rate => [`${rate.update_date}|${rate.code}`, rate]));
+    incoming.forEach(rate => merged.set(`${rate.update_date}|${rate.code}`, rate));
+    return sortRates(Array.from(merged.values()));
+};
+
 const today = new Date();
 const HomePage = () => {
     const [dateValue, setDateValue] = useState(format(new Date(), 'yyyy-MM-dd'));
@@ -32,6 +67,7 @@ const HomePage = () => {
     const [hasInitialized, setHasInitialized] = useState(false);
     const [showRates, setShowRates] = useState(false);
     const [showChart, setShowChart] = useState(false);
+    const shownPeriod = useRef<ShownPeriod | null>(null);
 
     useEffect(() => {
         const checkBackend = async () => {
@@ -51,6 +87,66 @@ const HomePage = () => {
         checkBackend();
     }, []);
 
+    // New rates are pushed by the backend, so shown rates stay current without polling
+    useEffect(() => {
+        const events = new EventSource('/currencies/events');
+        let connected = false;
+        events.addEventListener('open', () => {
+            if (connected) {
+                reloadShownRates();  // Deltas may have been missed while reconnecting
+            }
+            connected = true;
+        });
+        events.addEventListener('rates', (event) => applyDelta(JSON.parse((event as MessageEvent).data)));
+        events.addEventListener('resync', () => reloadShownRates());
+        return () => events.close();
+    }, []);
+
+    const applyDelta = (delta: RatesDelta) => {
+        if (delta.rates) {
+            const added = delta.rates.codes.map((code, i) => ({code, currency: delta.rates!.currencies[i]}));
+            setCurrencies(current => current.length === 0 ? current : [
+                ...current,
+                ...added.filter((currency, i) =>
+                    !current.some(known => known.code === currency.code) &&
+                    added.findIndex(other => other.code === currency.code) === i
+                ),
+            ]);
+        }
+
+        const shown = shownPeriod.current;
+        if (!shown || delta.date_to < shown.dateFrom || delta.date_from > shown.dateTo ||
+            (shown.code && !delta.codes.includes(shown.code))) {
+            return;
+        }
+        if (!delta.rates) {
+            reloadShownRates();
+            return;
+        }
+        const {dates, currencies: names, codes, mid} = delta.rates;
+        const incoming = dates
+            .map((update_date, i) => ({update_date, currency: names[i], code: codes[i], mid: mid[i]}))
+            .filter(rate => rate.update_date >= shown.dateFrom && rate.update_date <= shown.dateTo &&
+                (!shown.code || rate.code === shown.code));
+        setRates(current => mergeRates(current, incoming));
+        setShowRates(true);
+    };
+
+    const reloadShownRates = async () => {
+        const shown = shownPeriod.current;
+        if (!shown) {
+            return;
+        }
+        try {
+            const response = await axios.get(`/currencies/${shown.requestDate}`, {
+                params: {code: shown.code || undefined}
+            });
+            setRates(sortRates(response.data));
+        } catch (err) {
+            // Kept as shown, the next delta or reconnection tries again
+        }
+    };
+
     const fetchCurrencies = async () => {
         try {
             const response = await axios.get('/currencies/');
@@ -61,6 +157,7 @@ const HomePage = () => {
     };
 
     const handleError = (error: any, defaultMessage: string) => {
+        shownPeriod.current = null;
         setRates([]);
         setShowRates(false);
         setShowChart(false);
@@ -92,17 +189,21 @@ const HomePage = () => {
         try {
             let requestDate = '';
             const date = parseISO(dateValue);
+            let [dateFrom, dateTo] = [date, date];
 
             switch (periodType) {
                 case 'year':
                     requestDate = format(date, 'yyyy');
+                    [dateFrom, dateTo] = [startOfYear(date), endOfYear(date)];
                     break;
                 case 'quarter':
                     const quarter = Math.ceil((date.getMonth() + 1) / 3);
                     requestDate = `${format(date, 'yyyy')}-Q${quarter}`;
+                    [dateFrom, dateTo] = [startOfQuarter(date), endOfQuarter(date)];
                     break;
                 case 'month':
                     requestDate = format(date, 'yyyy-MM');
+                    [dateFrom, dateTo] = [startOfMonth(date), endOfMonth(date)];
                     break;
                 case 'day':
                 default:
@@ -113,10 +214,14 @@ const HomePage = () => {
                 params: {code: selectedCurrency || undefined}
             });
 
-            setRates(response.data.sort((a: Rate, b: Rate) =>
-                new Date(b.update_date).getTime() - new Date(a.update_date).getTime()
-            ));
+            setRates(sortRates(response.data));
             setShowRates(true);
+            shownPeriod.current = {
+                requestDate,
+                dateFrom: format(dateFrom, 'yyyy-MM-dd'),
+                dateTo: format(dateTo, 'yyyy-MM-dd'),
+                code: selectedCurrency,
+            };
             if (selectedCurrency && response.data.length > 0 && periodType !== 'day') {
                 setShowChart(true);
             }